@@ -1,5 +1,4 @@
-from .Confrontation import Confrontation,create_data_header
-from scipy.interpolate import CubicSpline
+from .Confrontation import Confrontation,create_data_header,_fileStamp
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 from .Variable import Variable
@@ -7,38 +6,12 @@ from .Regions import Regions
 from .constants import mid_months,lbl_months,bnd_months
 from . import Post as post
 from . import ilamblib as il
+from .spatial import NearestAxisIndex
+from .sites import QuadraticTrend,PhaseWellDefined,CycleCharacteristics
 from netCDF4 import Dataset
 import pylab as plt
 import numpy as np
-import os
-
-def _phaseWellDefined(t,v):
-    """The phase of a site is considered well defined if:
-
-    * there is at least 2 years of contiguous data in the time series
-    * if the frequency corresponding to the peak in the power spectrum
-    is within the sampling frequency of 1/365.
-
-    """
-    b,e = 0,0
-    for s in np.ma.flatnotmasked_contiguous(v):
-        if (s.stop-s.start) > e-b:
-            b = s.start
-            e = s.stop
-    if (e-b) < 24: return False
-    T  = t     [b:e]
-    V  = v.data[b:e]
-    P  = np.abs(np.fft.fft(V))**2
-    dt = np.diff(T).mean()
-    F  = np.fft.fftfreq(V.size,dt)
-    P  = P[np.where(F>=0)]
-    F  = F[np.where(F>=0)]
-    i  = np.argsort(F)
-    P  = P[i]; F = F[i]
-    dF = np.diff(F).mean()
-    f0 = 1./365
-    f  = F[P.argmax()]
-    return (f > (f0-0.9*dF))*(f < (f0+0.9*dF))
+import hashlib,os
 
 def _meanDay(d):
     """Computes the average Julian day by the angle of the resultant vector.
@@ -65,33 +38,58 @@ def _cycleShape(var,period=365.):
     t     = tbnd.mean(axis=1)
     return cycle,t,tbnd
 
-def _siteCharacteristics(t,v):
-    """Compute the mean amplitude, cycle, and time of maximum and minimum.
-    """
-    with np.errstate(under='ignore'):
-        amp   = (v.max (axis=1)-v.min(axis=1)).mean()
-        cyc   =  v.mean(axis=0)
-        fun   = CubicSpline(np.hstack([t  ,t  [0]+365.]),
-                            np.hstack([cyc,cyc[0]     ]),
-                            bc_type="periodic")
-        troot = fun.derivative().solve()
-        troot = troot[(troot>=0)*(troot<=365.)]
-        tmax  = troot[fun(troot).argmax()]
-        tmin  = troot[fun(troot).argmin()]
-        vs    = fun(np.linspace(0,365,366))
-    return amp,tmax,tmin,vs
-
 def _detrend(var):
     """Detrend the variable by subtracting the best fit quadratic polynomial.
     """
-    for i in range(var.ndata):
-        j = np.where(var.data[:,i].mask==False)
-        t = var.time[j]
-        x = var.data[j,i][0]
-        p = np.polyfit(t,x,2)
-        var.data.data[:,i] -= np.polyval(p,var.time)
+    var.data.data[...] -= QuadraticTrend(var.time,var.data)
     return var
 
+def _emulate(H,flux,Ninf):
+    """Convolves the monthly fluxes of the pulse regions with their impulse responses.
+
+    The response at a site, Ninf months beyond the responses given,
+    is held at its last value. The convolution is carried out on
+    years, for all sites and tracers at once, the part of the response
+    held constant being applied to the cumulative fluxes.
+
+    Parameters
+    ----------
+    H : numpy.ndarray
+        the responses of shape (sites,tracers,12,L), to a pulse
+        emitted in each month of a year, in the months since the
+        beginning of that year
+    flux : numpy.ndarray
+        the monthly fluxes of shape (tracers,12*years)
+    Ninf : int
+        the number of months to extend the response beyond the fluxes
+
+    Returns
+    -------
+    response : numpy.ndarray
+        the response at each site of shape (sites,12*years+Ninf),
+        summed over tracers
+    """
+    ns,nt,nm,L = H.shape
+    Nyrs = int(flux.shape[1]/12)
+    Ntot = 12*Nyrs + Ninf
+    D    = -(-L//12)
+    Q    = -(-Ntot//12)
+
+    # the responses by years of lag and month in the year, held at their last value
+    G = np.empty((ns,nt,nm,12*D))
+    G[...,:L] = H
+    G[...,L:] = H[...,-1:]
+    G = G.reshape((ns,nt,nm,D,12))
+    E = flux[:,:12*Nyrs].reshape((nt,Nyrs,12)).transpose((0,2,1))
+    R = np.zeros((ns,Q,12))
+    for d in range(D):
+        n = min(Nyrs,Q-d)
+        R[:,d:(d+n)] += np.einsum("jmy,sjmp->syp",E[...,:n],G[:,:,:,d])
+    if Q > D:
+        C = np.cumsum(E,axis=2)[...,np.minimum(np.arange(Q-D),Nyrs-1)]
+        R[:,D:] += np.einsum("jmq,sjm->sq",C,H[...,-1])[...,np.newaxis]
+    return R.reshape((ns,-1))[:,:Ntot]
+
 def _computeShift(x,y):
     """Given the timing of two variables, compute a shift score
     """
@@ -189,39 +187,10 @@ class ConfCO2(Confrontation):
         region_int = {}
         for region in self.pulse_regions: region_int[region] = mod.integrateInSpace(region=region).convert("Pg yr-1")
 
-        # Load the operator from the files
-        lat,lon,H = None,None,None
-        for i in range(12):
-            # FIX: move pulses into one file to avoid requiring a naming convention
-            with Dataset(os.path.join(self.pulse_dir,"Pulse%02d.nc" % (i+1))) as dset:
-                if lat is None: lat = dset.variables["lat"][...]
-                if lon is None: lon = dset.variables["lon"][...]
-                if H   is None: H   = np.zeros((22,12,Ninf+12,lat.size,lon.size))
-                for j in range(22):
-                    T = dset.variables['T%d' % (j+1)]
-                    H[j,i,...] = T[spinup:,ilev,...]-T[:spinup,...].mean()
-
-        # Where are our sites?
-        ilat = np.abs(lat[:,np.newaxis]-obs.lat).argmin(axis=0)
-        ilon = np.abs(lon[:,np.newaxis]-obs.lon).argmin(axis=0)
-
-        # Apply the operator
-        Nyrs  = int(mod.time.size/12)
-        Ntot  = 12*Nyrs + Ninf
-        eflux = np.zeros((obs.ndata,22,Ntot))
-        for j in range(20):
-            for s in range(obs.ndata):
-                Htemp = H[j,...,ilat[s],ilon[s]]
-                Htrac = np.zeros((22,Ntot,12*Nyrs))
-                for i in range(Nyrs):
-                    pb = 12*i
-                    pe = 12*(i+1)
-                    re = pe + Ninf
-                    Htrac[j,pb:re,pb:pe] = Htemp.T
-                    Htrac[j,re:  ,pb:pe] = np.tile(Htemp[:,-1],[12*(Nyrs-i-1),1])
-                eflux[s,j,:] = np.dot(Htrac[j,...],region_int["pulse_region_%d" % (j+1)].data)*(-1e-3) # H is [] ?
-
-        eflux = eflux.sum(axis=1).T
+        # Apply the operator, the responses to each pulse region convolved with its flux
+        H     = self.pulseResponses(obs,spinup=spinup,Ninf=Ninf,ilev=ilev)
+        flux  = np.asarray([region_int["pulse_region_%d" % (j+1)].data for j in range(20)])
+        eflux = _emulate(H[:,:20],flux,Ninf).T*(-1e-3) # H is [] ?
         eflux = eflux[Ninf:-Ninf]
         eflux = np.ma.masked_array(eflux,mask=obs.data.mask)
         mod = Variable(name      = "co2",
@@ -234,6 +203,56 @@ class ConfCO2(Confrontation):
                        data      = eflux)
         return mod
 
+    def pulseResponses(self,obs,spinup=12,Ninf=60,ilev=1):
+        """Returns the responses to the atmospheric pulses at the sites of the observations.
+
+        The responses are extracted from the Pulse files at the
+        nearest grid cells to the sites and stored in the output
+        path, from where they are memory mapped by every other model
+        (and run) on the same sites.
+
+        Parameters
+        ----------
+        obs : ILAMB.Variable.Variable
+            the site observations
+        spinup : int, optional
+            the number of months of spinup in the Pulse files
+        Ninf : int, optional
+            the number of months of response after the year of the pulse
+        ilev : int, optional
+            the level of the tracers
+
+        Returns
+        -------
+        H : numpy.ndarray
+            the responses of shape (sites,22,12,Ninf+12), of the 22
+            tracers to a pulse in each month of a year
+        """
+        pulses = [os.path.join(self.pulse_dir,"Pulse%02d.nc" % (i+1)) for i in range(12)]
+        key    = repr((spinup,Ninf,ilev,[_fileStamp(pulse) for pulse in pulses],
+                       np.asarray(obs.lat).tolist(),np.asarray(obs.lon).tolist()))
+        cache  = os.path.join(self.output_path,"%s_pulses_%s.npy" % (self.name,hashlib.sha1(key.encode()).hexdigest()[:16]))
+        if os.path.isfile(cache): return np.load(cache,mmap_mode="r")
+
+        # FIX: move pulses into one file to avoid requiring a naming convention
+        H = None
+        for i,pulse in enumerate(pulses):
+            with Dataset(pulse) as dset:
+                if H is None:
+                    ilat = NearestAxisIndex(dset.variables["lat"][...],obs.lat)
+                    ilon = NearestAxisIndex(dset.variables["lon"][...],obs.lon)
+                    H    = np.zeros((obs.ndata,22,12,Ninf+12))
+                for j in range(22):
+                    T = dset.variables['T%d' % (j+1)]
+                    H[:,j,i,:] = (T[spinup:,ilev,...]-T[:spinup,...].mean())[:,ilat,ilon].T
+        try:
+            tmp = "%s.%d.npy" % (cache[:-4],os.getpid())
+            np.save(tmp,H)
+            os.replace(tmp,cache)
+        except OSError:
+            pass
+        return H
+
     def stageData(self,m):
 
         # Get the observational data
@@ -276,7 +295,7 @@ class ConfCO2(Confrontation):
 
         # Get the right layering, closest to the layer elevation where all aren't masked.
         if mod.layered:
-            ind = (np.abs(obs.depth[:,np.newaxis]-mod.depth)).argmin(axis=1)
+            ind = NearestAxisIndex(mod.depth,obs.depth)
             for i in range(ind.size):
                 while (mod.data[:,ind[i],i].mask.sum() > 0.5*mod.data.shape[0]):
                     ind[i] += 1
@@ -306,7 +325,7 @@ class ConfCO2(Confrontation):
 
            # Get the right layering, closest to the layer elevation where all aren't masked
            if OCNco2Emu.layered:
-              ind = (np.abs(obs.depth[:,np.newaxis]-OCNco2Emu.depth)).argmin(axis=1)
+              ind = NearestAxisIndex(OCNco2Emu.depth,obs.depth)
               for i in range(ind.size):
                   while (OCNco2Emu.data[:,ind[i],i].mask.sum() > 0.5*OCNco2Emu.data.shape[0]):
                       ind[i] += 1
@@ -361,15 +380,9 @@ class ConfCO2(Confrontation):
         # Compute amplitude, min and max phase, and annual cycle as numpy data arrays
         ocyc,ot,otb = _cycleShape(obs)
         mcyc,mt,mtb = _cycleShape(mod)
-        n           = len(self.lbls)
-        obs_amp     = np.zeros(n); obs_maxp = np.zeros(n); obs_minp = np.zeros(n)
-        mod_amp     = np.zeros(n); mod_maxp = np.zeros(n); mod_minp = np.zeros(n)
-        obs_cyc     = np.zeros((366,n)); mod_cyc = np.zeros((366,n));
-        well_define = np.zeros(n)
-        for i,site in enumerate(self.lbls):
-            obs_amp[i],obs_maxp[i],obs_minp[i],obs_cyc[:,i] = _siteCharacteristics(ot,ocyc[...,i])
-            mod_amp[i],mod_maxp[i],mod_minp[i],mod_cyc[:,i] = _siteCharacteristics(mt,mcyc[...,i])
-            well_define[i] = _phaseWellDefined(obs.time,obs.data[:,i])
+        obs_amp,obs_maxp,obs_minp,obs_cyc = CycleCharacteristics(ot,ocyc)
+        mod_amp,mod_maxp,mod_minp,mod_cyc = CycleCharacteristics(mt,mcyc)
+        well_define  = PhaseWellDefined(obs.time,obs.data).astype(float)
         well_define /= well_define.sum()
 
         # Write out ILAMB variables for observed quantities
@@ -495,7 +508,7 @@ class ConfCO2(Confrontation):
                 v.toNetCDF4(results,group="MeanState")
             results.setncattr("complete",1)            
         if not self.master: return
-        with Dataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),mode="w") as results:
+        with il.AtomicDataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),replace=self.benchmark_replace) as results:
             results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5])})
             for v in [obs,ocyc,oiav,ocycf,obs_maxp,obs_minp,obs_amp]:
                 v.toNetCDF4(results,group="MeanState")
@@ -38,7 +38,38 @@ def DiurnalReshape(time,time_bnds,data):
     t     = time[begin:end].reshape(shp).mean(axis=1)
     return cycle,t
 
-def _findSeasonalTiming(t,x):
+def _years(t):
+    """Returns the years (of the standard calendar) of times in days since 1850-1-1."""
+    dates = il.DecodeTimes(t,"days since 1850-1-1","standard")
+    if dates is not None: return dates[0]
+    return np.asarray([d.year for d in cftime.num2date(t,"days since 1850-1-1")],dtype=int)
+
+def _stackCycles(cycles):
+    """Stacks cycles of different lengths, padding them with masked values.
+
+    Parameters
+    ----------
+    cycles: list of tuple
+        the (data,time) of each cycle, data of shape (days,...)
+
+    Returns
+    -------
+    data: numpy.ma.MaskedArray
+        the data of all cycles of shape (cycles,days,...)
+    time: numpy.ndarray
+        the time of all cycles of shape (cycles,days)
+    n: numpy.ndarray
+        the number of days of each cycle
+    """
+    n    = np.asarray([t.size for v,t in cycles],dtype=int)
+    data = np.ma.masked_all((n.size,n.max())+cycles[0][0].shape[1:])
+    time = np.zeros(data.shape[:2])
+    for i,(v,t) in enumerate(cycles):
+        data[i,:n[i]] = v
+        time[i,:n[i]] = t
+    return data,time,n
+
+def _findSeasonalTiming(t,x,n=None):
     """Return the beginning and ending time of the season of x.
 
     The data x is assumed to start out relatively small, pass through
@@ -49,34 +80,60 @@ def _findSeasonalTiming(t,x):
     portion. We pose a problem then that finds the breaks which
     minimizes the residual of these three best fit lines.
 
+    The residuals of the lines fit on either side of every break are
+    computed at once from cumulative sums of the moments of the
+    unmasked data, and many cycles may be handled at once. Masked
+    days are left out of the fits, so when they are present the
+    breaks may differ by a day from fits which include them.
+
     Parameters
     ----------
     time: numpy.ndarray
-        time array
+        time array, of shape (days,) or (cycles,days)
     x: numpy.ndarray
-        a single cycle of data to extract the season from
+        the cycles of data to extract the season from, of the shape of time
+    n: numpy.ndarray, optional
+        the number of days in each cycle, the remaining are padding
 
     Returns
     -------
     tbnds: numpy.ndarray
-        the beginning and ending time in an array of size 2
+        the beginning and ending time of each cycle, of shape (2,) or (cycles,2)
     """
-    def cost(t,y):
-        from scipy.stats import linregress
-        out = linregress(t,y)
-        return np.sqrt((((out.slope*t+out.intercept)-y)**2).sum())
-    y = x.cumsum()
-    b = int(y.size/2-1)
-    e = int(y.size/2+1)
-    I = np.asarray(range(2,b))
-    C = np.zeros(I.shape)
-    for a,i in enumerate(I): C[a] = cost(t[:i],y[:i]) + cost(t[i:e],y[i:e])
-    b = I[C.argmin()]
-    I = np.asarray(range(e,y.size-2))
-    C = np.zeros(I.shape)
-    for a,i in enumerate(I): C[a] = cost(t[b:i],y[b:i]) + cost(t[i:],y[i:])
-    e = I[C.argmin()]
-    return t[[b,e]]
+    shp = np.shape(t)
+    t   = np.atleast_2d(t)
+    x   = np.ma.atleast_2d(np.ma.asarray(x))
+    nc,N = t.shape
+    n   = (np.full(nc,N) if n is None else np.asarray(n,dtype=int))[:,np.newaxis]
+    y   = np.ma.getdata(x.cumsum(axis=1)).astype(float)
+    with np.errstate(divide='ignore',invalid='ignore',under='ignore'):
+
+        # cumulative moments of the unmasked data centered in each cycle
+        valid = (np.arange(N) < n)*(np.ma.getmaskarray(x)==False)
+        k     = np.maximum(valid.sum(axis=1,keepdims=True),1)
+        tc    = np.where(valid,t-(t*valid).sum(axis=1,keepdims=True)/k,0)
+        yc    = np.where(valid,y-(y*valid).sum(axis=1,keepdims=True)/k,0)
+        M     = np.asarray([valid,tc,tc*tc,yc,yc*yc,tc*yc],dtype=np.longdouble).cumsum(axis=2)
+        M     = np.concatenate([np.zeros((6,nc,1),dtype=np.longdouble),M],axis=2)
+        rows  = np.arange(nc)[:,np.newaxis]
+        def cost(p,q):
+            # the norm of the residual of the line fit to the days [p,q),
+            # nan if fewer than two are unmasked as with linregress
+            p,q = np.broadcast_arrays(p,q)
+            k,St,Stt,Sy,Syy,Sty = M[:,rows,q]-M[:,rows,p]
+            Sxy = Sty-St*Sy/k
+            r   = (Syy-Sy*Sy/k) - Sxy*Sxy/(Stt-St*St/k)
+            return np.where(k < 2,np.nan,np.sqrt(np.maximum(r.astype(float),0)))
+
+        i = np.arange(N+1)[np.newaxis,:]
+        b = n//2-1
+        e = n//2+1
+        C = np.where((i>=2)*(i<b),cost(0,i)+cost(i,e),np.inf)
+        b = C.argmin(axis=1)[:,np.newaxis]
+        C = np.where((i>=e)*(i<n-2),cost(b,i)+cost(i,n),np.inf)
+        e = C.argmin(axis=1)[:,np.newaxis]
+    tbnds = np.hstack([np.take_along_axis(t,b,axis=1),np.take_along_axis(t,e,axis=1)])
+    return tbnds[0] if len(shp) == 1 else tbnds
 
 def _findSeasonalCentroid(t,x):
     """Return the centroid of the season in polar and cartesian coordinates.
@@ -86,15 +143,15 @@ def _findSeasonalCentroid(t,x):
     time: numpy.ndarray
         time array but scaled [0,2 pi]
     x: numpy.ndarray
-        a single cycle of data to extract the season from
+        the cycles of data to extract the season from, the days along the last axis
 
     Returns
     -------
     centroid: numpy.ndarray
-        array of size 4, [r,theta,x,y]
+        array of size 4, [r,theta,x,y], each of the shape of a cycle
     """
-    x0 = (x*np.cos(t/365.*2*np.pi)).mean()
-    y0 = (x*np.sin(t/365.*2*np.pi)).mean()
+    x0 = (x*np.cos(t/365.*2*np.pi)).mean(axis=-1)
+    y0 = (x*np.sin(t/365.*2*np.pi)).mean(axis=-1)
     r0 = np.sqrt(x0*x0+y0*y0)
     a0 = np.arctan2(y0,x0)
     return r0,a0,x0,y0
@@ -171,67 +228,71 @@ class ConfDiurnal(Confrontation):
         nobs = int(np.round(1./np.diff(obs.time).mean()))
         nmod = int(np.round(1./np.diff(mod.time).mean()))
         
-        # Analysis on a per year basis
-        Tobs = cftime.num2date(obs.time,"days since 1850-1-1")
-        Tmod = cftime.num2date(mod.time,"days since 1850-1-1")
-        Yobs = np.asarray([t.year for t in Tobs],dtype=int)
-        Ymod = np.asarray([t.year for t in Tmod],dtype=int)
-        Y    = np.unique(Yobs)
-        S1 = []; S2 = []; S3 = []; Lobs = []; Lmod = []
-        Sobs  = {}; Smod  = {}
-        omask = np.zeros(obs.time.size,dtype=int)
-        for y in Y:
-
-            # datum for this year
-            datum = cftime.date2num(cftime.datetime(y,1,1),"days since 1850-1-1")
-            
-            # Reshape the year's worth of data
+        # Analysis on a per year basis, reshaping the years with enough
+        # data into (years,days,steps per day) tensors
+        Yobs  = _years(obs.time)
+        Ymod  = _years(mod.time)
+        Y     = []; Cobs = []; Cmod = []
+        for y in np.unique(Yobs):
             iobs = np.where(y==Yobs)[0]
             imod = np.where(y==Ymod)[0]
             if (iobs.size < 0.9*nobs*365): continue
             if (imod.size < 0.9*nmod*365): continue
-            vobs,tobs = DiurnalReshape(obs.time     [iobs] - datum,
+            datum = il._dayNumber(y,1,1,"standard")-il._dayNumber(1850,1,1,"standard")
+            Y   .append(y)
+            Cobs.append(DiurnalReshape(obs.time     [iobs] - datum,
                                        obs.time_bnds[iobs] - datum,
-                                       obs.data     [iobs,0])
-            vmod,tmod = DiurnalReshape(mod.time     [imod] - datum,
+                                       obs.data     [iobs,0]))
+            Cmod.append(DiurnalReshape(mod.time     [imod] - datum,
                                        mod.time_bnds[imod] - datum,
-                                       mod.data     [imod,0])
+                                       mod.data     [imod,0]))
+        Y     = np.asarray(Y,dtype=int)
+        datum = il._dayNumber(Y,1,1,"standard")-il._dayNumber(1850,1,1,"standard")
+        Sobs  = {}; Smod  = {}
+        if Y.size > 0:
+            vobs,tobs,nobs_days = _stackCycles(Cobs)
+            vmod,tmod,nmod_days = _stackCycles(Cmod)
 
             # Compute the diurnal magnitude
-            vobs = vobs.max(axis=1)-vobs.min(axis=1)
-            vmod = vmod.max(axis=1)-vmod.min(axis=1)
-            Sobs[y] = Variable(name = "season_%d" % y,
-                               unit = obs.unit,
-                               time = tobs,
-                               data = vobs)
-            Smod[y] = Variable(name = "season_%d" % y,
-                               unit = mod.unit,
-                               time = tmod,
-                               data = vmod)
+            vobs = vobs.max(axis=2)-vobs.min(axis=2)
+            vmod = vmod.max(axis=2)-vmod.min(axis=2)
+            for i,y in enumerate(Y):
+                Sobs[y] = Variable(name = "season_%d" % y,
+                                   unit = obs.unit,
+                                   time = tobs[i,:nobs_days[i]],
+                                   data = vobs[i,:nobs_days[i]])
+                Smod[y] = Variable(name = "season_%d" % y,
+                                   unit = mod.unit,
+                                   time = tmod[i,:nmod_days[i]],
+                                   data = vmod[i,:nmod_days[i]])
 
             # Compute metrics
-            To  = _findSeasonalTiming  (tobs,vobs)
-            Ro  = _findSeasonalCentroid(tobs,vobs)
-            Tm  = _findSeasonalTiming  (tmod,vmod)
-            Rm  = _findSeasonalCentroid(tmod,vmod)
-            dTo = To[1]-To[0]       # season length of the observation
-            a   = np.log(0.1) / 0.5 # 50% relative error equals a score of 1/10
-            s1  = np.exp(a* np.abs(To[0]-Tm[0])/dTo)
-            s2  = np.exp(a* np.abs(To[1]-Tm[1])/dTo)
-            s3  = np.linalg.norm(np.asarray([Ro[2]-Rm[2],Ro[3]-Rm[3]])) #  |Ro - Rm|
-            den = np.linalg.norm(np.asarray([      Ro[2],      Ro[3]])) # /|Ro|
-            if den < 1e-12 or np.isnan(den):
-                s3  = 0.
-            else:
-                s3 /= den
-                s3  = np.exp(-s3)
-            S1.append(s1); S2.append(s2); S3.append(s3)
-            Lobs.append(To[1]-To[0])
-            Lmod.append(Tm[1]-Tm[0])
-
-            # mask away the off season
-            obs.data.mask[:,0] += (y == Yobs)*(((obs.time-datum) < To[0]) + ((obs.time-datum) > To[1]))
-            mod.data.mask[:,0] += (y == Ymod)*(((mod.time-datum) < Tm[0]) + ((mod.time-datum) > Tm[1]))
+            To = _findSeasonalTiming  (tobs,vobs,nobs_days)
+            Ro = _findSeasonalCentroid(tobs,vobs)
+            Tm = _findSeasonalTiming  (tmod,vmod,nmod_days)
+            Rm = _findSeasonalCentroid(tmod,vmod)
+        else:
+            To = Tm = np.zeros((0,2))
+            Ro = Rm = [np.zeros(0)]*4
+        Ro  = [np.ma.getdata(r) for r in Ro]
+        Rm  = [np.ma.getdata(r) for r in Rm]
+        dTo = To[:,1]-To[:,0]       # season length of the observation
+        a   = np.log(0.1) / 0.5 # 50% relative error equals a score of 1/10
+        S1  = np.exp(a* np.abs(To[:,0]-Tm[:,0])/dTo)
+        S2  = np.exp(a* np.abs(To[:,1]-Tm[:,1])/dTo)
+        S3  = np.sqrt((Ro[2]-Rm[2])**2+(Ro[3]-Rm[3])**2) #  |Ro - Rm|
+        den = np.sqrt(      Ro[2] **2+      Ro[3] **2)   # /|Ro|
+        with np.errstate(invalid='ignore',divide='ignore',under='ignore'):
+            S3 = np.where((den < 1e-12)+np.isnan(den),0.,np.exp(-S3/den))
+        Lobs = To[:,1]-To[:,0]
+        Lmod = Tm[:,1]-Tm[:,0]
+
+        # mask away the off season
+        for var,Yvar,T in [(obs,Yobs,To),(mod,Ymod,Tm)]:
+            if Y.size == 0: continue
+            k   = np.searchsorted(Y,Yvar).clip(0,Y.size-1)
+            t   = var.time-datum[k]
+            var.data.mask[:,0] += (Y[k] == Yvar)*((t < T[k,0]) + (t > T[k,1]))
 
         # Seasonal Mean Diurnal Cycle
         ot,omean,o10,o90,opeak = _meanDiurnalCycle(obs,nobs)
@@ -292,7 +353,7 @@ class ConfDiurnal(Confrontation):
             for key in Smod.keys(): Smod[key].toNetCDF4(results,group="MeanState")
             results.setncattr("complete",1)
         if not self.master: return
-        with Dataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),mode="w") as results:
+        with il.AtomicDataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),replace=self.benchmark_replace) as results:
             results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5])})
             Variable(name = "Season Length global",
                      unit = "d",
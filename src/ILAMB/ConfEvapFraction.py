@@ -4,10 +4,10 @@ from netCDF4 import Dataset
 from . import ilamblib as il
 import numpy as np
 import os
-from mpi4py import MPI
+from .parallel import GetRank
 
 import logging
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
 def _evapfrac(sh,le,vname,energy_threshold):
     mask = ((le.data<0)+
@@ -129,7 +129,7 @@ class ConfEvapFraction(Confrontation):
 
         mod_file = os.path.join(self.output_path,"%s_%s.nc"        % (self.name,m.name))
         obs_file = os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name,      ))
-        with il.FileContextManager(self.master,mod_file,obs_file) as fcm:
+        with il.FileContextManager(self.master,mod_file,obs_file,replace=self.benchmark_replace) as fcm:
 
             # Encode some names and colors
             fcm.mod_dset.setncatts({"name" :m.name,
@@ -157,7 +157,8 @@ class ConfEvapFraction(Confrontation):
                                           skip_cycle        = skip_cycle,
                                           mass_weighting    = mass_weighting,
                                           ref_timeint       = obs_timeint,
-                                          com_timeint       = mod_timeint)
+                                          com_timeint       = mod_timeint,
+                                          benchmark_key     = self.benchmarkKey())
             else:
                 il.AnalysisMeanStateSites(obs,mod,dataset   = fcm.mod_dset,
                                           regions           = self.regions,
@@ -3,6 +3,7 @@ from .Confrontation import Confrontation
 from .constants import earth_rad,mid_months,lbl_months,bnd_months
 from .Variable import Variable
 from .Regions import Regions
+from .staging import PeekReference,PeekModel,SlabTimes,TimeWindow,Climatology
 from . import ilamblib as il
 from . import Post as post
 from netCDF4 import Dataset
@@ -10,11 +11,10 @@ from copy import deepcopy
 import pylab as plt
 import numpy as np
 import os,glob,re
-from sympy import sympify
 
-from mpi4py import MPI
+from .parallel import GetRank
 import logging
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
 def VariableReduce(var,region="global",time=None,depth=None,lat=None,lon=None):
     ILAMBregions = Regions()
@@ -144,70 +144,20 @@ class ConfIOMB(Confrontation):
         mem_slab = self.keywords.get("mem_slab",100000.) # Mb
 
         # peak at the reference dataset without reading much into memory
-        info = ""
-        unit = ""
-        with Dataset(self.source) as dset:
-            var = dset.variables[self.variable]
-            obs_t,obs_tb,obs_cb,obs_b,obs_e,cal = il.GetTime(var)
-            obs_nt = obs_t.size
-            obs_mem = var.size*8e-6
-            unit = var.units
-            climatology = False if obs_cb is None else True
-            if climatology:
-                info += "[climatology]"
-                obs_cb = (obs_cb-1850)*365.
-                t0 = obs_cb[0]; tf = obs_cb[1]
-            else:
-                t0 = obs_tb[0,0]; tf = obs_tb[-1,1]
-            info += " contents span years %.1f to %.1f, est memory %d [Mb]" % (t0/365.+1850,tf/365.+1850,obs_mem)
+        t0,tf,obs_nt,obs_mem,unit,climatology = PeekReference(self.source,self.variable)
+        info = "[climatology]" if climatology else ""
+        info += " contents span years %.1f to %.1f, est memory %d [Mb]" % (t0/365.+1850,tf/365.+1850,obs_mem)
         logger.info("[%s][%s]%s" % (self.name,self.variable,info))
 
-        # to peak at the model, we need any variable that could be
-        # part of the expression to look at the time
-        info = ""
-        possible = [self.variable,] + self.alternate_vars
-        if self.derived is not None: possible += [str(s) for s in sympify(self.derived).free_symbols]
-        vname = [v for v in possible if v in m.variables.keys()]
-        if len(vname) == 0:
-            logger.debug("[%s] Could not find [%s] in the model results" % (self.name,",".join(possible)))
-            raise il.VarNotInModel()
-        vname = vname[0]
-
         # peak at the model dataset without reading much into memory
-        mod_nt  =  0
-        mod_mem =  0.
-        mod_t0  =  2147483647
-        mod_tf  = -2147483648
-        for fname in m.variables[vname]:
-            with Dataset(fname) as dset:
-                var = dset.variables[vname]
-                mod_t,mod_tb,mod_cb,mod_b,mod_e,cal = il.GetTime(var,t0=t0-m.shift,tf=tf-m.shift)
-                if mod_t is None:
-                    info += "\n      %s does not overlap the reference" % (fname)
-                    continue
-                mod_t += m.shift
-                mod_tb += m.shift
-                ind = np.where((mod_tb[:,0] >= t0)*(mod_tb[:,1] <= tf))[0]
-                if ind.size == 0:
-                    info += "\n      %s does not overlap the reference" % (fname)
-                    continue
-                mod_t  = mod_t [ind]
-                mod_tb = mod_tb[ind]
-                mod_t0 = min(mod_t0,mod_tb[ 0,0])
-                mod_tf = max(mod_tf,mod_tb[-1,1])
-                nt = mod_t.size
-                mod_nt += nt
-                mem = (var.size/var.shape[0]*nt)*8e-6
-                mod_mem += mem
-                info += "\n      %s spans years %.1f to %.1f, est memory in time bounds %d [Mb]" % (fname,mod_t.min()/365.+1850,mod_t.max()/365.+1850,mem)
-        info += "\n      total est memory = %d [Mb]" % mod_mem
-        logger.info("[%s][%s][%s] reading model data from possibly many files%s" % (self.name,m.name,vname,info))
-        if mod_t0 > mod_tf:
-            logger.debug("[%s] Could not find [%s] in the model results in the given time frame, tinput = [%.1f,%.1f]" % (self.name,",".join(possible),t0,tf))
-            raise il.VarNotInModel()
+        try:
+            mod_t0,mod_tf,mod_nt,mod_mem,info = PeekModel(m,self.variable,self.alternate_vars,self.derived,t0,tf)
+        except il.VarNotInModel:
+            logger.debug("[%s] Could not find [%s] in the model results in the given time frame, tinput = [%.1f,%.1f]" % (self.name,",".join([self.variable,] + self.alternate_vars),t0,tf))
+            raise
+        logger.info("[%s][%s] reading model data from possibly many files%s" % (self.name,m.name,info))
 
         # if the reference is a climatology, then build a model climatology in slabs
-        info = ""
         if climatology:
 
             # how many slabs
@@ -216,40 +166,18 @@ class ConfIOMB(Confrontation):
             logger.info("[%s][%s] building climatology in %d slabs" % (self.name,m.name,ns))
 
             # across what times?
-            slab_t = (mod_tf-mod_t0)*np.linspace(0,1,ns+1)+mod_t0
-            slab_t = np.floor(slab_t / 365)*365 + bnd_months[(np.abs(bnd_months[:,np.newaxis] - (slab_t % 365))).argmin(axis=0)]
+            slab_t = SlabTimes(mod_t0,mod_tf,ns)
 
             # ready to slab
-            tb_prev = None
-            data    = None
-            dnum    = None
-            for i in range(ns):
-
-                v = m.extractTimeSeries(self.variable,
-                                        alt_vars     = self.alternate_vars,
-                                        expression   = self.derived,
-                                        initial_time = slab_t[i],
-                                        final_time   = slab_t[i+1]).convert(unit)
-
-                # trim does not work properly so we will add a manual check ourselves
-                if tb_prev is None:
-                    tb_prev = v.time_bnds[...]
-                else:
-                    if np.allclose(tb_prev[-1],v.time_bnds[0]):
-                        v.data = v.data[1:]
-                        v.time = v.time[1:]
-                        v.time_bnds = v.time_bnds[1:]
-                    tb_prev = v.time_bnds[...]
+            cycle = Climatology()
+            for i in range(slab_t.size-1):
+                v = TimeWindow(m.extractTimeSeries(self.variable,
+                                                   alt_vars     = self.alternate_vars,
+                                                   expression   = self.derived,
+                                                   initial_time = slab_t[i],
+                                                   final_time   = slab_t[i+1]),slab_t[i],slab_t[i+1])
                 if v.time.size == 0: continue
-
-                mind = (np.abs(mid_months[:,np.newaxis]-(v.time % 365))).argmin(axis=0)
-                if data is None:
-                    data = np.ma.zeros((12,)+v.data.shape[1:])
-                    dnum = np.ma.zeros(data.shape,dtype=int)
-                data[mind,...] += v.data
-                dnum[mind,...] += 1
-            with np.errstate(over='ignore',under='ignore'):
-                data = data / dnum.clip(1)
+                cycle.accumulate(v.time,v.convert(unit).data)
 
             # return variables
             obs = Variable(filename       = self.source,
@@ -257,7 +185,7 @@ class ConfIOMB(Confrontation):
                            alternate_vars = self.alternate_vars)
             mod = Variable(name  = obs.name,
                            unit  = obs.unit,
-                           data  = data,
+                           data  = cycle.mean(),
                            time  = obs.time,
                            lat   = v.lat,
                            lon   = v.lon,
@@ -280,43 +208,20 @@ class ConfIOMB(Confrontation):
             logger.info("[%s][%s] staging data in %d slabs" % (self.name,m.name,ns))
 
             # across what times?
-            slab_t = (mod_tf-mod_t0)*np.linspace(0,1,ns+1)+mod_t0
-            slab_t = np.floor(slab_t / 365)*365 + bnd_months[(np.abs(bnd_months[:,np.newaxis] - (slab_t % 365))).argmin(axis=0)]
-
-            obs_tb = None; mod_tb = None
-            for i in range(ns):
-
-                # get reference variable
-                obs = Variable(filename       = self.source,
-                               variable_name  = self.variable,
-                               alternate_vars = self.alternate_vars,
-                               t0             = slab_t[i],
-                               tf             = slab_t[i+1]).trim(t=[slab_t[i],slab_t[i+1]])
-                if obs_tb is None:
-                    obs_tb = obs.time_bnds[...]
-                else:
-                    if np.allclose(obs_tb[-1],obs.time_bnds[0]):
-                        obs.data = obs.data[1:]
-                        obs.time = obs.time[1:]
-                        obs.time_bnds = obs.time_bnds[1:]
-                    assert np.allclose(obs.time_bnds[0,0],obs_tb[-1,1])
-                    obs_tb = obs.time_bnds[...]
-
-                # get model variable
-                mod = m.extractTimeSeries(self.variable,
-                                          alt_vars     = self.alternate_vars,
-                                          expression   = self.derived,
-                                          initial_time = slab_t[i],
-                                          final_time   = slab_t[i+1]).trim(t=[slab_t[i],slab_t[i+1]]).convert(obs.unit)
-                if mod_tb is None:
-                    mod_tb = mod.time_bnds[...]
-                else:
-                    if np.allclose(mod_tb[-1],mod.time_bnds[0]):
-                        mod.data = mod.data[1:]
-                        mod.time = mod.time[1:]
-                        mod.time_bnds = mod.time_bnds[1:]
-                    assert np.allclose(mod.time_bnds[0,0],mod_tb[-1,1])
-                    mod_tb = mod.time_bnds[...]
+            slab_t = SlabTimes(mod_t0,mod_tf,ns)
+            for i in range(slab_t.size-1):
+
+                # get reference and model variables of the times in this slab
+                obs = TimeWindow(Variable(filename       = self.source,
+                                          variable_name  = self.variable,
+                                          alternate_vars = self.alternate_vars,
+                                          t0             = slab_t[i],
+                                          tf             = slab_t[i+1]),slab_t[i],slab_t[i+1])
+                mod = TimeWindow(m.extractTimeSeries(self.variable,
+                                                     alt_vars     = self.alternate_vars,
+                                                     expression   = self.derived,
+                                                     initial_time = slab_t[i],
+                                                     final_time   = slab_t[i+1]),slab_t[i],slab_t[i+1]).convert(obs.unit)
                 assert obs.time.size == mod.time.size
                 yield obs,mod
 
@@ -333,7 +238,7 @@ class ConfIOMB(Confrontation):
 
         mod_file = os.path.join(self.output_path,"%s_%s.nc"        % (self.name,m.name))
         obs_file = os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name,      ))
-        with il.FileContextManager(self.master,mod_file,obs_file) as fcm:
+        with il.FileContextManager(self.master,mod_file,obs_file,replace=self.benchmark_replace) as fcm:
 
             # Encode some names and colors
             fcm.mod_dset.setncatts({"name" :m.name,
@@ -346,8 +251,7 @@ class ConfIOMB(Confrontation):
 
             obs_timeint = {}; mod_timeint = {}
             obs_depth   = {}; mod_depth   = {}
-            ocyc        = {}; oN          = {}
-            mcyc        = {}; mN          = {}
+            ocyc        = {}; mcyc        = {}
             for depth in self.depths:
                 dlbl = "%d" % depth
                 obs_timeint[dlbl] = []
@@ -403,20 +307,9 @@ class ConfIOMB(Confrontation):
                 # annual cycle in slabs
                 for region in self.regions:
                     z = obs.integrateInSpace(region=region,mean=True)
-                    if region not in ocyc:
-                        ocyc[region] = np.ma.zeros((12,)+z.data.shape[1:])
-                        oN  [region] = np.ma.zeros((12,)+z.data.shape[1:],dtype=int)
-                    i = (np.abs(mid_months[:,np.newaxis]-(z.time % 365))).argmin(axis=0)
-                    (ocyc[region])[i,...] += z.data
-                    (oN  [region])[i,...] += 1
-
+                    ocyc[region] = ocyc.get(region,Climatology()).accumulate(z.time,z.data)
                     z = mod.integrateInSpace(region=region,mean=True)
-                    if region not in mcyc:
-                        mcyc[region] = np.ma.zeros((12,)+z.data.shape[1:])
-                        mN  [region] = np.ma.zeros((12,)+z.data.shape[1:],dtype=int)
-                    i = (np.abs(mid_months[:,np.newaxis]-(z.time % 365))).argmin(axis=0)
-                    (mcyc[region])[i,...] += z.data
-                    (mN  [region])[i,...] += 1
+                    mcyc[region] = mcyc.get(region,Climatology()).accumulate(z.time,z.data)
 
             # combine time slabs from the different depths
             large_bias = float(self.keywords.get("large_bias",0.1*max_obs))
@@ -475,20 +368,15 @@ class ConfIOMB(Confrontation):
                 obs_tmp.name = "timelonint_of_%s_over_%s" % (self.variable,region)
                 mod_bias = TimeLatBias(obs_tmp,mod_tmp)
                 mod_bias.toNetCDF4(fcm.mod_dset,group="MeanState")
-                np.seterr(over='ignore',under='ignore')
-                ocyc[region] = ocyc[region]/(oN[region].clip(1))
-                mcyc[region] = mcyc[region]/(mN[region].clip(1))
-
-                np.seterr(over='raise',under='raise')
                 mcyc[region] = Variable(name = "cycle_of_%s_over_%s" % (self.variable,region),
                                         unit = mod.unit,
-                                        data = mcyc[region],
+                                        data = mcyc[region].mean(),
                                         depth = mod.depth,
                                         depth_bnds = mod.depth_bnds,
                                         time = mid_months)
                 ocyc[region] = Variable(name = "cycle_of_%s_over_%s" % (self.variable,region),
                                         unit = obs.unit,
-                                        data = ocyc[region],
+                                        data = ocyc[region].mean(),
                                         depth = obs.depth,
                                         depth_bnds = obs.depth_bnds,
                                         time = mid_months)
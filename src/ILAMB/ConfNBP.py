@@ -83,7 +83,7 @@ class ConfNBP(Confrontation):
                                data = obs_sum.data[-1])
             obs    .name = "spaceint_of_nbp_over_global"
             obs_sum.name = "accumulate_of_nbp_over_global"
-            with Dataset(os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name)),mode="w") as results:
+            with il.AtomicDataset(os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name)),replace=self.benchmark_replace) as results:
                 results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
                 obs     .toNetCDF4(results,group="MeanState")
                 obs_sum .toNetCDF4(results,group="MeanState")
@@ -205,11 +205,10 @@ class ConfPermafrost(Confrontation):
         results.close()
 
         if self.master:
-            results = Dataset("%s/%s_Benchmark.nc" % (self.output_path,self.name),mode="w")
-            results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
-            obs_area.toNetCDF4(results,group="MeanState")
-            results.setncattr("complete",1)
-            results.close()
+            with il.AtomicDataset("%s/%s_Benchmark.nc" % (self.output_path,self.name),replace=self.benchmark_replace) as results:
+                results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
+                obs_area.toNetCDF4(results,group="MeanState")
+                results.setncattr("complete",1)
 
     def modelPlots(self,m):
 
@@ -176,14 +176,13 @@ class ConfRunoff(Confrontation):
         results.setncattr("complete",1)
         results.close()
         if self.master:
-            results = Dataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),mode="w")
-            results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
-            for var in [obs,
-                        obs_period_mean,
-                        obs_timeint]:
-                var.toNetCDF4(results,group="MeanState")
-            results.setncattr("complete",1)
-            results.close()
+            with il.AtomicDataset(os.path.join(self.output_path,"%s_Benchmark.nc" % self.name),replace=self.benchmark_replace) as results:
+                results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
+                for var in [obs,
+                            obs_period_mean,
+                            obs_timeint]:
+                    var.toNetCDF4(results,group="MeanState")
+                results.setncattr("complete",1)
 
     def modelPlots(self,m):
 
@@ -9,6 +9,6 @@ class ConfSWE(Confrontation):
         obs,mod   = super(ConfSWE,self).stageData(m)
         omin      = obs.data.min(axis=0)
         mmin      = mod.data.min(axis=0)
-        obs.data -= omin[np.newaxis,...]
+        obs.data  = obs.data - omin[np.newaxis,...] # the benchmark data may be shared, read-only
         mod.data -= mmin[np.newaxis,...]
         return obs,mod
@@ -1,6 +1,7 @@
 from .Confrontation import Confrontation
 from .Variable import Variable
 from .Relationship import Relationship
+from . import ilamblib as il
 import matplotlib.pyplot as plt
 from netCDF4 import Dataset
 import numpy as np
@@ -85,25 +86,31 @@ class ConfSoilCarbon(Confrontation):
         r     = Relationship(tas,tau,dep_log=True,order=2,color=pr)
         r.limits = [[1.,1e3],[-22.,30.]]
         
-        # Get model results
+        # Get model results, only their period means are needed so
+        # the data is streamed from the files in chunks of time
         y0 = self.keywords.get("y0",1980.)
         yf = self.keywords.get("yf",2006.)
         t0 = (y0-1850  )*365
         tf = (yf-1850+1)*365
+        mem_slab  = self.keywords.get("mem_slab",100000.) # Mb
         mod_soilc = m.extractTimeSeries("cSoilAbove1m",
                                         alt_vars     = ["soilc","cSoil"],
                                         initial_time = t0,
-                                        final_time   = tf).integrateInTime(mean=True).convert("kg m-2")
+                                        final_time   = tf,
+                                        mem_slab     = mem_slab).integrateInTime(mean=True).convert("kg m-2")
         mod_npp   = m.extractTimeSeries("npp",
                                         initial_time = t0,
                                         final_time   = tf,
-                                        expression   = "gpp-ra").integrateInTime(mean=True).convert("kg m-2 yr-1")
+                                        expression   = "gpp-ra",
+                                        mem_slab     = mem_slab).integrateInTime(mean=True).convert("kg m-2 yr-1")
         mod_tas   = m.extractTimeSeries("tas",
                                         initial_time = t0,
-                                        final_time   = tf).integrateInTime(mean=True).convert("degC")
+                                        final_time   = tf,
+                                        mem_slab     = mem_slab).integrateInTime(mean=True).convert("degC")
         mod_pr    = m.extractTimeSeries("pr",
                                         initial_time = t0,
-                                        final_time   = tf).integrateInTime(mean=True).convert("mm yr-1")
+                                        final_time   = tf,
+                                        mem_slab     = mem_slab).integrateInTime(mean=True).convert("mm yr-1")
         mod_pet   = Variable(lat=LAT,lon=LON,unit="mm yr-1",data=pet).interpolate(lat=mod_pr.lat,lon=mod_pr.lon)
         
         # Determine what will be masked
@@ -138,7 +145,7 @@ class ConfSoilCarbon(Confrontation):
             plt.savefig("%s/Benchmark_global_timeint.png" % (self.output_path))
             plt.close()
     
-            with Dataset("%s/%s_Benchmark.nc" % (self.output_path,self.name),mode="w") as results:
+            with il.AtomicDataset("%s/%s_Benchmark.nc" % (self.output_path,self.name),replace=self.benchmark_replace) as results:
                 results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
                 p = r.dist["default"][5]
                 Q10 = 10**(-10*(np.polyval(np.polyder(p),T10)))
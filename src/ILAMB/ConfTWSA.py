@@ -178,13 +178,12 @@ class ConfTWSA(Confrontation):
         results.setncattr("complete",1)
         results.close()
         if self.master:
-            results = Dataset(os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name)),mode="w")
-            results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
-            obs.toNetCDF4(results,group="MeanState")
-            obs_anom_val.toNetCDF4(results,group="MeanState")
-            obs_anom_map.toNetCDF4(results,group="MeanState")
-            results.setncattr("complete",1)
-            results.close()
+            with il.AtomicDataset(os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name)),replace=self.benchmark_replace) as results:
+                results.setncatts({"name" :"Benchmark", "color":np.asarray([0.5,0.5,0.5]),"complete":0})
+                obs.toNetCDF4(results,group="MeanState")
+                obs_anom_val.toNetCDF4(results,group="MeanState")
+                obs_anom_map.toNetCDF4(results,group="MeanState")
+                results.setncattr("complete",1)
 
     def _extendSitesToMap(self,var):
         """A local function to extend site data to the basins.
@@ -217,7 +217,7 @@ class ConfUncertainty(Confrontation):
 
         mod_file = os.path.join(self.output_path,"%s_%s.nc"        % (self.name,m.name))
         ref_file = os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name,      ))
-        with il.FileContextManager(self.master,mod_file,ref_file) as fcm:
+        with il.FileContextManager(self.master,mod_file,ref_file,replace=self.benchmark_replace) as fcm:
 
             # Encode some names and colors
             fcm.mod_dset.setncatts({"name" :m.name,
@@ -2,17 +2,20 @@ from . import ilamblib as il
 from .Variable import *
 from .Regions import Regions
 from .constants import space_opts,time_opts,mid_months,bnd_months
-import os,glob,re
+import os,glob,re,json,copy
 from netCDF4 import Dataset
 from . import Post as post
+from . import render
+from .shared import SharedVariable
+from .staging import PeekReference,PeekModel,FileSize,FILE_EXPANSION,SlabTimes,TimeWindow,Slabs
 import pylab as plt
 from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-from mpi4py import MPI
+from .parallel import GetRank
 from sympy import sympify
 
 import logging
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
 def getVariableList(dataset):
     """Extracts the list of variables in the dataset that aren't
@@ -27,6 +30,196 @@ def getVariableList(dataset):
             pass
     return variables
 
+def _encodeArray(a):
+    if a is None: return None
+    a = np.ma.asarray(a)
+    return {"data":np.ma.getdata(a).tolist(),"mask":np.ma.getmaskarray(a).tolist()}
+
+def DecodeArray(a,masked=True):
+    """Returns the array encoded in a results summary (see LoadSummary).
+
+    Parameters
+    ----------
+    a : dict
+        the encoded array, with entries 'data' and 'mask'
+    masked : bool, optional
+        enable to return a masked array, the data alone otherwise
+
+    Returns
+    -------
+    array : numpy.ndarray or numpy.ma.masked_array
+        the decoded array, None if a is None
+    """
+    if a is None: return None
+    if not masked: return np.asarray(a["data"])
+    return np.ma.masked_array(a["data"],mask=a["mask"])
+
+def _encodeAttribute(val):
+    if isinstance(val,str): return val
+    return np.asarray(val).tolist()
+
+def _fileStamp(filename):
+    """Returns the modification time [ns] and size of a file, None if it does not exist."""
+    try:
+        stat = os.stat(filename)
+    except (OSError,TypeError):
+        return None
+    return [stat.st_mtime_ns,stat.st_size]
+
+def _summaryName(filename):
+    return "%s_summary.json" % os.path.splitext(filename)[0]
+
+def SummarizeResults(filename):
+    """Writes a summary of a results file in a JSON sidecar.
+
+    The plot limits, composite plots and HTML tables of a
+    confrontation need only a small part of the results of each
+    model. This routine collects that part, that is the name and color
+    of the model, the attributes of the mean state variables (min,
+    max and percentiles), the data of the annual cycles, the scalars
+    of each group and the extents of the relationships, and saves it
+    next to the results file. The summary records the modification
+    time and size of the results file so that it may be rebuilt if
+    the results file changes.
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the netCDF4 results file
+
+    Returns
+    -------
+    summary : dict
+        the summary of the results file
+    """
+    stat    = os.stat(filename)
+    summary = {"source" :[stat.st_mtime_ns,stat.st_size],
+               "attrs"  :{},
+               "groups" :{}}
+    with Dataset(filename) as dataset:
+        for attr in dataset.ncattrs():
+            summary["attrs"][attr] = _encodeAttribute(dataset.getncattr(attr))
+        for g in dataset.groups:
+            grp = dataset.groups[g]
+            out = {}
+            if "scalars" in grp.groups:
+                out["scalars"] = {}
+                for vname,var in grp.groups["scalars"].variables.items():
+                    out["scalars"][vname] = {"units":var.getncattr("units") if "units" in var.ncattrs() else None,
+                                             "data" :_encodeArray(var[...]),
+                                             "attrs":dict([(a,_encodeAttribute(var.getncattr(a))) for a in var.ncattrs()])}
+            if g == "MeanState":
+                out["variables"] = {}
+                for vname in [v for v in grp.variables.keys() if v not in grp.dimensions.keys()]:
+                    var = grp.variables[vname]
+                    out["variables"][vname] = {"size" :int(var.size),
+                                               "attrs":dict([(a,_encodeAttribute(var.getncattr(a))) for a in var.ncattrs()])}
+                    if "cycle_" in vname:
+                        v = Variable(filename=filename,groupname="MeanState",variable_name=vname)
+                        out["variables"][vname]["variable"] = {"name"     :v.name,
+                                                               "unit"     :v.unit,
+                                                               "data"     :_encodeArray(v.data),
+                                                               "data_bnds":_encodeArray(v.data_bnds),
+                                                               "time"     :_encodeArray(v.time),
+                                                               "time_bnds":_encodeArray(v.time_bnds)}
+            if "relationship" in g:
+                out["extents"] = [float(grp.variables["ind_bnd"][ 0, 0]),float(grp.variables["ind_bnd"][-1,-1]),
+                                  float(grp.variables["dep_bnd"][ 0, 0]),float(grp.variables["dep_bnd"][-1,-1])]
+            summary["groups"][g] = out
+    tmp = "%s.%d" % (_summaryName(filename),os.getpid())
+    with open(tmp,"w") as f: json.dump(summary,f)
+    os.replace(tmp,_summaryName(filename))
+    return summary
+
+def LoadSummary(filename):
+    """Returns the summary of a results file, rebuilding it if out of date.
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the netCDF4 results file
+
+    Returns
+    -------
+    summary : dict
+        the summary of the results file, see SummarizeResults
+    """
+    stat = os.stat(filename)
+    try:
+        with open(_summaryName(filename)) as f:
+            summary = json.load(f)
+        if summary["source"] == [stat.st_mtime_ns,stat.st_size]: return summary
+    except (IOError,ValueError,KeyError):
+        pass
+    return SummarizeResults(filename)
+
+def LoadSummaries(output_path):
+    """Returns the summaries of all results files in the output path.
+
+    Parameters
+    ----------
+    output_path : str
+        the output path of a confrontation
+
+    Returns
+    -------
+    summaries : list of (str,dict)
+        the results filenames and their summaries
+    """
+    return [(fname,LoadSummary(fname)) for fname in glob.glob(os.path.join(output_path,"*.nc"))]
+
+def _summaryVariable(var):
+    return Variable(name      = var["name"],
+                    unit      = var["unit"],
+                    data      = DecodeArray(var["data"]),
+                    data_bnds = DecodeArray(var["data_bnds"]),
+                    time      = DecodeArray(var["time"],masked=False),
+                    time_bnds = DecodeArray(var["time_bnds"],masked=False))
+
+def _siteSeries(var,name):
+    return Variable(name      = name,
+                    unit      = var.unit,
+                    data      = var.data,
+                    time      = var.time,
+                    time_bnds = var.time_bnds,
+                    lat       = var.lat,
+                    lon       = var.lon,
+                    ndata     = var.ndata)
+
+_benchmark_timeint = {}
+
+def _retrieveTimeint(filename,memoize=False):
+    """Returns the period mean variable stored in a results file.
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the netCDF4 results file
+    memoize : bool, optional
+        enable to keep the variable in memory, as is useful for the
+        benchmark results which are read once per model. The variable
+        is read again if the file is modified.
+
+    Returns
+    -------
+    var : ILAMB.Variable.Variable
+        the 'timeint_' variable of the 'MeanState' group
+    """
+    key = None
+    if memoize:
+        stat = os.stat(filename)
+        key  = (filename,stat.st_mtime_ns,stat.st_size)
+        if key in _benchmark_timeint: return copy.deepcopy(_benchmark_timeint[key])
+    with Dataset(filename,mode="r") as dset:
+        vname = [v for v in dset.groups["MeanState"].variables.keys() if "timeint_" in v][0]
+    var = Variable(filename      = filename,
+                   groupname     = "MeanState",
+                   variable_name = vname)
+    if memoize:
+        for k in [k for k in _benchmark_timeint if k[0] == filename]: _benchmark_timeint.pop(k)
+        _benchmark_timeint[key] = copy.deepcopy(var)
+    return var
+
 def replace_url(string):
     url = re.findall('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+~]|[!*\(\), ]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', string)
     for u in url:
@@ -80,6 +273,31 @@ def create_data_header(attr, val):
     html += "</dl></p>"
     return html
 
+def _reduceRoundoffErrors(var,units):
+    """Converts the variable to smaller units while its data is of a small order of magnitude.
+
+    The units converted to are appended to the list units. If it
+    already holds units, the variable is instead converted to each in
+    turn, so that slabs of a dataset are converted alike.
+    """
+    if len(units) > 0:
+        for unit in units: var = var.convert(unit)
+        return var
+    def _reduce(var):
+        if "s-1" in var.unit: return var.convert(var.unit.replace("s-1","d-1"))
+        if "kg"  in var.unit: return var.convert(var.unit.replace("kg" ,"g"  ))
+        return var
+    def _getOrder(var):
+        return np.log10(np.abs(var.data).clip(1e-16)).mean()
+    order = _getOrder(var)
+    count = 0
+    while order < -2 and count < 2:
+        var    = _reduce(var)
+        order  = _getOrder(var)
+        count += 1
+        units.append(var.unit)
+    return var
+
 class Confrontation(object):
     """A generic class for confronting model results with observational data.
 
@@ -121,11 +339,17 @@ class Confrontation(object):
         enable to force the masking of areas with no land (default is False)
     limit_type : str
         change the types of plot limits, one of ['minmax', '99per' (default)]
+    plot_workers : int, optional
+        the number of threads used to encode the map images (default is 1)
+    shared_benchmark : bool, optional
+        enable to read the observational dataset once per node and
+        share it among the processes (see ILAMB.shared)
     """
     def __init__(self,**keywords):
 
         # Initialize
         self.master         = True
+        self.benchmark_replace = True # see ILAMB.run.ConfrontPair
         self.name           = keywords.get("name",None)
         self.source         = keywords.get("source",None)
         self.variable       = keywords.get("variable",None)
@@ -133,6 +357,7 @@ class Confrontation(object):
         self.alternate_vars = keywords.get("alternate_vars",[])
         self.derived        = keywords.get("derived",None)
         self.regions        = list(keywords.get("regions",["global"]))
+        self.configured_regions = None # the regions before pruning, see pruneRegions
         self.data           = None
         self.cmap           = keywords.get("cmap","jet")
         self.land           = keywords.get("land",False)
@@ -146,6 +371,8 @@ class Confrontation(object):
         self.keywords       = keywords
         self.extents        = np.asarray([[-90.,+90.],[-180.,+180.]])
         self.study_limits   = []
+        self.plot_workers   = keywords.get("plot_workers",1)
+        self.shared_benchmark = keywords.get("shared_benchmark",False)
         
         # Make sure the source data exists
         try:
@@ -253,6 +480,72 @@ class Confrontation(object):
             ors  = [self.variable] + self.alternate_vars
         return ands,ors
 
+    def dependencies(self,m):
+        """Returns what the results of a model in this confrontation depend on.
+
+        The dependencies are the ILAMB version, the keywords from the
+        configure file, the study limits, extents and regions (as
+        configured, before pruning, and their definitions) of the
+        confrontation, the time shift of the
+        model and the modification time and size of the observational
+        dataset and of the model files of the variables the
+        confrontation requires. If any of these change, the results
+        must be recomputed (see ILAMB.run.PairCurrent).
+
+        Parameters
+        ----------
+        m : ILAMB.ModelResult.ModelResult
+            the model result context
+
+        Returns
+        -------
+        deps : dict
+            the JSON serializable dependencies
+        """
+        from . import __version__
+        def _default(obj):
+            if isinstance(obj,np.ndarray): return obj.tolist()
+            if isinstance(obj,np.generic): return obj.item()
+            return getattr(obj,"longname",str(obj))
+        volatile = ["parent","children","confrontation","score","weight","sum_weight_children",
+                    "normalize_weight","overall_weight","bgcolor","mem_slab","plot_workers",
+                    "shared_benchmark"]
+        keywords = dict([(key,val) for key,val in self.keywords.items() if key not in volatile])
+        ands,ors = self.requires()
+        names    = []
+        for v in ands + ors + [self.variable] + list(self.alternate_vars) + ["areacella","sftlf","lat_bnds","lon_bnds"]:
+            if v not in names: names.append(v)
+        files    = {}
+        regions  = self.regions if self.configured_regions is None else self.configured_regions
+        if self.source is not None: files[self.source] = _fileStamp(self.source)
+        for v in names:
+            for filename in m.variables.get(v,[]): files[filename] = _fileStamp(filename)
+        deps = {"ilamb"        : __version__,
+                "keywords"     : keywords,
+                "study_limits" : self.study_limits,
+                "extents"      : self.extents,
+                "regions"      : [render.RegionSignature(region) for region in regions],
+                "model"        : [m.name,m.shift],
+                "files"        : files}
+        return json.loads(json.dumps(deps,sort_keys=True,default=_default))
+
+    def benchmarkKey(self):
+        """Returns a key which identifies the observational data of this confrontation.
+
+        The mean state analysis keeps the analysis of the benchmark
+        under this key, so that it is reused for every model of the
+        confrontation (see ILAMB.ilamblib.AnalysisMeanStateSpace).
+
+        Returns
+        -------
+        key : tuple
+            the longname, source file (and its modification time and
+            size) and study limits of the confrontation
+        """
+        stamp = _fileStamp(self.source)
+        return (self.longname,self.source,None if stamp is None else tuple(stamp),
+                tuple([float(t) for t in self.study_limits]))
+
     def stageData(self,m):
         r"""Extracts model data which matches the observational dataset.
 
@@ -283,11 +576,12 @@ class Confrontation(object):
         mod : ILAMB.Variable.Variable
             the variable context associated with the model result
         """
-        obs = Variable(filename       = self.source,
-                       variable_name  = self.variable,
-                       alternate_vars = self.alternate_vars,
-                       t0 = None if len(self.study_limits) != 2 else self.study_limits[0],
-                       tf = None if len(self.study_limits) != 2 else self.study_limits[1])
+        read = SharedVariable if self.shared_benchmark else Variable
+        obs  = read(filename       = self.source,
+                    variable_name  = self.variable,
+                    alternate_vars = self.alternate_vars,
+                    t0 = None if len(self.study_limits) != 2 else self.study_limits[0],
+                    tf = None if len(self.study_limits) != 2 else self.study_limits[1])
         if obs.time is None: raise il.NotTemporalVariable()
         self.pruneRegions(obs)
 
@@ -306,26 +600,89 @@ class Confrontation(object):
                                     logstring = "[%s][%s]" % (self.longname,m.name))
 
         # Check the order of magnitude of the data and convert to help avoid roundoff errors
-        def _reduceRoundoffErrors(var):
-            if "s-1" in var.unit: return var.convert(var.unit.replace("s-1","d-1"))
-            if "kg"  in var.unit: return var.convert(var.unit.replace("kg" ,"g"  ))
-            return var
-        def _getOrder(var):
-            return np.log10(np.abs(var.data).clip(1e-16)).mean()
-        order = _getOrder(obs)
-        count = 0
-        while order < -2 and count < 2:
-            obs    = _reduceRoundoffErrors(obs)
-            order  = _getOrder(obs)
-            count += 1
+        obs = _reduceRoundoffErrors(obs,[])
 
         # convert the model data to the same unit
         mod = mod.convert(obs.unit)
 
         return obs,mod
 
+    def stageSlabs(self,m):
+        r"""Extracts model data which matches the observational dataset in slabs of time.
+
+        Unless the files of this pair are far smaller than the memory
+        per slab (mem_slab, see ilamb-run --mem_per_pair and
+        ILAMB.staging.FileSize), the memory the data of this pair
+        needs is estimated from the metadata of the files. If it
+        exceeds the memory per slab, the data is staged
+        as in stageData but in slabs of consecutive years whose data
+        fits. Only the slabs of spatial datasets are supported by the
+        analysis, site data is always staged at once. Confrontations
+        which stage their data differently (overriding stageData) may
+        opt into slabs by overriding this method.
+
+        Parameters
+        ----------
+        m : ILAMB.ModelResult.ModelResult
+            the model result context
+
+        Returns
+        -------
+        slabs : ILAMB.staging.Slabs or None
+            the slabs of observational and model data, or None if the
+            data is to be staged at once by stageData
+        """
+        if type(self).stageData is not Confrontation.stageData: return None
+        mem_slab = self.keywords.get("mem_slab",100000.) # Mb
+        try:
+            if FileSize(self.source,m,self.variable,self.alternate_vars,self.derived)*FILE_EXPANSION <= mem_slab: return None
+        except il.VarNotInModel:
+            return None
+        t0 = None if len(self.study_limits) != 2 else self.study_limits[0]
+        tf = None if len(self.study_limits) != 2 else self.study_limits[1]
+        obs_t0,obs_tf,obs_nt,obs_mem,unit,climatology = PeekReference(self.source,self.variable,self.alternate_vars,t0,tf)
+        if climatology: return None
+        try:
+            mod_t0,mod_tf,mod_nt,mod_mem,info = PeekModel(m,self.variable,self.alternate_vars,self.derived,obs_t0,obs_tf)
+        except il.VarNotInModel:
+            return None
+        obs_mem *= (mod_tf-mod_t0)/(obs_tf-obs_t0)
+        if max(obs_mem,mod_mem) <= mem_slab: return None
+        ns = int(np.floor(max(obs_mem,mod_mem)/mem_slab))+1
+        ns = min(ns,obs_nt,mod_nt)
+        bounds = SlabTimes(max(obs_t0,mod_t0),min(obs_tf,mod_tf),ns,align="year")
+
+        # The units of the observations (see stageData) are chosen on
+        # the first slab, which also prunes the regions
+        units = []
+        def _stage(t0,tf):
+            obs = TimeWindow(Variable(filename       = self.source,
+                                      variable_name  = self.variable,
+                                      alternate_vars = self.alternate_vars,
+                                      t0             = t0,
+                                      tf             = tf),t0,tf)
+            mod = TimeWindow(m.extractTimeSeries(self.variable,
+                                                 alt_vars     = self.alternate_vars,
+                                                 expression   = self.derived,
+                                                 initial_time = t0,
+                                                 final_time   = tf),t0,tf)
+            obs,mod = il.MakeComparable(obs,mod,
+                                        mask_ref  = True,
+                                        clip_ref  = True,
+                                        extents   = self.extents,
+                                        logstring = "[%s][%s]" % (self.longname,m.name))
+            if t0 == bounds[0]: self.pruneRegions(obs)
+            obs = _reduceRoundoffErrors(obs,units)
+            mod = mod.convert(obs.unit)
+            return obs,mod
+        slabs = Slabs(_stage,bounds)
+        if not slabs.first()[0].spatial: return None
+        logger.info("[%s][%s] staging data in %d slabs, est memory %d [Mb]%s" % (self.longname,m.name,len(slabs),max(obs_mem,mod_mem),info))
+        return slabs
+
     def pruneRegions(self,var):
         # remove regions if there is no data from the input variable
+        if self.configured_regions is None: self.configured_regions = list(self.regions)
         r = Regions()
         self.regions = [region for region in self.regions if r.hasData(region,var)]
 
@@ -344,12 +701,13 @@ class Confrontation(object):
         m : ILAMB.ModelResult.ModelResult
             the model results
         """
-        # Grab the data
-        obs,mod = self.stageData(m)
+        # Grab the data, in slabs of time if it would not fit in memory
+        slabs   = self.stageSlabs(m)
+        obs,mod = self.stageData(m) if slabs is None else slabs.first()
 
         mod_file = os.path.join(self.output_path,"%s_%s.nc"        % (self.name,m.name))
         obs_file = os.path.join(self.output_path,"%s_Benchmark.nc" % (self.name,      ))
-        with il.FileContextManager(self.master,mod_file,obs_file) as fcm:
+        with il.FileContextManager(self.master,mod_file,obs_file,replace=self.benchmark_replace) as fcm:
 
             # Encode some names and colors
             fcm.mod_dset.setncatts({"name" :m.name,
@@ -360,6 +718,11 @@ class Confrontation(object):
                                         "color":np.asarray([0.5,0.5,0.5]),
                                         "complete":0})
 
+            # Keep the comparable site series for the site plots
+            if self.hasSites and obs.ndata:
+                _siteSeries(obs,"obs").toNetCDF4(fcm.mod_dset,group="SiteSeries")
+                _siteSeries(mod,"mod").toNetCDF4(fcm.mod_dset,group="SiteSeries")
+
             # Read in some options and run the mean state analysis
             mass_weighting = self.keywords.get("mass_weighting",False)
             skip_rmse      = self.keywords.get("skip_rmse"     ,False)
@@ -375,7 +738,9 @@ class Confrontation(object):
                                           skip_rmse         = skip_rmse,
                                           skip_iav          = skip_iav,
                                           skip_cycle        = skip_cycle,
-                                          mass_weighting    = mass_weighting)
+                                          mass_weighting    = mass_weighting,
+                                          benchmark_key     = self.benchmarkKey(),
+                                          slabs             = slabs)
             else:
                 il.AnalysisMeanStateSites(obs,mod,dataset   = fcm.mod_dset,
                                           regions           = self.regions,
@@ -389,13 +754,16 @@ class Confrontation(object):
                                           mass_weighting    = mass_weighting)
             fcm.mod_dset.setncattr("complete",1)
             if self.master: fcm.obs_dset.setncattr("complete",1)
+        SummarizeResults(mod_file)
+        if self.master: SummarizeResults(obs_file)
         logger.info("[%s][%s] Success" % (self.longname,m.name))
 
     def determinePlotLimits(self):
         """Determine the limits of all plots which are inclusive of all ranges.
 
-        The routine will open all netCDF files in the output path and
-        add the maximum and minimum of all variables which are
+        The routine will read the summaries of all netCDF files in the
+        output path (see SummarizeResults) and add the maximum and
+        minimum of all variables which are
         designated to be plotted. If legends are desired for a given
         plot, these are rendered here as well. This routine should be
         called before calling any plotting routine.
@@ -408,40 +776,40 @@ class Confrontation(object):
             min_str = "min"
 
         # Determine the min/max of variables over all models
-        limits = {}
-        prune  = False
-        for fname in glob.glob(os.path.join(self.output_path,"*.nc")):
-            with Dataset(fname) as dataset:
-                if "MeanState" not in dataset.groups: continue
-                group     = dataset.groups["MeanState"]
-                variables = [v for v in group.variables.keys() if v not in group.dimensions.keys()]
-                for vname in variables:
-                    var    = group.variables[vname]
-                    pname  = vname.split("_")[0]
-                    region = vname.split("_")[-1]
-                    if var[...].size <= 1: continue
-                    if pname in space_opts:
-                        if pname not in limits:
-                            limits[pname] = {}
-                            limits[pname]["min"]  = +1e20
-                            limits[pname]["max"]  = -1e20
-                            limits[pname]["unit"] = post.UnitStringToMatplotlib(var.getncattr("units"))
-                        limits[pname]["min"] = min(limits[pname]["min"],var.getncattr(min_str))
-                        limits[pname]["max"] = max(limits[pname]["max"],var.getncattr(max_str))
-                    elif pname in time_opts:
-                        if pname not in limits: limits[pname] = {}
-                        if region not in limits[pname]:
-                            limits[pname][region] = {}
-                            limits[pname][region]["min"]  = +1e20
-                            limits[pname][region]["max"]  = -1e20
-                            limits[pname][region]["unit"] = post.UnitStringToMatplotlib(var.getncattr("units"))
-                        limits[pname][region]["min"] = min(limits[pname][region]["min"],var.getncattr("min"))
-                        limits[pname][region]["max"] = max(limits[pname][region]["max"],var.getncattr("max"))
-                    if not prune and "Benchmark" in fname and pname == "timeint":
-                        prune = True
-                        self.pruneRegions(Variable(filename      = fname,
-                                                   variable_name = vname,
-                                                   groupname     = "MeanState"))
+        limits    = {}
+        prune     = False
+        summaries = LoadSummaries(self.output_path)
+        for fname,summary in summaries:
+            if "MeanState" not in summary["groups"]: continue
+            variables = summary["groups"]["MeanState"]["variables"]
+            for vname in variables:
+                var    = variables[vname]
+                attrs  = var["attrs"]
+                pname  = vname.split("_")[0]
+                region = vname.split("_")[-1]
+                if var["size"] <= 1: continue
+                if pname in space_opts:
+                    if pname not in limits:
+                        limits[pname] = {}
+                        limits[pname]["min"]  = +1e20
+                        limits[pname]["max"]  = -1e20
+                        limits[pname]["unit"] = post.UnitStringToMatplotlib(attrs["units"])
+                    limits[pname]["min"] = min(limits[pname]["min"],attrs[min_str])
+                    limits[pname]["max"] = max(limits[pname]["max"],attrs[max_str])
+                elif pname in time_opts:
+                    if pname not in limits: limits[pname] = {}
+                    if region not in limits[pname]:
+                        limits[pname][region] = {}
+                        limits[pname][region]["min"]  = +1e20
+                        limits[pname][region]["max"]  = -1e20
+                        limits[pname][region]["unit"] = post.UnitStringToMatplotlib(attrs["units"])
+                    limits[pname][region]["min"] = min(limits[pname][region]["min"],attrs["min"])
+                    limits[pname][region]["max"] = max(limits[pname][region]["max"],attrs["max"])
+                if not prune and "Benchmark" in fname and pname == "timeint":
+                    prune = True
+                    self.pruneRegions(Variable(filename      = fname,
+                                               variable_name = vname,
+                                               groupname     = "MeanState"))
 
         # Second pass to plot legends (FIX: only for master?)
         for pname in limits.keys():
@@ -481,22 +849,20 @@ class Confrontation(object):
                 plt.close()
 
         # Determine min/max of relationship variables
-        for fname in glob.glob(os.path.join(self.output_path,"*.nc")):
-            with Dataset(fname) as dataset:
-                for g in dataset.groups.keys():
-                    if "relationship" not in g: continue
-                    grp = dataset.groups[g]
-                    if g not in limits:
-                        limits[g] = {}
-                        limits[g]["xmin"] = +1e20
-                        limits[g]["xmax"] = -1e20
-                        limits[g]["ymin"] = +1e20
-                        limits[g]["ymax"] = -1e20
-                    limits[g]["xmin"] = min(limits[g]["xmin"],grp.variables["ind_bnd"][ 0, 0])
-                    limits[g]["xmax"] = max(limits[g]["xmax"],grp.variables["ind_bnd"][-1,-1])
-                    limits[g]["ymin"] = min(limits[g]["ymin"],grp.variables["dep_bnd"][ 0, 0])
-                    limits[g]["ymax"] = max(limits[g]["ymax"],grp.variables["dep_bnd"][-1,-1])
-
+        for fname,summary in summaries:
+            for g in summary["groups"]:
+                if "relationship" not in g: continue
+                xmin,xmax,ymin,ymax = summary["groups"][g]["extents"]
+                if g not in limits:
+                    limits[g] = {}
+                    limits[g]["xmin"] = +1e20
+                    limits[g]["xmax"] = -1e20
+                    limits[g]["ymin"] = +1e20
+                    limits[g]["ymax"] = -1e20
+                limits[g]["xmin"] = min(limits[g]["xmin"],xmin)
+                limits[g]["xmax"] = max(limits[g]["xmax"],xmax)
+                limits[g]["ymin"] = min(limits[g]["ymin"],ymin)
+                limits[g]["ymax"] = max(limits[g]["ymax"],ymax)
 
         self.limits = limits
 
@@ -551,6 +917,7 @@ class Confrontation(object):
                             scalars.variables[key][0] = score[key]
                         else:
                             Variable(data=score[key],name=key,unit="1").toNetCDF4(dataset,group=grp)
+        SummarizeResults(fname)
 
 
     def compositePlots(self):
@@ -573,31 +940,31 @@ class Confrontation(object):
         cycle  = {}
         has_cycle = False
         has_std   = False
-        for fname in glob.glob(os.path.join(self.output_path,"*.nc")):
-            dataset = Dataset(fname)
-            if "MeanState" not in dataset.groups: continue
-            dset    = dataset.groups["MeanState"]
-            models.append(dataset.getncattr("name"))
-            colors.append(dataset.getncattr("color"))
+        for fname,summary in LoadSummaries(self.output_path):
+            if "MeanState" not in summary["groups"]: continue
+            dset    = summary["groups"]["MeanState"]
+            scalars = dset.get("scalars",None)
+            models.append(summary["attrs"]["name"])
+            colors.append(summary["attrs"]["color"])
             for region in self.regions:
 
                 if region not in cycle: cycle[region] = []
-                key = [v for v in dset.variables.keys() if ("cycle_"  in v and region in v)]
+                key = [v for v in dset["variables"].keys() if ("cycle_"  in v and region in v)]
                 if len(key)>0:
                     has_cycle = True
-                    cycle[region].append(Variable(filename=fname,groupname="MeanState",variable_name=key[0]))
+                    cycle[region].append(_summaryVariable(dset["variables"][key[0]]["variable"]))
 
                 if region not in std: std[region] = []
                 if region not in corr: corr[region] = []
 
                 key = []
-                if "scalars" in dset.groups:
-                    key = [v for v in dset.groups["scalars"].variables.keys() if ("Spatial Distribution Score" in v and region in v)]
+                if scalars is not None:
+                    key = [v for v in scalars.keys() if ("Spatial Distribution Score" in v and region in v)]
                 if len(key) > 0:
                     has_std = True
-                    sds     = dset.groups["scalars"].variables[key[0]]
-                    corr[region].append(sds.getncattr("R"  ))
-                    std [region].append(sds.getncattr("std"))
+                    sds     = scalars[key[0]]["attrs"]
+                    corr[region].append(sds["R"  ])
+                    std [region].append(sds["std"])
 
         # composite annual cycle plot
         if has_cycle and len(models) > 2:
@@ -690,6 +1057,23 @@ class Confrontation(object):
         # get the HTML page
         page = [page for page in self.layout.pages if "MeanState" in page.name][0]
 
+        # maps are rendered on reused figures and skipped if their
+        # inputs are unchanged since they were last written
+        renderer = render.GetMapRenderer(self.plot_workers)
+        manifest = render.FigureManifest(os.path.join(self.output_path,"%s_figures.json" % m.name))
+        def _renderMap(var,figname,pname,region):
+            sig = render.FigureSignature(render.DataHash(var),render.RegionSignature(region),
+                                         self.limits[pname]["min"],
+                                         self.limits[pname]["max"],
+                                         getattr(self.limits[pname]["cmap"],"name",self.limits[pname]["cmap"]))
+            if manifest.current(figname,sig): return
+            renderer.render(var,figname,
+                            region = region,
+                            vmin   = self.limits[pname]["min"],
+                            vmax   = self.limits[pname]["max"],
+                            cmap   = self.limits[pname]["cmap"])
+            manifest.update(figname,sig)
+
         with Dataset(fname) as dataset:
             group     = dataset.groups["MeanState"]
             variables = getVariableList(group)
@@ -716,14 +1100,8 @@ class Confrontation(object):
 
                         # plot variable
                         for region in self.regions:
-                            ax = var.plot(None,
-                                          region = region,
-                                          vmin   = self.limits[pname]["min"],
-                                          vmax   = self.limits[pname]["max"],
-                                          cmap   = self.limits[pname]["cmap"])
-                            fig = ax.get_figure()
-                            fig.savefig(os.path.join(self.output_path,"%s_%s_%s.png" % (m.name,region,pname)))
-                            plt.close()
+                            _renderMap(var,os.path.join(self.output_path,"%s_%s_%s.png" % (m.name,region,pname)),
+                                       pname,region)
 
                         # Jumping through hoops to get the benchmark plotted and in the html output
                         if self.master and (pname == "timeint" or pname == "phase" or pname == "iav"):
@@ -740,14 +1118,8 @@ class Confrontation(object):
                             # plot variable
                             obs = Variable(filename=bname,groupname="MeanState",variable_name=vname)
                             for region in self.regions:
-                                ax = obs.plot(None,
-                                              region = region,
-                                              vmin   = self.limits[pname]["min"],
-                                              vmax   = self.limits[pname]["max"],
-                                              cmap   = self.limits[pname]["cmap"])
-                                fig = ax.get_figure()
-                                fig.savefig(os.path.join(self.output_path,"Benchmark_%s_%s.png" % (region,pname)))
-                                plt.close()
+                                _renderMap(obs,os.path.join(self.output_path,"Benchmark_%s_%s.png" % (region,pname)),
+                                           pname,region)
 
                     if not (var.spatial or (var.ndata is not None)) and var.temporal:
 
@@ -785,15 +1157,29 @@ class Confrontation(object):
                             fig.savefig(os.path.join(self.output_path,"%s_%s_%s.png" % (m.name,region,pname)))
                             plt.close()
 
+        renderer.flush()
+        manifest.save()
         logger.info("[%s][%s] Success" % (self.longname,m.name))
 
     def sitePlots(self,m):
-        """
+        """For a given model, plot the time series of the model and benchmark at each site.
+
+        The comparable series are read from the 'SiteSeries' group
+        which confront writes to the results file. Only results from
+        older versions lacking this group require the data to be
+        staged again.
 
         """
         if not self.hasSites: return
 
-        obs,mod = self.stageData(m)
+        fname = os.path.join(self.output_path,"%s_%s.nc" % (self.name,m.name))
+        with Dataset(fname) as dataset:
+            staged = "SiteSeries" in dataset.groups
+        if staged:
+            obs = Variable(filename=fname,groupname="SiteSeries",variable_name="obs")
+            mod = Variable(filename=fname,groupname="SiteSeries",variable_name="mod")
+        else:
+            obs,mod = self.stageData(m)
         for i in range(obs.ndata):
             fig,ax = plt.subplots(figsize=(6.8,2.8),tight_layout=True)
             tmask  = np.where(mod.data.mask[:,i]==False)[0]
@@ -821,8 +1207,8 @@ class Confrontation(object):
     def generateHtml(self):
         """Generate the HTML for the results of this confrontation.
 
-        This routine opens all netCDF files and builds a table of
-        metrics. Then it passes the results to the HTML generator and
+        This routine reads the summaries of all netCDF files and builds
+        a table of metrics. Then it passes the results to the HTML generator and
         saves the result in the output directory. This only occurs on
         the confrontation flagged as master.
 
@@ -830,49 +1216,49 @@ class Confrontation(object):
         # only the master processor needs to do this
         if not self.master: return
 
+        summaries = LoadSummaries(self.output_path)
         for page in self.layout.pages:
 
             # build the metric dictionary
             metrics = {}
             page.models = []
-            for fname in glob.glob(os.path.join(self.output_path,"*.nc")):
-                with Dataset(fname) as dataset:
-                    mname = dataset.getncattr("name")
-                    if mname != "Benchmark": page.models.append(mname)
-                    if page.name not in dataset.groups: continue
-                    group = dataset.groups[page.name]
-
-                    # if the dataset opens, we need to add the model (table row)
-                    metrics[mname] = {}
-
-                    # each model will need to have all regions
-                    for region in self.regions: metrics[mname][region] = {}
-
-                    # columns in the table will be in the scalars group
-                    if "scalars" not in group.groups: continue
-
-                    # we add scalars to the model/region based on the region
-                    # name being in the variable name. If no region is found,
-                    # we assume it is the global region.
-                    grp = group.groups["scalars"]
-                    for vname in grp.variables.keys():
-                        found = False
-                        for region in self.regions:
-                            if region in vname:
-                                found = True
-                                var   = grp.variables[vname]
-                                name  = vname.replace(region,"")
-                                metrics[mname][region][name] = Variable(name = name,
-                                                                        unit = var.units,
-                                                                        data = var[...])
-                        if not found:
-                            var = grp.variables[vname]
-                            if "global" not in metrics[mname]:
-                                logger.debug("[%s][%s] 'global' not in region list = [%s]" % (self.longname,mname,",".join(self.regions)))
-                                raise ValueError()
-                            metrics[mname]["global"][vname] = Variable(name = vname,
-                                                                       unit = var.units,
-                                                                       data = var[...])
+            for fname,summary in summaries:
+                mname = summary["attrs"]["name"]
+                if mname != "Benchmark": page.models.append(mname)
+                if page.name not in summary["groups"]: continue
+                group = summary["groups"][page.name]
+
+                # if the dataset opens, we need to add the model (table row)
+                metrics[mname] = {}
+
+                # each model will need to have all regions
+                for region in self.regions: metrics[mname][region] = {}
+
+                # columns in the table will be in the scalars group
+                if "scalars" not in group: continue
+
+                # we add scalars to the model/region based on the region
+                # name being in the variable name. If no region is found,
+                # we assume it is the global region.
+                grp = group["scalars"]
+                for vname in grp.keys():
+                    found = False
+                    for region in self.regions:
+                        if region in vname:
+                            found = True
+                            var   = grp[vname]
+                            name  = vname.replace(region,"")
+                            metrics[mname][region][name] = Variable(name = name,
+                                                                    unit = var["units"],
+                                                                    data = DecodeArray(var["data"]))
+                    if not found:
+                        var = grp[vname]
+                        if "global" not in metrics[mname]:
+                            logger.debug("[%s][%s] 'global' not in region list = [%s]" % (self.longname,mname,",".join(self.regions)))
+                            raise ValueError()
+                        metrics[mname]["global"][vname] = Variable(name = vname,
+                                                                   unit = var["units"],
+                                                                   data = DecodeArray(var["data"]))
             page.setMetrics(metrics)
 
         # write the HTML page
@@ -884,14 +1270,6 @@ class Confrontation(object):
 
         """
 
-        def _retrieveData(filename):
-            key = None
-            with Dataset(filename,mode="r") as dset:
-                key  = [v for v in dset.groups["MeanState"].variables.keys() if "timeint_" in v]
-            return Variable(filename      = filename,
-                            groupname     = "MeanState",
-                            variable_name = key[0])
-        
         def _applyRefMask(ref,com):
             tmp = ref.interpolate(lat=com.lat,lat_bnds=com.lat_bnds,
                                   lon=com.lon,lon_bnds=com.lon_bnds)
@@ -1050,8 +1428,8 @@ class Confrontation(object):
 
         # Try to get the dependent data from the model and obs
         try:
-            ref_dep  = _retrieveData(os.path.join(self.output_path,"%s_%s.nc" % (self.name,"Benchmark")))
-            com_dep  = _retrieveData(os.path.join(self.output_path,"%s_%s.nc" % (self.name,m.name     )))
+            ref_dep  = _retrieveTimeint(os.path.join(self.output_path,"%s_%s.nc" % (self.name,"Benchmark")),memoize=True)
+            com_dep  = _retrieveTimeint(os.path.join(self.output_path,"%s_%s.nc" % (self.name,m.name     )))
             com_dep  = _applyRefMask(ref_dep,com_dep)
             dep_name = self.longname.split("/")[0]
             dep_min  = self.limits["timeint"]["min"]
@@ -1077,8 +1455,8 @@ class Confrontation(object):
 
                 # try to get the independent data from the model and obs
                 try:
-                    ref_ind  = _retrieveData(os.path.join(c.output_path,"%s_%s.nc" % (c.name,"Benchmark")))
-                    com_ind  = _retrieveData(os.path.join(c.output_path,"%s_%s.nc" % (c.name,m.name     )))
+                    ref_ind  = _retrieveTimeint(os.path.join(c.output_path,"%s_%s.nc" % (c.name,"Benchmark")),memoize=True)
+                    com_ind  = _retrieveTimeint(os.path.join(c.output_path,"%s_%s.nc" % (c.name,m.name     )))
                     com_ind  = _applyRefMask(ref_ind,com_ind)
                     ind_name = c.longname.split("/")[0]
                     ind_min  = c.limits["timeint"]["min"]-1e-12
@@ -1160,3 +1538,4 @@ class Confrontation(object):
                         Variable(name = sname,
                                  unit = "1",
                                  data = score).toNetCDF4(results,group="Relationships")
+        SummarizeResults(os.path.join(self.output_path,"%s_%s.nc" % (self.name,m.name)))
@@ -1,19 +1,34 @@
-from .Variable import Variable
+from .Variable import Variable,LazyVariable
 from netCDF4 import Dataset
 from . import ilamblib as il
+from .spatial import NearestSites
 import numpy as np
-import glob,os,re
-from mpi4py import MPI
+import glob,os,re,json
+from .parallel import GetRank
 import logging
 
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
-def _skipFile(pathName,altvars,lats,lons,same_site_epsilon):
+def _skipFile(pathName,altvars,lats,lons,same_site_epsilon,entry=None):
     """Some simple logic intended to help speed up models which consist of
        many single site runs.
     """
     if lats is None: return False
     if lats.size > 1: return False
+    if entry is not None:
+        # the file index already knows the site location, no need to
+        # open the file
+        if entry["site"] is None: return False
+        for v in altvars:
+            if v not in entry["variables"]: continue
+            D = entry["variables"][v]["dimensions"]
+            if len(D) == 0: continue
+            D = D[-1]
+            if D not in ['data','lndgrid']: continue
+            if entry["dimensions"][D] > 1: continue
+            X,Y = entry["site"]
+            if (np.sqrt((X-lats[0])**2+(Y-lons[0])**2) > same_site_epsilon): return True
+        return False
     with Dataset(pathName) as dset:
         for v in altvars:
             if v in dset.variables:
@@ -28,6 +43,161 @@ def _skipFile(pathName,altvars,lats,lons,same_site_epsilon):
 
     return False
 
+def _isLat(key):
+    return (key.lower().startswith("lat" ) or
+            key.lower().  endswith("lat" ))
+
+def _isLon(key):
+    return (key.lower().startswith("lon" ) or
+            key.lower().  endswith("lon" ) or
+            key.lower().startswith("long") or
+            key.lower().  endswith("long"))
+
+def _scanFile(pathName):
+    """Opens a model file and summarizes its contents for the file index.
+
+    Parameters
+    ----------
+    pathName : str
+        the full path of the netCDF4 file to scan
+
+    Returns
+    -------
+    entry : dict
+        a JSON serializable dictionary containing the file's mtime and
+        size, its dimensions, variables (with their dimensions and
+        long/standard names), the time extent and native calendar if
+        the file has a time dimension, the extents of any lat/lon
+        variables, and the location of the site if the file
+        represents a single site.
+    """
+    stat  = os.stat(pathName)
+    entry = {"mtime"     : stat.st_mtime,
+             "size"      : stat.st_size,
+             "dimensions": {},
+             "variables" : {},
+             "time"      : None,
+             "calendar"  : None,
+             "extents"   : {},
+             "site"      : None}
+    with Dataset(pathName) as dset:
+        for key in dset.dimensions.keys():
+            entry["dimensions"][key] = dset.dimensions[key].size
+        timed = False
+        for key in dset.variables.keys():
+            v    = dset.variables[key]
+            attr = v.ncattrs()
+            name = None
+            if "long_name" in attr:
+                name = v.long_name
+            elif "standard_name" in attr:
+                name = v.standard_name
+            entry["variables"][key] = {"dimensions": list(v.dimensions),
+                                       "name"      : None if name is None else str(name)}
+
+            # the time extent is taken from the first variable which
+            # is defined on a time dimension
+            if not timed and len([d for d in v.dimensions if "time" in d.lower()]) == 1:
+                timed = True
+                try:
+                    t,tb,cb,b,e,cal = il.GetTime(v)
+                    if tb is not None:
+                        entry["time"] = [float(tb.min()),float(tb.max())]
+                        tname = [d for d in v.dimensions if "time" in d.lower()][0]
+                        entry["calendar"] = dset.variables[tname].calendar
+                except:
+                    pass
+
+            # spatial extents
+            if not (_isLat(key) or _isLon(key)): continue
+            try:
+                x = v[...]
+            except:
+                continue
+            if x.size == 1: continue
+            if _isLon(key):
+                if x.ndim < 1 or x.ndim > 2: continue
+                x = (x<=180)*x + (x>180)*(x-360) + (x<-180)*360
+            entry["extents"][key] = [float(x.min()),float(x.max())]
+
+        # single site files
+        if "lat" in dset.variables and "lon" in dset.variables:
+            X = dset.variables['lat'][...]
+            Y = dset.variables['lon'][...]
+            if X.size == 1 and Y.size == 1:
+                Y = (Y<=180)*Y + (Y>180)*(Y-360) + (Y<-180)*360
+                entry["site"] = [float(np.ravel(X)[0]),float(np.ravel(Y)[0])]
+    return entry
+
+def _loadGrid(filename,key):
+    """Returns the cell areas and land fractions kept in filename if stored under key, None otherwise."""
+    if filename is None or not os.path.isfile(filename): return None
+    try:
+        with np.load(filename) as f:
+            if str(f["key"]) != key: return None
+            grid = []
+            for name in ["cell_areas","land_fraction"]:
+                a = f["%s_data" % name] if "%s_data" % name in f else None
+                if "%s_mask" % name in f: a = np.ma.masked_array(a,mask=f["%s_mask" % name])
+                grid.append(a)
+            return tuple(grid)
+    except Exception:
+        logger.debug("[%s] Error reading the grid information %s" % (key,filename))
+        return None
+
+def _saveGrid(filename,key,grid):
+    """Stores the cell areas and land fractions in filename under key, atomically."""
+    if filename is None: return
+    arrays = {"key":np.asarray(key)}
+    for name,a in zip(["cell_areas","land_fraction"],grid):
+        if a is None: continue
+        arrays["%s_data" % name] = np.ma.getdata(a)
+        if np.ma.isMaskedArray(a): arrays["%s_mask" % name] = np.ma.getmaskarray(a)
+    tmp = "%s.%d.tmp" % (filename,os.getpid())
+    try:
+        with open(tmp,"wb") as f: np.savez(f,**arrays)
+        os.replace(tmp,filename)
+    except Exception:
+        logger.debug("[%s] Error writing the grid information %s" % (key,filename))
+        if os.path.isfile(tmp): os.remove(tmp)
+
+def _readFile(pathName,variable,altvars,area,initial_time,final_time,convert_calendar,lats,lons,shift,same_site_epsilon):
+    """Reads the portion of a model file relevant to extractTimeSeries.
+
+    This is a module level function so that it may be handed to a
+    process pool.
+
+    Returns
+    -------
+    var : ILAMB.Variable.Variable or None
+        the variable read from the file, shifted in time and
+        restricted to the given sites, or None if the file does not
+        contribute to the time frame or sites
+    """
+    var = Variable(filename       = pathName,
+                   variable_name  = variable,
+                   alternate_vars = altvars[1:],
+                   area           = area,
+                   convert_calendar = convert_calendar,
+                   t0             = initial_time - shift,
+                   tf             = final_time   - shift)
+    if var.time is None: return None
+    if ((var.time_bnds.max() < initial_time - shift) or
+        (var.time_bnds.min() >   final_time - shift)): return None
+    if lats is not None and var.ndata:
+        imin,rmin = NearestSites(var.lat,var.lon,lats,lons)
+        imin = imin[np.where(rmin<same_site_epsilon)]
+        if imin.size == 0:
+            return None
+        var.lat   = var.lat [  imin]
+        var.lon   = var.lon [  imin]
+        var.data  = var.data[:,imin]
+        var.ndata = var.data.shape[1]
+    if lats is not None and var.spatial: var = var.extractDatasites(lats,lons)
+    var.time      += shift
+    var.time_bnds += shift
+    return var
+
 class ModelResult():
     """A class for exploring model results.
 
@@ -56,8 +226,18 @@ class ModelResult():
     model_year : 2-tuple of int, optional
         used to shift model times, all model years at model_year[0]
         are shifted to model_year[1]
+    index_file : str, optional
+        the full path of a JSON file in which we store a summary of
+        each netCDF4 file in the model. If given, only files which
+        are new or whose modification time or size has changed since
+        the index was written will be opened when building the model.
+        The cell areas and land fractions are kept alongside it.
+    ingest_workers : int, optional
+        the number of processes used to read a variable which is
+        split across several files
     """
-    def __init__(self,path,modelname="unamed",color=(0,0,0),filter="",regex="",model_year=None):
+    def __init__(self,path,modelname="unamed",color=(0,0,0),filter="",regex="",model_year=None,index_file=None,
+                 ingest_workers=1):
         self.path           = path
         self.color          = color
         self.filter         = filter
@@ -73,6 +253,9 @@ class ModelResult():
         self.variables      = None
         self.names          = None
         self.extents        = np.asarray([[-90.,+90.],[-180.,+180.]])
+        self.index_file     = index_file
+        self.index          = {}
+        self.ingest_workers = ingest_workers
         self._findVariables()
         self._getGridInformation()
 
@@ -84,73 +267,93 @@ class ModelResult():
             s += "{0:>20}: {1:<50}".format(key,self.names[key]) + "\n"
         return s
 
+    def _loadIndex(self):
+        """Reads the file index from disk if it exists and belongs to this model path.
+        """
+        if self.index_file is None: return {}
+        if not os.path.isfile(self.index_file): return {}
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except:
+            logger.debug("[%s] Error reading the file index %s" % (self.name,self.index_file))
+            return {}
+        if index.get("path",None) != os.path.abspath(self.path): return {}
+        return index.get("files",{})
+
+    def _saveIndex(self):
+        """Writes the file index to disk, atomically so that concurrent writers are harmless.
+        """
+        if self.index_file is None: return
+        tmp = "%s.%d.tmp" % (self.index_file,os.getpid())
+        try:
+            with open(tmp,mode="w") as f:
+                json.dump({"path" : os.path.abspath(self.path),
+                           "files": self.index},f)
+            os.replace(tmp,self.index_file)
+        except:
+            logger.debug("[%s] Error writing the file index %s" % (self.name,self.index_file))
+            if os.path.isfile(tmp): os.remove(tmp)
+
     def _findVariables(self):
         """Loops through the netCDF4 files in a model's path and builds a dictionary of which variables are in which files.
-        """
-        def _get(key,dset):
-            dim_name = key
-            try:
-                v = dset.variables[key]
-                dim_bnd_name = v.getncattr("bounds")
-            except:
-                dim_bnd_name = None
-            return dim_name,dim_bnd_name
 
-        variables = {}
-        names     = {}
+        Only files not already summarized in the file index (or which
+        have changed on disk since) are opened, the rest of the
+        information is taken from the index.
+        """
+        old     = self._loadIndex()
+        index   = {}
+        changed = False
         for subdir, dirs, files in os.walk(self.path,followlinks=True):
             for fileName in files:
                 if not fileName.endswith(".nc"): continue
                 if self.filter not in fileName: continue
-                if self.regex is not "":
+                if self.regex != "":
                     m = re.search(self.regex,fileName)
                     if not m: continue
-                pathName  = os.path.join(subdir,fileName)
-
+                pathName = os.path.join(subdir,fileName)
                 try:
-                    dataset = Dataset(pathName)
+                    stat = os.stat(pathName)
+                except:
+                    continue
+                if pathName in old:
+                    entry = old[pathName]
+                    if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                        index[pathName] = entry
+                        continue
+                try:
+                    index[pathName] = _scanFile(pathName)
+                    changed = True
                 except:
                     logger.debug("[%s] Error opening file %s" % (self.name,pathName))
                     continue
+        if len(index) != len(old): changed = True
+        self.index = index
+        if changed: self._saveIndex()
 
-                # populate dictionary for which variables are in which files
-                for key in dataset.variables.keys():
-                    if key not in variables:
-                        variables[key] = []
-                    variables[key].append(pathName)
-
-                    v = dataset.variables[key]
-                    if key not in names:
-                        if "long_name" in v.ncattrs():
-                            names[key] = v.long_name
-                            continue
-                        if "standard_name" in v.ncattrs():
-                            names[key] = v.standard_name
-                            continue
+        # populate dictionary for which variables are in which files,
+        # os.walk order is preserved by the index
+        variables = {}
+        names     = {}
+        for pathName in index:
+            entry = index[pathName]
+            for key in entry["variables"]:
+                if key not in variables:
+                    variables[key] = []
+                variables[key].append(pathName)
+                if key not in names and entry["variables"][key]["name"] is not None:
+                    names[key] = entry["variables"][key]["name"]
 
         # determine spatial extents
-        lats = [key for key in variables.keys() if (key.lower().startswith("lat" ) or
-                                                    key.lower().  endswith("lat" ))]
-        lons = [key for key in variables.keys() if (key.lower().startswith("lon" ) or
-                                                    key.lower().  endswith("lon" ) or
-                                                    key.lower().startswith("long") or
-                                                    key.lower().  endswith("long"))]
-        for key in lats:
-            for pathName in variables[key]:
-                with Dataset(pathName) as dset:
-                    lat = dset.variables[key][...]
-                    if lat.size == 1: continue
-                    self.extents[0,0] = max(self.extents[0,0],lat.min())
-                    self.extents[0,1] = min(self.extents[0,1],lat.max())
-        for key in lons:
-            for pathName in variables[key]:
-                with Dataset(pathName) as dset:
-                    lon = dset.variables[key][...]
-                    if lon.size == 1: continue
-                    if lon.ndim < 1 or lon.ndim > 2: continue
-                    lon = (lon<=180)*lon + (lon>180)*(lon-360) + (lon<-180)*360
-                    self.extents[1,0] = max(self.extents[1,0],lon.min())
-                    self.extents[1,1] = min(self.extents[1,1],lon.max())
+        for pathName in index:
+            for key,(vmin,vmax) in index[pathName]["extents"].items():
+                if _isLat(key):
+                    self.extents[0,0] = max(self.extents[0,0],vmin)
+                    self.extents[0,1] = min(self.extents[0,1],vmax)
+                if _isLon(key):
+                    self.extents[1,0] = max(self.extents[1,0],vmin)
+                    self.extents[1,1] = min(self.extents[1,1],vmax)
 
         # fix extents
         eps = 5.
@@ -161,19 +364,25 @@ class ModelResult():
         self.variables = variables
         self.names = names
 
-    def _getGridInformation(self):
-        """Looks in the model output for cell areas as well as land fractions.
+    def _readGrid(self):
+        """Reads the cell areas and land fractions from the model files.
+
+        Returns
+        -------
+        cell_areas,land_fraction : numpy.ma.MaskedArray or None
+            the areas of the cells and the fraction of land in each,
+            None if not found in the model
         """
         def _shiftLon(lon):
             return (lon<=180)*lon + (lon>180)*(lon-360) + (lon<-180)*360
-        
+
         # Are there cell areas associated with this model?
         if "areacella" in self.variables.keys():
             with Dataset(self.variables["areacella"][0]) as f:
-                self.cell_areas = f.variables["areacella"][...]
+                cell_areas = f.variables["areacella"][...]
         else:
             if not ("lat_bnds" in self.variables.keys() and
-                    "lon_bnds" in self.variables.keys()): return
+                    "lon_bnds" in self.variables.keys()): return None,None
             with Dataset(self.variables["lat_bnds"][0]) as f:
                 x = f.variables["lat_bnds"][...]
             with Dataset(self.variables["lon_bnds"][0]) as f:
@@ -182,16 +391,37 @@ class ModelResult():
                 y = np.roll(_shiftLon(y),-s,axis=0)
                 if y[ 0,0] > y[ 0,1]: y[ 0,0] = -180.
                 if y[-1,0] > y[-1,1]: y[-1,1] = +180.
-            self.cell_areas = il.CellAreas(None,None,lat_bnds=x,lon_bnds=y)
-            
+            cell_areas = il.CellAreas(None,None,lat_bnds=x,lon_bnds=y)
+
         # Now we do the same for land fractions
-        if "sftlf" not in self.variables.keys():
+        if "sftlf" not in self.variables.keys(): return cell_areas,None
+        with Dataset(self.variables["sftlf"][0]) as f:
+            land_fraction = f.variables["sftlf"][...]
+        # some models represent the fraction as a percent
+        if np.ma.max(land_fraction) > 10: land_fraction *= 0.01
+        return cell_areas,land_fraction
+
+    def _getGridInformation(self):
+        """Looks in the model output for cell areas as well as land fractions.
+
+        If the model has a file index, the areas and fractions are
+        kept in a companion file of the index along with the
+        modification time and size of the files they were read
+        from. They are read again only if the index records that these
+        files have changed.
+        """
+        sources = [self.variables[key][0] for key in ["areacella","lat_bnds","lon_bnds","sftlf"] if key in self.variables]
+        key     = json.dumps([[p,self.index.get(p,{}).get("mtime"),self.index.get(p,{}).get("size")] for p in sources])
+        cache   = None if self.index_file is None else "%s_grid.npz" % os.path.splitext(self.index_file)[0]
+        grid    = _loadGrid(cache,key)
+        if grid is None:
+            grid = self._readGrid()
+            _saveGrid(cache,key,grid)
+        self.cell_areas,self.land_fraction = grid
+        if self.cell_areas is None: return
+        if self.land_fraction is None:
             self.land_areas = self.cell_areas
         else:
-            with Dataset(self.variables["sftlf"][0]) as f:
-                self.land_fraction = f.variables["sftlf"][...]                
-            # some models represent the fraction as a percent
-            if np.ma.max(self.land_fraction) > 10: self.land_fraction *= 0.01
             with np.errstate(over='ignore',under='ignore'):
                 if not np.allclose(self.cell_areas.shape,self.land_fraction.shape):
                     msg = "The model %s has areacella %s which is a different shape than sftlf %s" % (self.name,
@@ -202,7 +432,62 @@ class ModelResult():
         self.land_area = np.ma.sum(self.land_areas)
         return
 
-    def extractTimeSeries(self,variable,lats=None,lons=None,alt_vars=[],initial_time=-1e20,final_time=1e20,output_unit="",expression=None,convert_calendar=True):
+    def _timeExtent(self,pathName):
+        """Returns the time extent and native calendar of a file.
+
+        The extent is taken from the file index, and if the file is
+        not yet indexed, it is summarized (reading only the time and
+        coordinate variables) and added to the index.
+
+        Parameters
+        ----------
+        pathName : str
+            the full path of the netCDF4 file
+
+        Returns
+        -------
+        extent : list of 2 floats or None
+            the minimum and maximum time bound in days since 1850-1-1
+            on the noleap calendar, None if the file has no time
+        calendar : str or None
+            the calendar as given in the file
+        """
+        if pathName not in self.index:
+            try:
+                self.index[pathName] = _scanFile(pathName)
+            except:
+                return None,None
+        entry = self.index[pathName]
+        return entry["time"],entry["calendar"]
+
+    def _timeCount(self,pathName,altvars,t0,tf,convert_calendar):
+        """Returns the number of times a file contributes to the given time frame.
+
+        If the file lies completely inside the time frame, the count
+        is the size of its time dimension as recorded in the file
+        index. Otherwise only the time variables are read to
+        determine the count.
+        """
+        extent,calendar = self._timeExtent(pathName)
+        entry = self.index.get(pathName,None)
+        if (entry is not None and extent is not None and
+            (convert_calendar or calendar in ["noleap","365_day"]) and
+            extent[0] >= t0 and extent[1] <= tf):
+            for v in altvars:
+                if v not in entry["variables"]: continue
+                tname = [d for d in entry["variables"][v]["dimensions"] if "time" in d.lower()]
+                if len(tname) == 1: return entry["dimensions"][tname[0]]
+                break
+        with Dataset(pathName) as dset:
+            for v in altvars:
+                if v not in dset.variables: continue
+                t,tb,cb,begin,end,cal = il.GetTime(dset.variables[v],t0=t0,tf=tf,convert_calendar=convert_calendar)
+                if t is None: return 0
+                if ((tb.max() < t0) or (tb.min() > tf)): return 0
+                return t.size
+        return 0
+
+    def extractTimeSeries(self,variable,lats=None,lons=None,alt_vars=[],initial_time=-1e20,final_time=1e20,output_unit="",expression=None,convert_calendar=True,mem_slab=None):
         """Extracts a time series of the given variable from the model.
 
         Parameters
@@ -224,10 +509,15 @@ class ModelResult():
             a 1D array of longitude locations at which to extract information
         expression : str, optional
             an algebraic expression describing how to combine model outputs
+        mem_slab : float, optional
+            if given and the variable is read from files (not at sites
+            nor derived from an expression), the data is not read but
+            left in the files and a ILAMB.Variable.LazyVariable is
+            returned whose chunks of times use about this memory [Mb]
 
         Returns
         -------
-        var : ILAMB.Variable.Variable
+        var : ILAMB.Variable.Variable or ILAMB.Variable.LazyVariable
             the extracted variable
 
         """
@@ -248,35 +538,61 @@ class ModelResult():
         same_site_epsilon = 0.5
         for v in altvars:
             if v not in self.variables: continue
+            files = []
             for ifile,pathName in enumerate(self.variables[v]):
-                if _skipFile(pathName,altvars,lats,lons,same_site_epsilon): continue
-                var = Variable(filename       = pathName,
-                               variable_name  = variable,
-                               alternate_vars = altvars[1:],
-                               area           = self.land_areas,
-                               convert_calendar = convert_calendar,
-                               t0             = initial_time - self.shift,
-                               tf             = final_time   - self.shift)
-                if var.time is None: continue
-                tmin = min(tmin,var.time_bnds.min())
-                tmax = max(tmax,var.time_bnds.max())
-                if ((var.time_bnds.max() < initial_time - self.shift) or
-                    (var.time_bnds.min() >   final_time - self.shift)): continue
-                if lats is not None and var.ndata:
-                    r = np.sqrt((lats[:,np.newaxis]-var.lat)**2 +
-                                (lons[:,np.newaxis]-var.lon)**2)
-                    imin = r.argmin(axis=1)
-                    rmin = r.   min(axis=1)
-                    imin = imin[np.where(rmin<same_site_epsilon)]
-                    if imin.size == 0:
-                        continue
-                    var.lat   = var.lat [  imin]
-                    var.lon   = var.lon [  imin]
-                    var.data  = var.data[:,imin]
-                    var.ndata = var.data.shape[1]
-                if lats is not None and var.spatial: var = var.extractDatasites(lats,lons)
-                var.time      += self.shift
-                var.time_bnds += self.shift
+                if _skipFile(pathName,altvars,lats,lons,same_site_epsilon,
+                             entry=self.index.get(pathName,None)): continue
+
+                # skip files which lie entirely outside the time frame
+                # without reading them, the extent of files on
+                # calendars we do not convert is not comparable
+                extent,calendar = self._timeExtent(pathName)
+                if extent is not None and (convert_calendar or calendar in ["noleap","365_day"]):
+                    tmin = min(tmin,extent[0])
+                    tmax = max(tmax,extent[1])
+                    if ((extent[1] < initial_time - self.shift) or
+                        (extent[0] >   final_time - self.shift)): continue
+                files.append(pathName)
+
+            # leave the data in the files if asked
+            if mem_slab is not None and lats is None and len(files) > 0:
+                try:
+                    return LazyVariable(filename         = files,
+                                        variable_name    = variable,
+                                        alternate_vars   = altvars[1:],
+                                        area             = self.land_areas,
+                                        t0               = initial_time,
+                                        tf               = final_time,
+                                        shift            = self.shift,
+                                        convert_calendar = convert_calendar,
+                                        mem_slab         = mem_slab)
+                except il.VarNotInModel:
+                    continue
+
+            # read the files, in parallel if we can determine in
+            # advance where each file's data belongs
+            extents = [self._timeExtent(pathName)[0] for pathName in files]
+            if (self.ingest_workers > 1 and len(files) > 1 and lats is None and
+                None not in extents):
+                files  = [pathName for extent,pathName in sorted(zip(extents,files))]
+                counts = [self._timeCount(pathName,altvars,initial_time-self.shift,final_time-self.shift,convert_calendar)
+                          for pathName in files]
+                args   = [(pathName,variable,altvars,self.land_areas,initial_time,final_time,
+                           convert_calendar,lats,lons,self.shift,same_site_epsilon)
+                          for pathName,count in zip(files,counts) if count > 0]
+                counts = [count for count in counts if count > 0]
+                if len(args) > 1:
+                    try:
+                        return il.CombineVariablesFromFiles(_readFile,args,counts,
+                                                            workers = self.ingest_workers)
+                    except il.IngestError:
+                        logger.debug("[%s] Parallel ingest of [%s] failed, reading serially" % (self.name,v))
+            for pathName in files:
+                var = _readFile(pathName,variable,altvars,self.land_areas,initial_time,final_time,
+                                convert_calendar,lats,lons,self.shift,same_site_epsilon)
+                if var is None: continue
+                tmin = min(tmin,var.time_bnds.min()-self.shift)
+                tmax = max(tmax,var.time_bnds.max()-self.shift)
                 V.append(var)
             if len(V) > 0: break
 
@@ -11,7 +11,8 @@ class Regions(object):
     the Global Fire Emissions Database (GFED) is included by default.
 
     """
-    _regions = {}
+    _regions  = {}
+    _versions = {} # bumped when a region is redefined, part of the keys of its cached masks
 
     @property
     def regions(self):
@@ -39,6 +40,7 @@ class Regions(object):
                            [1,0,1],
                            [1,1,1]],dtype=bool)
         Regions._regions[label] = [name,lat,lon,mask]
+        self._forget(label)
 
     def addRegionNetCDF4(self,filename):
         """Add regions found in a netCDF4 file.
@@ -103,9 +105,20 @@ class Regions(object):
                     name  = nam[i]
                     mask  = v[...].data != i
                     Regions._regions[label] = [name,lat,lon,mask]
+                    self._forget(label)
                     labels.append(label)
         return labels
 
+    def _forget(self,label):
+        """Invalidates the cached masks of the given region."""
+        Regions._versions[label] = Regions._versions.get(label,0) + 1
+
+    def _key(self,labels,var):
+        """The key of the cached masks or weights of the given regions on the grid of var."""
+        from . import ilamblib as il
+        return (tuple((label,Regions._versions.get(label,0)) for label in labels),
+                il._gridHash(var.lat,var.lon),bool(var.ndata))
+
     def getRegionName(self,label):
         """Given the region label, return the full name.
 
@@ -134,20 +147,52 @@ class Regions(object):
         Returns
         -------
         mask : numpy.ndarray
-            a boolean array appropriate for masking the input variable data
+            a read-only boolean array appropriate for masking the input variable data
         """
+        from . import ilamblib as il
+        return il._regridCached(("regionmask",)+self._key([label],var),lambda: self._buildMask(label,var))
+
+    def _buildMask(self,label,var):
+        from . import ilamblib as il
         name,lat,lon,mask = Regions._regions[label]
         if lat.size == 4 and lon.size == 4:
             # if lat/lon bounds, find which bounds we are in
-            rows = ((var.lat[:,np.newaxis]>=lat[:-1])*(var.lat[:,np.newaxis]<=lat[1:])).argmax(axis=1)
-            cols = ((var.lon[:,np.newaxis]>=lon[:-1])*(var.lon[:,np.newaxis]<=lon[1:])).argmax(axis=1)
+            def _bounds(x,b):
+                return ((x[:,np.newaxis]>=b[:-1])*(x[:,np.newaxis]<=b[1:])).argmax(axis=1)
+            rows = il._regridCached(("bounds",il._gridHash(lat),il._gridHash(var.lat)),lambda: _bounds(var.lat,lat))
+            cols = il._regridCached(("bounds",il._gridHash(lon),il._gridHash(var.lon)),lambda: _bounds(var.lon,lon))
         else:
             # if more globally defined, nearest neighbor is fine
-            rows = (np.abs(lat[:,np.newaxis]-var.lat)).argmin(axis=0)
-            cols = (np.abs(lon[:,np.newaxis]-var.lon)).argmin(axis=0)
-        if var.ndata: return mask[np.ix_(rows,cols)].diagonal()
+            rows = il.NearestIndices(lat,var.lat)
+            cols = il.NearestIndices(lon,var.lon)
+        if var.ndata: return mask[rows,cols]
         return mask[np.ix_(rows,cols)]
 
+    def getWeights(self,labels,var):
+        """Given a list of region labels and a ILAMB.Variable, return the stacked region weights.
+
+        The weights are 1 inside and 0 outside of each region, such
+        that the integrals of a field over all the regions may be
+        computed by a single contraction, for example
+        np.tensordot(data*areas,weights,axes=([-2,-1],[-2,-1])).
+
+        Parameters
+        ----------
+        labels : list of str
+            the unique region identifiers
+        var : ILAMB.Variable.Variable
+            the variable to which we would like to apply the weights
+
+        Returns
+        -------
+        weights : numpy.ndarray
+            a read-only array of shape (len(labels),)+ the spatial
+            shape of the variable
+        """
+        from . import ilamblib as il
+        return il._regridCached(("regionweights",)+self._key(labels,var),
+                                lambda: np.asarray([self.getMask(label,var)==False for label in labels],dtype=float))
+
     def hasData(self,label,var):
         """Checks if the ILAMB.Variable has data on the given region.
 
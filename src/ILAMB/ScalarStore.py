@@ -0,0 +1,117 @@
+from .Confrontation import LoadSummary,DecodeArray
+from .Regions import Regions
+import numpy as np
+import sqlite3,glob,os
+
+class ScalarStore(object):
+    """A consolidated table of the scalars of all results files of a study.
+
+    The dashboard, the score dumps and ilamb-table all need the
+    scalars of every model in every confrontation. Rather than opening
+    each results file, they query a single SQLite table whose rows are
+    the scalars, with columns::
+
+      confrontation, path, file, model, section, name, metric, region, unit, value
+
+    where name is the full name of the scalar in the results file
+    (e.g. 'Bias Score global'), metric is the name without the region
+    and section is the group of the results file ('MeanState' or
+    'Relationships'). The table is brought up to date with the results
+    files by calling update, which reads only the results files
+    written since the last update (see ILAMB.Confrontation.LoadSummary).
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the SQLite database
+    """
+    def __init__(self,filename):
+        self.filename = filename
+        self.db       = sqlite3.connect(filename,timeout=60.)
+        self.db.executescript("""
+          CREATE TABLE IF NOT EXISTS files   (file TEXT PRIMARY KEY, path TEXT, mtime INTEGER, size INTEGER);
+          CREATE TABLE IF NOT EXISTS scalars (confrontation TEXT, path TEXT, file TEXT, model TEXT, section TEXT,
+                                              name TEXT, metric TEXT, region TEXT, unit TEXT, value REAL);
+          CREATE INDEX IF NOT EXISTS scalars_path ON scalars (path, section);
+          CREATE INDEX IF NOT EXISTS scalars_name ON scalars (name);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        """Closes the connection to the database."""
+        self.db.close()
+
+    def _remove(self,fname):
+        self.db.execute("DELETE FROM scalars WHERE file = ?",(fname,))
+        self.db.execute("DELETE FROM files   WHERE file = ?",(fname,))
+
+    def _insert(self,c,path,fname):
+        summary = LoadSummary(fname)
+        regions = list(Regions().regions)
+        model   = summary["attrs"].get("name",None)
+        rows    = []
+        for section,group in summary["groups"].items():
+            if "scalars" not in group: continue
+            for name,var in group["scalars"].items():
+                data = DecodeArray(var["data"])
+                if data.size != 1: continue
+                value  = None if np.ma.getmaskarray(data).all() else float(data.flatten()[0])
+                metric = name
+                region = "global"
+                for r in regions:
+                    if name.endswith(" %s" % r):
+                        metric = name[:-(len(r)+1)]
+                        region = r
+                        break
+                rows.append((c.longname,path,fname,model,section,name,metric,region,var["units"],value))
+        self.db.executemany("INSERT INTO scalars VALUES (?,?,?,?,?,?,?,?,?,?)",rows)
+        mtime,size = summary["source"]
+        self.db.execute("INSERT INTO files VALUES (?,?,?,?)",(fname,path,mtime,size))
+
+    def update(self,confrontations):
+        """Brings the table up to date with the results files of the confrontations.
+
+        Parameters
+        ----------
+        confrontations : list of ILAMB.Confrontation.Confrontation
+            the confrontations whose results files are scanned
+        """
+        with self.db:
+            for c in confrontations:
+                path  = os.path.normpath(c.output_path)
+                known = dict([(row[0],tuple(row[1:])) for row in
+                              self.db.execute("SELECT file,mtime,size FROM files WHERE path = ?",(path,))])
+                files = glob.glob(os.path.join(path,"*.nc"))
+                for fname in files:
+                    stat = os.stat(fname)
+                    if known.get(fname,None) == (stat.st_mtime_ns,stat.st_size): continue
+                    self._remove(fname)
+                    self._insert(c,path,fname)
+                for fname in set(known.keys()).difference(files):
+                    self._remove(fname)
+
+    def select(self,columns,**where):
+        """Returns the rows of the table which match the given columns.
+
+        Parameters
+        ----------
+        columns : list of str
+            the columns to return
+        where : keywords
+            values of columns which the rows must match, for example
+            section="MeanState". The path is normalized.
+
+        Returns
+        -------
+        rows : list of tuple
+            the matching rows, in the order in which they were added
+        """
+        if "path" in where: where["path"] = os.path.normpath(where["path"])
+        sql = "SELECT %s FROM scalars" % (",".join(columns))
+        if len(where) > 0: sql += " WHERE " + " AND ".join(["%s = ?" % key for key in where])
+        return self.db.execute(sql + " ORDER BY rowid",tuple(where.values())).fetchall()
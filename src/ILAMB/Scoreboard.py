@@ -12,12 +12,12 @@ from .ConfCO2 import ConfCO2
 from .ConfSoilCarbon import ConfSoilCarbon
 from .ConfUncertainty import ConfUncertainty
 from .Regions import Regions
+from .ScalarStore import ScalarStore
 import os,re
-from netCDF4 import Dataset
 import numpy as np
 from .Post import BenchmarkSummaryFigure
 from .ilamblib import MisplacedData
-import glob,json
+import json
 
 global_print_node_string  = ""
 global_confrontation_list = []
@@ -212,22 +212,16 @@ def BuildScalars(node):
     if node.name is None: return
     global scalars
     global models
-    global global_scores
     global section
     s = getDict(node,scalars)
     if node.isLeaf():
-        files = [f for f in glob.glob(os.path.join(node.output_path,"*.nc")) if "Benchmark" not in f]
-        for fname in files:
-            with Dataset(fname) as dset:
-                if dset.name not in models: continue
-                if section not in dset.groups: continue
-                grp = dset.groups[section]["scalars"]
-                scores = [c for c in grp.variables.keys() if "Score" in c]
-                global_scores += [c for c in scores if ((c not in global_scores) and ("global" in c))]
-                for c in scores:
-                    if c not in s.keys():
-                        s[c] = np.ma.masked_array(np.zeros(len(models)),mask=np.ones(len(models),dtype=bool))
-                    s[c][models.index(dset.name)] = grp[c][...]
+        for model,c,value in store.select(["model","name","value"],path=node.output_path,section=section):
+            if model not in models: continue
+            if "Score" not in c: continue
+            if c not in global_scores and "global" in c: global_scores.append(c)
+            if c not in s.keys():
+                s[c] = np.ma.masked_array(np.zeros(len(models)),mask=np.ones(len(models),dtype=bool))
+            s[c][models.index(model)] = np.ma.masked if value is None else value
     else:
         scores = None
         for child in node.children:
@@ -250,29 +244,35 @@ def ConvertList(node):
         x.data[x.mask] = -999
         s[key] = list(x.data)
 
-def CompositeScores(tree,M):
+def CompositeScores(tree,M,store):
     global global_model_list
     global_model_list = M
+    names  = [m.name for m in M]
+    scores = {}
+    for path,model,value in store.select(["path","model","value"],section="MeanState",name="Overall Score global"):
+        if model not in names: continue
+        if path not in scores: scores[path] = {}
+        scores[path][model] = value
+    files = {}
+    for path,model in store.db.execute("SELECT DISTINCT path,model FROM scalars WHERE section = 'MeanState'"):
+        if path not in files: files[path] = []
+        files[path].append(model)
     def _loadScores(node):
         if node.isLeaf():
             if node.confrontation is None: return
+            path = os.path.normpath(node.confrontation.output_path)
+            if len([m for m in files.get(path,[]) if m in names]) == 0: return
             data = np.zeros(len(global_model_list))
             mask = np.ones (len(global_model_list),dtype=bool)
             for ind,m in enumerate(global_model_list):
-                fname = "%s/%s_%s.nc" % (node.confrontation.output_path,node.confrontation.name,m.name)
-                if os.path.isfile(fname):
-                    try:
-                        dataset = Dataset(fname)
-                        grp     = dataset.groups["MeanState"].groups["scalars"]
-                    except:
-                        continue
-                    if "Overall Score global" in grp.variables:
-                        data[ind] = grp.variables["Overall Score global"][0]
-                        mask[ind] = 0
-                    else:
-                        data[ind] = -999.
-                        mask[ind] = 1
-                    node.score = np.ma.masked_array(data,mask=mask)
+                value = scores.get(path,{}).get(m.name,None)
+                if value is not None:
+                    data[ind] = value
+                    mask[ind] = 0
+                else:
+                    data[ind] = -999.
+                    mask[ind] = 1
+            node.score = np.ma.masked_array(data,mask=mask)
         else:
             node.score  = 0
             sum_weights = 0
@@ -368,6 +368,23 @@ class Scoreboard():
         TraversePreorder(self.tree,PrintNode)
         return global_print_node_string
 
+    def scalarStore(self,filename="scalars.db"):
+        """Returns the store of the scalars of this study, updated with the latest results.
+
+        Parameters
+        ----------
+        filename : str, optional
+            the name of the SQLite database in the build directory
+
+        Returns
+        -------
+        store : ILAMB.ScalarStore.ScalarStore
+            the store of scalars, which the caller closes
+        """
+        store = ScalarStore(os.path.join(self.build_dir,filename))
+        store.update(self.list())
+        return store
+
     def list(self):
         def _hasConfrontation(node):
             global global_confrontation_list
@@ -384,19 +401,21 @@ class Scoreboard():
         global models
         global global_scores
         global section
+        global store
         rel_tree = GenerateRelationshipTree(self,M)
         global_scores = []
         models  = [m.name for m in M]
         scalars = {}
-        TraversePreorder (self.tree,BuildDictionary)
-        section = "MeanState"    ; TraversePostorder(self.tree,BuildScalars)
-        TraversePreorder (self.tree,ConvertList)
-        check = rel_tree.children
-        if len(check) > 0: check = check[0]
-        if len(check.children) > 0:
-            TraversePreorder(rel_tree,BuildDictionary)
-            section = "Relationships"; TraversePostorder(rel_tree,BuildScalars)
-            TraversePreorder(rel_tree,ConvertList)
+        with self.scalarStore() as store:
+            TraversePreorder (self.tree,BuildDictionary)
+            section = "MeanState"    ; TraversePostorder(self.tree,BuildScalars)
+            TraversePreorder (self.tree,ConvertList)
+            check = rel_tree.children
+            if len(check) > 0: check = check[0]
+            if len(check.children) > 0:
+                TraversePreorder(rel_tree,BuildDictionary)
+                section = "Relationships"; TraversePostorder(rel_tree,BuildScalars)
+                TraversePreorder(rel_tree,ConvertList)
         with open(os.path.join(self.build_dir,filename),mode='w') as f:
             json.dump(scalars, f)
         return global_scores,rel_tree
@@ -737,7 +756,8 @@ class Scoreboard():
 
     def dumpScores(self,M,filename):
         
-        CompositeScores(self.tree,M)
+        with self.scalarStore() as store:
+            CompositeScores(self.tree,M,store)
         with open("%s/%s" % (self.build_dir,filename),"w") as out:
             out.write("Variables,%s\n" % (",".join([m.name for m in M])))
             for cat in self.tree.children:
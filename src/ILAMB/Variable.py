@@ -6,7 +6,9 @@ import cartopy.feature as cfeature
 from pylab import get_cmap
 from cf_units import Unit
 from . import ilamblib as il
+from .spatial import NearestAxisIndex
 from . import Post as post
+from netCDF4 import Dataset
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -35,6 +37,119 @@ def _createBnds(x):
         x_bnds[ 0,0] = x[ 0] - 0.5*(x[ 1]-x[ 0])
         x_bnds[-1,1] = x[-1] + 0.5*(x[-1]-x[-2])
     return x_bnds
+
+def _timeOverlap(intervals,time_bnds):
+    """Returns the lengths of time each interval shares with each time bound.
+
+    Parameters
+    ----------
+    intervals : numpy.ndarray
+        the (n,2) array of intervals
+    time_bnds : numpy.ndarray
+        the (m,2) array of time bounds
+
+    Returns
+    -------
+    overlap : scipy.sparse.csr_matrix
+        the (n,m) matrix whose entry (i,j) is the length of the
+        intersection of interval i and bound j, stored only where
+        they intersect as in Variable.integrateInTime
+    """
+    from scipy.sparse import csr_matrix
+    t0,tf = intervals[:,0],intervals[:,1]
+    b0,b1 = time_bnds[:,0],time_bnds[:,1]
+    if (np.diff(b0) >= 0).all() and (np.diff(b1) >= 0).all():
+        lo     = np.searchsorted(b1,t0,side="right")
+        hi     = np.maximum(np.searchsorted(b0,tf,side="left"),lo)
+        counts = hi-lo
+        rows   = np.repeat(np.arange(t0.size),counts)
+        cols   = np.arange(counts.sum()) + np.repeat(lo-(np.cumsum(counts)-counts),counts)
+    else:
+        rows,cols = np.nonzero((t0[:,np.newaxis] < b1)*(tf[:,np.newaxis] > b0))
+    dt = np.minimum(b1[cols],tf[rows])-np.maximum(b0[cols],t0[rows])
+    return csr_matrix((dt,(rows,cols)),shape=(t0.size,b0.size))
+
+def _integrateOverlap(overlap,data,mean=False):
+    """Integrates the data over the intervals of an overlap matrix.
+
+    Applies the overlap matrix of _timeOverlap to the first axis of
+    the data, with the masking of Variable.integrateInTime: masked
+    values are left out and the result is masked where all the values
+    in an interval are masked. If a mean, the integral is divided by
+    the non-masked amount of time.
+
+    Parameters
+    ----------
+    overlap : scipy.sparse.csr_matrix
+        the (n,m) overlap matrix
+    data : numpy.ma.MaskedArray
+        the data whose first dimension is of size m
+    mean : bool, optional
+        enable to divide by the non-masked amount of time
+
+    Returns
+    -------
+    integral : numpy.ma.MaskedArray
+        the integrals whose first dimension is of size n
+    """
+    shp  = (overlap.shape[0],) + data.shape[1:]
+    x    = np.ma.filled(data,0).reshape((data.shape[0],-1))
+    m    = np.ma.getmaskarray(data).reshape(x.shape)
+    with np.errstate(over='ignore',under='ignore'):
+        integral = overlap.dot(x)
+        count    = (overlap != 0).astype(int).dot((m==0).astype(int))
+        mask     = (count == 0)
+        if mean:
+            dt   = overlap.dot((m==0).astype(float))
+            mask = mask + (dt == 0)
+            integral[mask==False] /= dt[mask==False]
+    return np.ma.masked_array(integral.reshape(shp),mask=mask.reshape(shp))
+
+def _integrateRegions(data,measure,weights,mean=False,intabs=False,varying=False):
+    """Integrates the data over all the regions of the stacked weights in a single contraction.
+
+    Parameters
+    ----------
+    data : numpy.ma.masked_array
+        the data whose trailing dimensions are those of the measure
+    measure : numpy.ma.masked_array
+        the cell areas (or site weights), masked where not to be included
+    weights : numpy.ndarray
+        the region weights as returned by Regions.getWeights
+    mean : bool, optional
+        enable to divide by the non-masked measure of each region
+    intabs : bool, optional
+        enable to integrate the absolute value
+    varying : bool, optional
+        enable to divide by the measure where the data is not masked,
+        rather than the measure itself
+
+    Returns
+    -------
+    integrals : numpy.ma.masked_array
+        the integrals whose leading dimension is over the regions
+    """
+    nd      = weights.ndim-1
+    axes    = (list(range(-nd,0)),list(range(-nd,0)))
+    keep    = weights*(np.ma.getmaskarray(measure)==False)
+    measure = keep*np.ma.filled(measure,0)
+    valid   = (np.ma.getmaskarray(data)==False)
+    x       = np.ma.filled(data,0)
+    if intabs: x = np.abs(x)
+    with np.errstate(over='ignore',under='ignore'):
+        integral = np.tensordot(x    ,measure,axes=axes)
+        count    = np.tensordot(valid,keep   ,axes=axes)
+        if mean and varying: area = np.tensordot(valid,measure,axes=axes)
+    integral = np.moveaxis(np.ma.masked_array(integral,mask=(count==0)),-1,0)
+    if mean:
+        if varying:
+            area = np.moveaxis(area,-1,0)
+        else:
+            area = measure.sum(axis=tuple(range(1,nd+1)))
+            area = area.reshape(area.shape+(1,)*(integral.ndim-1))
+        with np.errstate(under='ignore',invalid='ignore',divide='ignore'):
+            integral = integral / np.ma.masked_equal(area,0)
+    return integral
         
 class Variable:
     r"""A class for managing variables and their analysis.
@@ -337,7 +452,7 @@ class Variable:
         # the integrated array should be masked where *all* data in time was previously masked
         mask = False
         if self.data.ndim > 1 and self.data.mask.size > 1:
-            mask = np.apply_along_axis(np.all,0,self.data.mask[ind])
+            mask = self.data.mask[ind].all(axis=0)
         integral = np.ma.masked_array(integral,mask=mask,copy=False)
             
         # handle units
@@ -469,7 +584,7 @@ class Variable:
         # the integrated array should be masked where *all* data in depth was previously masked
         mask = False
         if self.data.ndim > 1 and self.data.mask.size > 1:
-            mask = np.apply_along_axis(np.all,axis,self.data.mask[ind])
+            mask = self.data.mask[ind].all(axis=axis)
         integral = np.ma.masked_array(integral,mask=mask,copy=False)
 
         # handle units
@@ -509,7 +624,7 @@ class Variable:
                         area       = self.area,
                         ndata      = self.ndata)
 
-    def integrateInSpace(self,region=None,mean=False,weight=None,intabs=False):
+    def integrateInSpace(self,region=None,mean=False,weight=None,intabs=False,regions=None):
         r"""Integrates the variable over a given region.
 
         Uses nodal integration to integrate to approximate
@@ -557,12 +672,16 @@ class Variable:
             representing an additional weight in the integrand
         intabs : bool, optional
             enable to integrate the absolute value
+        regions : list of str, optional
+            names of regions overwhich you wish to integrate, all at
+            once, in place of a single region
 
         Returns
         -------
-        integral : ILAMB.Variable.Variable
+        integral : ILAMB.Variable.Variable or dict
             a Variable instace with the integrated value along with the
-            appropriate name and unit change.
+            appropriate name and unit change, or if regions are given,
+            a dictionary of these Variables whose keys are the regions
 
         """
         def _integrate(var,areas):
@@ -585,57 +704,83 @@ class Variable:
         # if we want to integrate over a region, we need add to the
         # measure's mask
         r = Regions()
-        if region is not None: measure.mask += r.getMask(region,self)
+        batched = regions is not None
+        if batched:
+            integrals = _integrateRegions(self.data,measure,r.getWeights(regions,self),mean=mean,intabs=intabs)
+        else:
+            if region is not None: measure.mask += r.getMask(region,self)
 
-        # approximate the integral
-        integral = _integrate(self.data,measure)
-        if mean:
-            np.seterr(under='ignore',invalid='ignore')
-            integral = integral / measure.sum()
-            np.seterr(under='raise',invalid='warn')
+            # approximate the integral
+            integral = _integrate(self.data,measure)
+            if mean:
+                np.seterr(under='ignore',invalid='ignore')
+                integral = integral / measure.sum()
+                np.seterr(under='raise',invalid='warn')
+            regions   = [region]
+            integrals = [integral]
 
         # handle the name and unit
-        name = self.name + "_integrated_over_space"
-        if region is not None: name = name.replace("space",region)
         unit = Unit(self.unit)
-        if mean:
-
-            # we have already divided thru by the non-masked area in
-            # units of m^2, which are the same units of the integrand.
-            name += "_and_divided_by_area"
-        else:
+        if not mean:
 
             # if not a mean, we need to potentially handle unit conversions
             unit *= Unit("m2")
-
-        return Variable(data       = np.ma.masked_array(integral),
-                        unit       = "%s" % unit,
-                        time       = self.time,
-                        time_bnds  = self.time_bnds,
-                        depth      = self.depth,
-                        depth_bnds = self.depth_bnds,
-                        name       = name)
-
-    def siteStats(self,region=None,weight=None,intabs=False):
+        output = {}
+        for region,integral in zip(regions,integrals):
+            name = self.name + "_integrated_over_space"
+            if region is not None: name = name.replace("space",region)
+
+            # if a mean, we have already divided thru by the
+            # non-masked area in units of m^2, which are the same
+            # units of the integrand.
+            if mean: name += "_and_divided_by_area"
+            output[region] = Variable(data       = np.ma.masked_array(integral),
+                                      unit       = "%s" % unit,
+                                      time       = self.time,
+                                      time_bnds  = self.time_bnds,
+                                      depth      = self.depth,
+                                      depth_bnds = self.depth_bnds,
+                                      name       = name)
+        if batched: return output
+        return output[region]
+
+    def siteStats(self,region=None,weight=None,intabs=False,regions=None):
         """Computes the mean and standard deviation of the variable over all data sites.
 
         Parameters
         ----------
         region : str, optional
             name of the region overwhich you wish to include stats.
+        regions : list of str, optional
+            names of regions overwhich you wish to include stats, all
+            at once, in place of a single region
 
         Returns
         -------
-        mean : ILAMB.Variable.Variable
-            a Variable instace with the mean values
+        mean : ILAMB.Variable.Variable or dict
+            a Variable instace with the mean values, or if regions are
+            given, a dictionary of these Variables whose keys are the
+            regions
 
         """
         if self.ndata is None: raise il.NotDatasiteVariable()
+        r = Regions()
+        if regions is not None:
+            measure = np.ma.masked_array(np.ones(self.ndata) if weight is None else weight)
+            means   = _integrateRegions(self.data,measure,r.getWeights(regions,self),
+                                        mean=True,intabs=intabs,varying=True)
+            return dict([(region,Variable(data       = mean,
+                                          unit       = self.unit,
+                                          time       = self.time,
+                                          time_bnds  = self.time_bnds,
+                                          depth      = self.depth,
+                                          depth_bnds = self.depth_bnds,
+                                          name       = "mean_%s_over_%s" % (self.name,region)))
+                         for region,mean in zip(regions,means)])
         op = lambda x : x
         if intabs: op = np.abs
         rem_mask = np.copy(self.data.mask)
         rname = ""
-        r = Regions()
         if region is not None:
             self.data.mask += r.getMask(region,self)
             rname = "_over_%s" % region
@@ -699,11 +844,10 @@ class Variable:
             The times of the extrema computed
         """
         if not self.temporal: raise il.NotTemporalVariable()
-        fcn = {"max":np.argmax,"min":np.argmin}
-        assert etype in fcn.keys()
-        tid  = np.apply_along_axis(fcn[etype],0,self.data)
+        assert etype in ["max","min"]
+        tid  = self.data.argmax(axis=0) if etype == "max" else self.data.argmin(axis=0)
         mask = False
-        if self.data.ndim > 1 and self.data.mask.ndim > 0: mask = np.apply_along_axis(np.all,0,self.data.mask) # mask cells where all data is masked
+        if self.data.ndim > 1 and self.data.mask.ndim > 0: mask = self.data.mask.all(axis=0) # mask cells where all data is masked
         data = np.ma.masked_array(self.time[tid],mask=mask)
         return Variable(data       = data,
                         unit       = "d",
@@ -734,8 +878,8 @@ class Variable:
         """
         assert lat.size == lon.size
         if not self.spatial: raise il.NotSpatialVariable()
-        ilat = np.apply_along_axis(np.argmin,1,np.abs(lat[:,np.newaxis]-self.lat))
-        ilon = np.apply_along_axis(np.argmin,1,np.abs(lon[:,np.newaxis]-self.lon))
+        ilat = NearestAxisIndex(self.lat,lat)
+        ilon = NearestAxisIndex(self.lon,lon)
         ndata = lat.size
         if self.data.ndim == 2:
             data  = self.data[    ilat,ilon]
@@ -850,6 +994,12 @@ class Variable:
         """
         if unit is None: return self
 
+        # data shared among processes is read-only, convert a copy
+        if not np.ma.getdata(self.data).flags.writeable:
+            if unit == self.unit: return self
+            self.data = self.data.copy()
+            if self.data_bnds is not None: self.data_bnds = self.data_bnds.copy()
+
         # replace some units that cfunits handled but cf_units does not
         u0 = self.unit.replace("psu","1e-3")
         u  =      unit.replace("psu","1e-3")
@@ -1130,6 +1280,80 @@ class Variable:
             for key in attributes.keys():
                 V.setncattr(key,attributes[key])
 
+    def mapProjection(self):
+        """Chooses the map projection for plotting the non-masked data.
+
+        The extents of the map are those of the non-masked data, padded
+        by 20 percent. Maps which span nearly all longitudes are drawn
+        with a polar or Robinson projection.
+
+        Returns
+        -------
+        proj : cartopy.crs.Projection
+            the projection of the map
+        extents : list of float
+            the longitude and latitude limits of the map, [lon_min,lon_max,lat_min,lat_max]
+        aspect_ratio : float
+            the ratio of the height to the width of the map
+        """
+        # determine the plotting extents
+        percent_pad = 0.2
+        if self.ndata is None:
+            
+            lat_empty = np.where(self.data.mask.all(axis=-1)==False)[0]
+            lon_empty = np.where(self.data.mask.all(axis=-2)==False)[0]        
+            extents = [self.lon_bnds[lon_empty[ 0],0],
+                       self.lon_bnds[lon_empty[-1],1],
+                       self.lat_bnds[lat_empty[ 0],0],
+                       self.lat_bnds[lat_empty[-1],1]]
+            dx = percent_pad*(extents[1]-extents[0])
+            dy = percent_pad*(extents[3]-extents[2])
+            extents[0] = max(extents[0]-dx,-180); extents[1] = min(extents[1]+dx,+180)
+            extents[2] = max(extents[2]-dy,- 90); extents[3] = min(extents[3]+dy,+ 90)
+            lon_mid    = 0.5*(extents[0]+extents[1])
+            
+            # ...but the data might cross the dateline, but not be global
+            if(lon_empty[ 0]== 0 and
+               lon_empty[-1]==(self.lon.size-1) and
+               np.diff(lon_empty).max() > 0.5*self.lon.size):
+                wrap_lon  = self.lon[lon_empty]
+                wrap_lon += (wrap_lon<0)*360
+                extents[0] = wrap_lon.min()
+                extents[1] = wrap_lon.max()
+                dx = percent_pad*(extents[1]-extents[0])
+                extents[0] -= dx; extents[1] += dx
+                
+                # find the middle centroid by mean angle 
+                lons = self.lon[np.where(self.data.mask.all(axis=-2)==False)[0]]
+                lons = lons/360*2*np.pi
+                lon_mid = np.arctan2(np.sin(lons).mean(),np.cos(lons).mean())/2/np.pi*360
+            
+        else:
+            extents = [self.lon.min(),self.lon.max(),
+                       self.lat.min(),self.lat.max()]
+            dx = percent_pad*(extents[1]-extents[0])
+            dy = percent_pad*(extents[3]-extents[2])
+            extents[0] = max(extents[0]-dx,-180); extents[1] = min(extents[1]+dx,+180)
+            extents[2] = max(extents[2]-dy,- 90); extents[3] = min(extents[3]+dy,+ 90)
+            lon_mid = 0.5*(extents[0]+extents[1])
+
+        # choose a projection based on the non-masked data
+        proj = ccrs.PlateCarree(central_longitude=lon_mid)
+        aspect_ratio = (extents[3]-extents[2])/(extents[1]-extents[0])
+        if (extents[1]-extents[0]) > 320:
+            if np.allclose(extents[2],-90) and extents[3] <= 0:
+                proj = ccrs.Orthographic(central_latitude=-90,central_longitude=0)
+                aspect_ratio = 1.
+            elif np.allclose(extents[3],+90) and extents[2] >= 0:
+                proj = ccrs.Orthographic(central_latitude=+90,central_longitude=0)
+                aspect_ratio = 1.
+            elif (extents[3]-extents[2]) > 140:
+                proj = ccrs.Robinson(central_longitude=0)
+                extents = [-180,180,-90,90]
+                aspect_ratio = 0.5
+                lon_mid = 0.
+        return proj,extents,aspect_ratio
+
     def plot(self,ax,**keywords):
         """Plots the variable on the given matplotlib axis.
 
@@ -1210,63 +1434,8 @@ class Variable:
             rem_mask  = np.copy(self.data.mask)
             self.data.mask += r.getMask(region,self)
 
-            # determine the plotting extents
-            percent_pad = 0.2
-            if self.ndata is None:
-                
-                lat_empty = np.where(self.data.mask.all(axis=-1)==False)[0]
-                lon_empty = np.where(self.data.mask.all(axis=-2)==False)[0]        
-                extents = [self.lon_bnds[lon_empty[ 0],0],
-                           self.lon_bnds[lon_empty[-1],1],
-                           self.lat_bnds[lat_empty[ 0],0],
-                           self.lat_bnds[lat_empty[-1],1]]
-                dx = percent_pad*(extents[1]-extents[0])
-                dy = percent_pad*(extents[3]-extents[2])
-                extents[0] = max(extents[0]-dx,-180); extents[1] = min(extents[1]+dx,+180)
-                extents[2] = max(extents[2]-dy,- 90); extents[3] = min(extents[3]+dy,+ 90)
-                lon_mid    = 0.5*(extents[0]+extents[1])
-                
-                # ...but the data might cross the dateline, but not be global
-                if(lon_empty[ 0]== 0 and
-                   lon_empty[-1]==(self.lon.size-1) and
-                   np.diff(lon_empty).max() > 0.5*self.lon.size):
-                    wrap_lon  = self.lon[lon_empty]
-                    wrap_lon += (wrap_lon<0)*360
-                    extents[0] = wrap_lon.min()
-                    extents[1] = wrap_lon.max()
-                    dx = percent_pad*(extents[1]-extents[0])
-                    extents[0] -= dx; extents[1] += dx
-                    
-                    # find the middle centroid by mean angle 
-                    lons = self.lon[np.where(self.data.mask.all(axis=-2)==False)[0]]
-                    lons = lons/360*2*np.pi
-                    lon_mid = np.arctan2(np.sin(lons).mean(),np.cos(lons).mean())/2/np.pi*360
-                
-            else:
-                extents = [self.lon.min(),self.lon.max(),
-                           self.lat.min(),self.lat.max()]
-                dx = percent_pad*(extents[1]-extents[0])
-                dy = percent_pad*(extents[3]-extents[2])
-                extents[0] = max(extents[0]-dx,-180); extents[1] = min(extents[1]+dx,+180)
-                extents[2] = max(extents[2]-dy,- 90); extents[3] = min(extents[3]+dy,+ 90)
-                lon_mid = 0.5*(extents[0]+extents[1])
-
-            # choose a projection based on the non-masked data
-            proj = ccrs.PlateCarree(central_longitude=lon_mid)
-            aspect_ratio = (extents[3]-extents[2])/(extents[1]-extents[0])
-            if (extents[1]-extents[0]) > 320:
-                if np.allclose(extents[2],-90) and extents[3] <= 0:
-                    proj = ccrs.Orthographic(central_latitude=-90,central_longitude=0)
-                    aspect_ratio = 1.
-                elif np.allclose(extents[3],+90) and extents[2] >= 0:
-                    proj = ccrs.Orthographic(central_latitude=+90,central_longitude=0)
-                    aspect_ratio = 1.
-                elif (extents[3]-extents[2]) > 140:
-                    proj = ccrs.Robinson(central_longitude=0)
-                    extents = [-180,180,-90,90]
-                    aspect_ratio = 0.5
-                    lon_mid = 0.
-                    
+            proj,extents,aspect_ratio = self.mapProjection()
+
             # make the plot
             w = 7.5; h = w*aspect_ratio
             fig,ax = plt.subplots(figsize=(w,h),
@@ -1323,8 +1492,8 @@ class Variable:
             if lat is None: lat = self.lat
             if lon is None: lon = self.lon
             if itype == 'nearestneighbor':
-                rows  = (np.abs(lat[:,np.newaxis]-self.lat)).argmin(axis=1)
-                cols  = (np.abs(lon[:,np.newaxis]-self.lon)).argmin(axis=1)
+                rows  = il.NearestIndices(self.lat,lat)
+                cols  = il.NearestIndices(self.lon,lon)
                 args  = []
                 if self.temporal: args.append(range(self.time.size))
                 if self.layered:  args.append(range(self.depth.size))
@@ -1339,12 +1508,7 @@ class Variable:
                     args.append([0,1])
                     ind = np.ix_(*args)
                     data_bnds = self.data_bnds[ind]
-                np.seterr(under='ignore',over='ignore')
-                frac  = self.area / il.CellAreas(self.lat,self.lon,self.lat_bnds,self.lon_bnds).clip(1e-12)
-                np.seterr(under='raise',over='raise')
-                frac  = frac.clip(0,1)
-                frac  = frac[np.ix_(rows,cols)]
-                output_area = frac * il.CellAreas(lat,lon,lat_bnds,lon_bnds)
+                output_area = il.RegridAreas(self,lat,lon,lat_bnds,lon_bnds,rows=rows,cols=cols)
             elif itype == 'bilinear':
                 from scipy.interpolate import RectBivariateSpline
                 if self.data.ndim == 3:
@@ -1362,7 +1526,7 @@ class Variable:
             else:
                 raise ValueError("Uknown interpolation type: %s" % itype)
         if self.temporal and time is not None:
-            times = np.apply_along_axis(np.argmin,1,np.abs(time[:,np.newaxis]-self.time))
+            times = NearestAxisIndex(self.time,time)
             mask  = data.mask
             if mask.size > 1: mask = data.mask[times,...]
             data  = data.data[times,...]
@@ -1774,16 +1938,10 @@ class Variable:
         """
         if not self.temporal: raise il.NotTemporalVariable
         assert intervals.ndim == 2
-        n    = intervals.shape[0]
-        shp  = (n,)+self.data.shape[1:]
-        time = np.zeros(n)
-        data = np.ma.zeros(shp)
-        for i in range(n):
-            t0          = intervals[i,0]-window
-            tf          = intervals[i,1]+window
-            time[i]     = 0.5*(t0+tf)
-            mean        = self.integrateInTime(mean=True,t0=t0,tf=tf).convert(self.unit)
-            data[i,...] = mean.data
+        t0   = intervals[:,0]-window
+        tf   = intervals[:,1]+window
+        time = 0.5*(t0+tf)
+        data = _integrateOverlap(_timeOverlap(np.asarray([t0,tf]).T,self.time_bnds),self.data,mean=True)
         return Variable(name       = "coarsened_%s" % self.name,
                         unit       = self.unit,
                         time       = time,
@@ -1814,22 +1972,29 @@ class Variable:
 
         """
         if not self.temporal: raise il.NotTemporalVariable
-        n       = self.time.size
-        shp     = (n+1,) + self.data.shape[1:]
-        time    = np.zeros(n+1)
-        data    = np.ma.zeros(shp)
-        data_bnds = None if self.data_bnds is None else np.ma.zeros(shp+(2,))
-        time[0] = self.time_bnds[0,0]
-        for i in range(n):
-            t0   = self.time_bnds[i,0]
-            tf   = self.time_bnds[i,1]
-            isum = self.integrateInTime(t0=t0,tf=tf)
-            time[i+1]     = tf
-            data[i+1,...] = data[i,...] + isum.data
-            if data_bnds is not None:
-                data_bnds[i+1,...] = data_bnds[i,...] + isum.data_bnds
+
+        # integrate over each time interval at once, then accumulate,
+        # the sum is masked from the first masked interval onwards
+        overlap = _timeOverlap(self.time_bnds,self.time_bnds)
+        unit0   = Unit("d")*Unit(self.unit)
+        unit    = Unit(unit0.format().split()[-1])
+        def _accumulate(data):
+            isum = _integrateOverlap(overlap,data)
+            csum = np.ma.filled(isum,0)
+            unit0.convert(csum,unit,inplace=True)
+            mask = np.logical_or.accumulate(np.ma.getmaskarray(isum),axis=0)
+            csum = np.cumsum(csum,axis=0)
+            zero = np.zeros((1,)+csum.shape[1:])
+            return np.ma.masked_array(np.concatenate([zero,csum]),
+                                      mask=np.concatenate([zero==1,mask]))
+        time      = np.hstack([self.time_bnds[0,0],self.time_bnds[:,1]])
+        data      = _accumulate(self.data)
+        data_bnds = None
+        if self.data_bnds is not None:
+            data_bnds = np.ma.stack([_accumulate(self.data_bnds[...,0]),
+                                     _accumulate(self.data_bnds[...,1])],axis=-1)
         return Variable(name      = "cumulative_sum_%s" % self.name,
-                        unit      = isum.unit,
+                        unit      = "%s" % unit,
                         time      = time,
                         data      = data,
                         data_bnds  = data_bnds,
@@ -1890,3 +2055,457 @@ class Variable:
             self.data       = self.data[...,ind,:,:]
 
         return self
+
+class LazyVariable(object):
+    r"""A file-backed variable whose data is read in chunks of time.
+
+    The Variable class reads all the (time-sliced) data of a netCDF4
+    variable into memory when constructed. For high resolution or
+    long datasets, this can exceed the memory of a node before any
+    analysis is performed. This class instead only reads the time
+    and spatial information when constructed. The data is then read
+    in chunks of consecutive times, each chunk an ordinary Variable,
+    and the reductions used in the analysis (integrateInTime,
+    integrateInSpace, annualCycle, rms, bias and rmse) stream over
+    these chunks. Memory usage is then bounded by the chunk size,
+    given as a memory budget in megabytes.
+
+    The results of the reductions are those of the Variable methods
+    of the same name applied to the data read in its entirety, up to
+    the order in which sums are accumulated. Data bounds are not
+    supported.
+
+    Parameters
+    ----------
+    filename : str or list of str
+        the netCDF4 file(s) from which to read the variable, if
+        several, each file must contain a distinct portion of time
+    variable_name : str
+        name of the variable to read
+    alternate_vars : list of str, optional
+        a list of alternate acceptable variable names
+    t0 : float, optional
+        include data occuring after this time
+    tf : float, optional
+        include data occuring before this time
+    convert_calendar : bool, optional
+        enable to convert times to the noleap calendar
+    area : numpy.ndarray, optional
+        a 2D array of the cell areas
+    shift : float, optional
+        the amount of time in days to add to the times of the files
+    mem_slab : float, optional
+        the approximate memory in megabytes a chunk of data may use
+
+    Examples
+    --------
+
+    >>> v = LazyVariable(filename=["gpp_1850.nc","gpp_1900.nc"],variable_name="gpp",mem_slab=500.)
+    >>> mean = v.integrateInTime(mean=True)
+    >>> for i0,chunk in v.chunks(): print(chunk.time.size)
+
+    """
+    def __init__(self,**keywords):
+
+        filename              = keywords.get("filename",None)
+        self.variable_name    = keywords.get("variable_name",None)
+        self.alternate_vars   = keywords.get("alternate_vars",[])
+        self.convert_calendar = keywords.get("convert_calendar",True)
+        self.area_in          = keywords.get("area",None)
+        self.shift            = keywords.get("shift",0.)
+        self.mem_slab         = keywords.get("mem_slab",1000.) # Mb
+        t0                    = keywords.get("t0",None)
+        tf                    = keywords.get("tf",None)
+        assert filename is not None
+        assert self.variable_name is not None
+        if type(filename) == type(""): filename = [filename]
+        if t0 is not None: t0 -= self.shift
+        if tf is not None: tf -= self.shift
+
+        # Peek at the times in each file without reading data, files
+        # which do not contribute to [t0,tf] are skipped as when
+        # reading the variable from many files in ModelResult
+        pieces = []
+        names  = [self.variable_name] + list(self.alternate_vars)
+        for fname in filename:
+            with Dataset(fname) as dset:
+                found = [name for name in names if name in dset.variables]
+                if len(found) == 0:
+                    raise RuntimeError("Unable to find [%s] in the file: %s" % (",".join(names),fname))
+                var = dset.variables[found[0]]
+                T,TB,CB,begin,end,cal = il.GetTime(var,t0=t0,tf=tf,convert_calendar=self.convert_calendar)
+                if T is None: continue
+                if ((t0 is not None and TB.max() < t0) or
+                    (tf is not None and TB.min() > tf)): continue
+                self.nbytes_t = var.size/var.shape[0]*8.
+                pieces.append((T[0],fname,T,TB))
+        if len(pieces) == 0: raise il.VarNotInModel()
+        pieces.sort(key=lambda p: p[0])
+        self.files     = [p[1] for p in pieces]
+        self.file_time = [p[2] for p in pieces]
+        self.offsets   = np.hstack([0,np.cumsum([p[2].size for p in pieces])]).astype(int)
+
+        # Assemble the time information
+        self.time      = np.hstack(self.file_time) + self.shift
+        self.time_bnds = np.vstack([p[3] for p in pieces]) + self.shift
+        self.temporal  = True
+        self.dt        = (self.time_bnds[:,1]-self.time_bnds[:,0]).mean()
+        self.monthly   = True if np.allclose(self.dt,30,atol=3) else False
+        self._allmask  = None
+
+        # Read a single time to get the spatial information
+        probe = self._readFile(0,0,1)
+        self.name       = probe.name
+        self.unit       = probe.unit
+        self.calendar   = probe.calendar
+        self.lat        = probe.lat
+        self.lat_bnds   = probe.lat_bnds
+        self.lon        = probe.lon
+        self.lon_bnds   = probe.lon_bnds
+        self.area       = probe.area
+        self.ndata      = probe.ndata
+        self.depth      = probe.depth
+        self.depth_bnds = probe.depth_bnds
+        self.spatial    = probe.spatial
+        self.layered    = probe.layered
+        self.shape      = probe.data.shape[1:]
+
+    def __str__(self):
+        s  = "LazyVariable: %s\n" % self.name
+        s += "-"*(len(self.name)+14) + "\n"
+        s += "{0:>20}: ".format("unit")       + self.unit + "\n"
+        s += "{0:>20}: ".format("nFiles")     + "%d\n" % len(self.files)
+        s += "{0:>20}: ".format("dataShape")  + "%s\n" % ((self.time.size,)+self.shape,)
+        s += "{0:>20}: ".format("chunkSize")  + "%d\n" % self.chunkSize()
+        return s
+
+    def _readFile(self,i,j0,j1):
+        """Reads times [j0,j1) of the ith file into a Variable."""
+        T   = self.file_time[i]
+        var = Variable(filename         = self.files[i],
+                       variable_name    = self.variable_name,
+                       alternate_vars   = list(self.alternate_vars),
+                       convert_calendar = self.convert_calendar,
+                       area             = self.area_in,
+                       t0               = T[j0],
+                       tf               = T[j1-1])
+        if var.time is None or var.time.size != (j1-j0):
+            msg = "Expected to read %d times from %s" % (j1-j0,self.files[i])
+            raise ValueError(msg)
+        var.time      += self.shift
+        var.time_bnds += self.shift
+        return var
+
+    def chunkSize(self):
+        """The number of times in a chunk such that the chunk fits in the memory budget."""
+        return int(max(1,min(self.time.size,np.floor(self.mem_slab/(self.nbytes_t*1e-6)))))
+
+    def read(self,i0,i1):
+        """Reads the data of the times [i0,i1) into a Variable.
+
+        Parameters
+        ----------
+        i0 : int
+            the index of the first time to read
+        i1 : int
+            one past the index of the last time to read
+
+        Returns
+        -------
+        var : ILAMB.Variable.Variable
+            the variable restricted to these times
+        """
+        V = []
+        for i in range(len(self.files)):
+            j0 = max(i0,self.offsets[i  ])-self.offsets[i]
+            j1 = min(i1,self.offsets[i+1])-self.offsets[i]
+            if j1 <= j0: continue
+            V.append(self._readFile(i,j0,j1))
+        if len(V) == 1: return V[0]
+        return il.CombineVariables(V)
+
+    def chunks(self,i0=0,i1=None):
+        """A generator of the data of the times [i0,i1) in chunks of consecutive times.
+
+        Yields
+        ------
+        i0 : int
+            the index of the first time in the chunk
+        var : ILAMB.Variable.Variable
+            the chunk of data
+        """
+        n  = self.chunkSize()
+        i1 = self.time.size if i1 is None else i1
+        for j0 in range(i0,i1,n):
+            yield j0,self.read(j0,min(j0+n,i1))
+
+    def load(self):
+        """Reads all the data into memory.
+
+        Returns
+        -------
+        var : ILAMB.Variable.Variable
+            the non-lazy variable
+        """
+        return self.read(0,self.time.size)
+
+    def allMasked(self):
+        """Returns a mask which is True where all data in time is masked.
+
+        The mask is computed with a pass over the data the first time
+        it is requested and then remembered.
+        """
+        if self._allmask is None:
+            mask = np.ones(self.shape,dtype=bool)
+            for i0,v in self.chunks():
+                mask *= np.ma.getmaskarray(v.data).all(axis=0)
+            self._allmask = mask
+        return self._allmask
+
+    def _like(self,data,unit,name,**keywords):
+        return Variable(data       = data,
+                        unit       = unit,
+                        name       = name,
+                        lat        = self.lat,
+                        lat_bnds   = self.lat_bnds,
+                        lon        = self.lon,
+                        lon_bnds   = self.lon_bnds,
+                        depth      = self.depth,
+                        depth_bnds = self.depth_bnds,
+                        area       = self.area,
+                        ndata      = self.ndata,
+                        **keywords)
+
+    def _integrateInTime(self,other,op,time_bnds,t0,tf):
+        """Streams the nodal integral of op(self,other) over the time
+        interval [t0,tf], returning the integral, the non-masked time
+        and the mask where all data is masked.
+        """
+        tb = np.copy(time_bnds)
+        tb[(t0>tb[:,0])*(t0<tb[:,1]),0] = t0
+        tb[(tf>tb[:,0])*(tf<tb[:,1]),1] = tf
+        dt  = tb[:,1]-tb[:,0]
+        inc = (t0<time_bnds[:,1])*(tf>time_bnds[:,0])
+        integral = np.zeros(self.shape)
+        period   = np.zeros(self.shape)
+        mask     = np.ones (self.shape,dtype=bool)
+        with np.errstate(over='ignore',under='ignore'):
+            for i0,v in self.chunks():
+                i1  = i0+v.time.size
+                ind = np.where(inc[i0:i1])[0]
+                if ind.size == 0: continue
+                x = v.data
+                if other is not None:
+                    y = other.read(i0,i1).data if isinstance(other,LazyVariable) else other.data[i0:i1]
+                    x = op(x,y)
+                else:
+                    x = op(x)
+                x = x[ind]
+                m = np.ma.getmaskarray(x)
+                w = dt[i0:i1][ind]
+                for k in range(len(self.shape)): w = np.expand_dims(w,axis=-1)
+                integral += (np.ma.filled(x,0)*w).sum(axis=0)
+                period   += (w*(m==0)).sum(axis=0)
+                mask     *= m.all(axis=0)
+        return integral,period,mask
+
+    def integrateInTime(self,**keywords):
+        r"""Integrates the variable over a given time period.
+
+        See Variable.integrateInTime, the result is the same but
+        computed by streaming over chunks of time.
+
+        Parameters
+        ----------
+        t0 : float, optional
+            initial time in days since 1/1/1850
+        tf : float, optional
+            final time in days since 1/1/1850
+        mean : boolean, optional
+            enable to divide the integrand to get the mean function value
+
+        Returns
+        -------
+        integral : ILAMB.Variable.Variable
+            a Variable instance with the integrated value along with the
+            appropriate name and unit change
+        """
+        t0   = keywords.get("t0",self.time_bnds[:,0].min())
+        tf   = keywords.get("tf",self.time_bnds[:,1].max())
+        mean = keywords.get("mean",False)
+        integral,period,mask = self._integrateInTime(None,lambda x: x,self.time_bnds,t0,tf)
+        integral = np.ma.masked_array(integral,mask=mask)
+        unit = Unit(self.unit)
+        name = self.name + "_integrated_over_time"
+        if mean:
+            name += "_and_divided_by_time_period"
+            with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+                integral = integral / np.ma.masked_equal(period,0)
+        else:
+            unit0 = Unit("d")*unit
+            unit  = Unit(unit0.format().split()[-1])
+            unit0.convert(integral,unit,inplace=True)
+        return self._like(integral,"%s" % unit,name)
+
+    def integrateInSpace(self,region=None,mean=False,weight=None,intabs=False,regions=None):
+        r"""Integrates the variable over a given region.
+
+        See Variable.integrateInSpace, the result is the same but
+        computed by streaming over chunks of time.
+
+        Parameters
+        ----------
+        region : str, optional
+            name of the region overwhich you wish to integrate
+        mean : bool, optional
+            enable to divide the integrand to get the mean function value
+        weight : numpy.ndarray, optional
+            a data array of the same shape as this variable's areas
+            representing an additional weight in the integrand
+        intabs : bool, optional
+            enable to integrate the absolute value
+        regions : list of str, optional
+            names of regions overwhich you wish to integrate, all at
+            once, in place of a single region
+
+        Returns
+        -------
+        integral : ILAMB.Variable.Variable or dict
+            a Variable instace with the integrated value along with the
+            appropriate name and unit change, or if regions are given,
+            a dictionary of these Variables whose keys are the regions
+        """
+        if not self.spatial: raise il.NotSpatialVariable()
+        op = np.abs if intabs else (lambda x: x)
+
+        # the measure is masked where all data in time is masked
+        mask = self.allMasked()
+        while mask.ndim > 2: mask = np.all(mask,axis=0)
+        measure = np.ma.masked_array(self.area,mask=mask,copy=True)
+        if weight is not None: measure *= weight
+
+        r = Regions()
+        batched = regions is not None
+        if batched:
+            weights   = r.getWeights(regions,self)
+            integrals = np.ma.concatenate([_integrateRegions(v.data,measure,weights,mean=mean,intabs=intabs)
+                                           for i0,v in self.chunks()],axis=1)
+        else:
+            if region is not None: measure.mask += r.getMask(region,self)
+            integral = []
+            with np.errstate(over='ignore',under='ignore'):
+                for i0,v in self.chunks():
+                    integral.append((op(v.data)*measure).sum(axis=-1).sum(axis=-1))
+            integral = np.ma.concatenate(integral)
+            if mean:
+                with np.errstate(under='ignore',invalid='ignore'):
+                    integral = integral / measure.sum()
+            regions   = [region]
+            integrals = [integral]
+
+        unit = Unit(self.unit)
+        if not mean: unit *= Unit("m2")
+        output = {}
+        for region,integral in zip(regions,integrals):
+            name = self.name + "_integrated_over_space"
+            if region is not None: name = name.replace("space",region)
+            if mean: name += "_and_divided_by_area"
+            output[region] = Variable(data       = np.ma.masked_array(integral),
+                                      unit       = "%s" % unit,
+                                      time       = self.time,
+                                      time_bnds  = self.time_bnds,
+                                      depth      = self.depth,
+                                      depth_bnds = self.depth_bnds,
+                                      name       = name)
+        if batched: return output
+        return output[region]
+
+    def annualCycle(self):
+        """Computes mean annual cycle information (climatology) for the variable.
+
+        Returns
+        -------
+        mean : ILAMB.Variable.Variable
+            The annual cycle mean values
+        """
+        assert self.monthly
+        assert self.time.size > 11
+        begin = np.argmin(self.time[:11]%365)
+        end   = begin+int(self.time[begin:].size/12.)*12
+        total = np.zeros((12,)+self.shape)
+        count = np.zeros((12,)+self.shape,dtype=int)
+        with np.errstate(over='ignore',under='ignore'):
+            for i0,v in self.chunks(begin,end):
+                m     = np.ma.getmaskarray(v.data)
+                month = (np.arange(i0,i0+v.time.size)-begin) % 12
+                np.add.at(total,month,np.ma.filled(v.data,0))
+                np.add.at(count,month,(m==0))
+        with np.errstate(divide='ignore',invalid='ignore'):
+            mean = np.ma.masked_array(total/count.clip(1),mask=(count==0))
+        return self._like(mean,self.unit,"annual_cycle_mean_of_%s" % self.name,
+                          time      = mid_months,
+                          time_bnds = np.asarray([bnd_months[:-1],bnd_months[1:]]).T)
+
+    def rms(self):
+        """Computes the RMS of this variable.
+
+        Returns
+        -------
+        RMS : ILAMB.Variable.Variable
+            the RMS
+        """
+        # as in Variable.rms, the integration uses bounds created
+        # from the times
+        tb = _createBnds(self.time)
+        integral,period,mask = self._integrateInTime(None,lambda x: x**2,tb,tb[:,0].min(),tb[:,1].max())
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            data = np.ma.sqrt(np.ma.masked_array(integral,mask=mask) / np.ma.masked_equal(period,0))
+        return self._like(data,self.unit,"rms_of_%s" % self.name)
+
+    def _difference(self,var,op):
+        if not self.spatial and not self.ndata: raise il.NotSpatialVariable()
+        assert var.time.size == self.time.size
+        if self.spatial:
+            if not (np.allclose(self.lat,var.lat) and np.allclose(self.lon,var.lon)):
+                msg = "Lazy variables must be on the same grid, interpolate first"
+                raise ValueError(msg)
+        tb = self.time_bnds
+        return self._integrateInTime(var,op,tb,tb[:,0].min(),tb[:,1].max())
+
+    def bias(self,var):
+        """Computes the bias between a given variable and this variable.
+
+        Parameters
+        ----------
+        var : ILAMB.Variable.Variable or ILAMB.Variable.LazyVariable
+            The variable with which we will measure bias, must be on
+            the same grid and times as this variable
+
+        Returns
+        -------
+        bias : ILAMB.Variable.Variable
+            the bias
+        """
+        integral,period,mask = self._difference(var,lambda x,y: y-x)
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            data = np.ma.masked_array(integral,mask=mask) / np.ma.masked_equal(period,0)
+        return self._like(data,self.unit,"bias_of_%s" % self.name)
+
+    def rmse(self,var):
+        """Computes the RMSE between a given variable and this variable.
+
+        Parameters
+        ----------
+        var : ILAMB.Variable.Variable or ILAMB.Variable.LazyVariable
+            The variable with which we will measure RMSE, must be on
+            the same grid and times as this variable
+
+        Returns
+        -------
+        RMSE : ILAMB.Variable.Variable
+            the RMSE
+        """
+        integral,period,mask = self._difference(var,lambda x,y: (y-x)**2)
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            data = np.ma.sqrt(np.ma.masked_array(integral,mask=mask) / np.ma.masked_equal(period,0))
+        return self._like(data,self.unit,"rmse_of_%s" % self.name)
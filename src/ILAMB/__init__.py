@@ -16,8 +16,16 @@ requires = {
     "mpi4py"               : "1.3.1"
 }
 
+# These are only needed for some features, mpi4py for running in
+# parallel with mpirun
+optional = ["mpi4py"]
+
 for key in requires.keys():
-    pkg = __import__(key)
+    try:
+        pkg = __import__(key)
+    except ImportError:
+        if key in optional: continue
+        raise
     if LooseVersion(pkg.__version__) < LooseVersion(requires[key]):
         raise ImportError(
             "Bad %s version: ILAMB %s requires %s >= %s got %s" %
@@ -1,17 +1,18 @@
-from scipy.interpolate import NearestNDInterpolator
+from .spatial import NearestAxisIndex,NearestSites
 from .constants import mid_months,bnd_months
 from .Regions import Regions
 from netCDF4 import Dataset
 from datetime import datetime
 from cf_units import Unit
-from copy import deepcopy
-from mpi4py import MPI
+from copy import copy,deepcopy
+from collections import OrderedDict
+from .parallel import GetRank,GetProcessorName
 import numpy as np
-import logging,re,os
+import logging,re,os,hashlib
 import cftime as cf
 from pkg_resources import parse_version, get_distribution
 
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
 class VarNotInFile(Exception):
     def __str__(self): return "VarNotInFile"
@@ -58,6 +59,9 @@ class NotDatasiteVariable(Exception):
 class MonotonicityError(Exception):
     def __str__(self): return "MonotonicityError"
 
+class IngestError(Exception):
+    def __str__(self): return "IngestError"
+
 def FixDumbUnits(unit):
     r"""Try to fix the dumb units people insist on using.
 
@@ -193,6 +197,159 @@ def ConvertCalendar(t,units,calendar):
     """
     return cf.date2num(cf.datetime(t.year,t.month,t.day,t.hour,t.minute,t.second),units,calendar=calendar)
 
+# Lookup tables for converting times between calendars by integer day
+# arithmetic, the days in each month of the idealized calendars and the
+# microseconds in each time unit (as cftime defines them)
+_month_days = {"noleap"  : np.asarray([31,28,31,30,31,30,31,31,30,31,30,31]),
+               "all_leap": np.asarray([31,29,31,30,31,30,31,31,30,31,30,31]),
+               "360_day" : np.asarray([30]*12)}
+_month_days["365_day"] = _month_days["noleap"]
+_month_days["366_day"] = _month_days["all_leap"]
+_unit_microseconds = {}
+for _names,_factor in [(["microseconds","microsecond","microsec","microsecs"],1),
+                       (["milliseconds","millisecond","millisec","millisecs","msec","msecs","ms"],1000),
+                       (["seconds","second","sec","secs","s"],1000000),
+                       (["minutes","minute","min","mins"],60000000),
+                       (["hours","hour","hr","hrs","h"],3600000000),
+                       (["days","day","d"],86400000000)]:
+    for _name in _names: _unit_microseconds[_name] = _factor
+
+# Files are read several times in a run (indexed, then read for each
+# confrontation), so we keep the conversions of the most recent time
+# arrays.
+_calendar_cache      = OrderedDict()
+_calendar_cache_size = 16
+
+def _dayNumber(y,m,d,calendar):
+    """Returns a number for each date such that consecutive days have consecutive numbers.
+
+    For the real-world calendars this is the Julian day number, the
+    'standard' calendar switching from the Julian to the Gregorian
+    calendar on 1582-10-15.
+    """
+    if calendar in _month_days:
+        cum = np.hstack([0,_month_days[calendar].cumsum()])
+        return cum[-1]*y + cum[m-1] + d-1
+    a  = (14-m)//12
+    y  = y+4800-a
+    m  = m+12*a-3
+    jd = d + (153*m+2)//5 + 365*y + y//4
+    if calendar == "julian": return jd - 32083
+    gd = jd - y//100 + y//400 - 32045
+    if calendar == "proleptic_gregorian": return gd
+    return np.where(gd < 2299161,jd-32083,gd)
+
+def _dayDate(n,calendar):
+    """Returns the (year,month,day) of the day numbers, the inverse of _dayNumber."""
+    if calendar in _month_days:
+        cum = np.hstack([0,_month_days[calendar].cumsum()])
+        y,r = np.divmod(n,cum[-1])
+        m   = np.searchsorted(cum,r,side="right")
+        return y,m,r-cum[m-1]+1
+    gregorian = calendar == "proleptic_gregorian" or ((calendar != "julian")*(n >= 2299161))
+    a = n+32044
+    b = np.where(gregorian,(4*a+3)//146097,0)
+    c = np.where(gregorian,a-(146097*b)//4,n+32082)
+    d = (4*c+3)//1461
+    e = c-(1461*d)//4
+    m = (5*e+2)//153
+    return 100*b+d-4800+m//10,m+3-12*(m//10),e-(153*m+2)//5+1
+
+def DecodeTimes(times,units,calendar):
+    """Returns the dates of the times, as cftime.num2date but on the whole array.
+
+    The times are decoded by integer arithmetic, giving the same dates
+    as cftime.num2date would.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        the times to decode
+    units : str
+        the units of the times, 'UNIT since DATUM'
+    calendar : str
+        the calendar of the times
+
+    Returns
+    -------
+    dates : tuple of numpy.ndarray or None
+        the year, month, day and microseconds into the day of each
+        time, or None if the units or calendar are not supported (or
+        the dates fall before year 1) and cftime must be used
+    """
+    calendar = calendar.lower()
+    if calendar == "gregorian": calendar = "standard"
+    unit = units.split()[0].lower()
+    if unit not in _unit_microseconds: return None
+    if calendar not in list(_month_days.keys()) + ["standard","proleptic_gregorian","julian"]: return None
+    datum = cf.num2date(0,units,calendar=calendar)
+    if datum.year < 1: return None
+
+    # microseconds since the datum, rounded as in cftime.num2date
+    factor = _unit_microseconds[unit]
+    times  = np.asarray(times)
+    if times.dtype.kind == "f":
+        times = times.astype(np.longdouble)*factor
+        us    = np.rint(times).astype(np.int64)
+        if factor >= 1000000:
+            us = np.where(us % 1000000 ==      1,np.floor(times).astype(np.int64),us)
+            us = np.where(us % 1000000 == 999999,np.ceil (times).astype(np.int64),us)
+    else:
+        us = times.astype(np.int64)*factor
+    us += ((datum.hour*60+datum.minute)*60+datum.second)*1000000+datum.microsecond
+    days,us = np.divmod(us,86400000000)
+
+    # the dates in the calendar of the times
+    y,m,d = _dayDate(_dayNumber(datum.year,datum.month,datum.day,calendar)+days,calendar)
+    if (y < 1).any(): return None
+    return y,m,d,us
+
+def _toNoleap(times,units,calendar):
+    """Converts times to days since 1850-1-1 in the noleap calendar.
+
+    This has the effect of looping over the times, converting each to
+    a date with cftime.num2date and then back with ConvertCalendar,
+    but works on the whole array with integer arithmetic. As in
+    ConvertCalendar, the date (year, month, day and time of day to the
+    second) is kept, not the time elapsed.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        the times to convert
+    units : str
+        the units of the times, 'UNIT since DATUM'
+    calendar : str
+        the calendar of the times
+
+    Returns
+    -------
+    times : numpy.ndarray or None
+        the converted times, or None if the units or calendar are not
+        supported and the times must be converted date by date
+    """
+    dates = DecodeTimes(times,units,calendar)
+    if dates is None: return None
+    y,m,d,us = dates
+    invalid = d > _month_days["noleap"][m-1]
+    if invalid.any():
+        msg = "The dates %s do not exist in the noleap calendar" % (", ".join(["%04d-%02d-%02d" % (yy,mm,dd) for yy,mm,dd in zip(y[invalid][:3],m[invalid][:3],d[invalid][:3])]))
+        raise ValueError(msg)
+    return (_dayNumber(y-1850,m,d,"noleap")*86400 + us//1000000)/86400.
+
+def _toNoleapCached(times,units,calendar):
+    """Returns _toNoleap of the times, reusing the conversions of recently seen arrays."""
+    key = (units,calendar,_gridHash(times))
+    if key in _calendar_cache:
+        _calendar_cache.move_to_end(key)
+        return _calendar_cache[key]
+    out = _toNoleap(times,units,calendar)
+    if out is None: return None
+    out.flags.writeable = False
+    _calendar_cache[key] = out
+    while len(_calendar_cache) > _calendar_cache_size: _calendar_cache.popitem(last=False)
+    return out
+
 def GetTime(var,t0=None,tf=None,convert_calendar=True,ignore_time_array=True):
     """
     """
@@ -290,18 +447,128 @@ def GetTime(var,t0=None,tf=None,convert_calendar=True,ignore_time_array=True):
         msg = "Error in computing the datum: t.units = %s, t.calendar = %s" % (t.units,t.calendar)
         raise ValueError(msg)
         
-    if ((abs(datum_shift) > 60) or (convert_calendar and t.calendar != "noleap")):
-        T  = cf.num2date(T ,units=t.units,calendar=t.calendar)
-        TB = cf.num2date(TB,units=t.units,calendar=t.calendar)
-        for index,x in np.ndenumerate(T):
-            T [index] = ConvertCalendar(x,"days since 1850-1-1 00:00:00","noleap" if convert_calendar else t.calendar)
-        for index,x in np.ndenumerate(TB):
-            TB[index] = ConvertCalendar(x,"days since 1850-1-1 00:00:00","noleap" if convert_calendar else t.calendar)
     cal = "noleap" if convert_calendar else t.calendar
+    if ((abs(datum_shift) > 60) or (convert_calendar and t.calendar != "noleap")):
+        T0,TB0 = None,None
+        if cal == "noleap":
+            T0  = _toNoleapCached(T ,t.units,t.calendar)
+            TB0 = _toNoleapCached(TB,t.units,t.calendar)
+        if T0 is not None and TB0 is not None:
+            T,TB = T0,TB0
+        else:
+            T  = cf.num2date(T ,units=t.units,calendar=t.calendar)
+            TB = cf.num2date(TB,units=t.units,calendar=t.calendar)
+            for index,x in np.ndenumerate(T):
+                T [index] = ConvertCalendar(x,"days since 1850-1-1 00:00:00",cal)
+            for index,x in np.ndenumerate(TB):
+                TB[index] = ConvertCalendar(x,"days since 1850-1-1 00:00:00",cal)
 
     return T.astype(float),TB.astype(float),CB,begin,end,cal
 
+# The same few pairs of grids recur in every confrontation, so we keep
+# the index arrays and areas used to map between them, as well as the
+# region masks on them, in a bounded, least recently used cache.
+_regrid_cache      = OrderedDict()
+_regrid_cache_size = 512
+
+def _gridHash(*arrays):
+    """Returns a hash which identifies the given (possibly None or masked) arrays."""
+    h = hashlib.sha1()
+    for a in arrays:
+        if a is None:
+            h.update(b"None")
+            continue
+        if isinstance(a,np.ma.MaskedArray):
+            h.update(b"masked")
+            h.update(np.ascontiguousarray(np.ma.getmaskarray(a)).tobytes())
+        a = np.ascontiguousarray(np.ma.getdata(a))
+        h.update(("%s%s" % (a.dtype.str,a.shape)).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def _regridCached(key,build):
+    """Returns the cached operator for key, calling build() to create it if needed.
+
+    Cached arrays are shared among callers and so are made
+    read-only. Once more than _regrid_cache_size operators are held,
+    the least recently used is evicted.
+
+    Parameters
+    ----------
+    key : tuple
+        a hashable key, usually (method, source grid hash, target grid hash)
+    build : function
+        a function of no arguments which returns the operator, an
+        array or tuple of arrays
+
+    Returns
+    -------
+    op : numpy.ndarray or tuple of numpy.ndarray
+        the operator
+    """
+    if key in _regrid_cache:
+        _regrid_cache.move_to_end(key)
+        return _regrid_cache[key]
+    op = build()
+    for a in (op if isinstance(op,tuple) else (op,)):
+        if isinstance(a,np.ndarray): a.flags.writeable = False
+    _regrid_cache[key] = op
+    while len(_regrid_cache) > _regrid_cache_size: _regrid_cache.popitem(last=False)
+    return op
+
+def NearestIndices(source,target):
+    """For each target coordinate, return the index of the nearest source coordinate.
+
+    Parameters
+    ----------
+    source : numpy.ndarray
+        a 1D array of coordinates from which we interpolate
+    target : numpy.ndarray
+        a 1D array of coordinates to which we interpolate
+
+    Returns
+    -------
+    index : numpy.ndarray
+        a read-only integer array of the size of target
+    """
+    def _build():
+        return NearestAxisIndex(source,target)
+    return _regridCached(("nearest",_gridHash(source),_gridHash(target)),_build)
 
+def RegridAreas(var,lat,lon,lat_bnds=None,lon_bnds=None,rows=None,cols=None):
+    """Returns the areas of the cells of a variable nearest-neighbor interpolated to a new grid.
+
+    The fraction of each source cell which is represented by the
+    area of the variable (a land fraction for example) is carried
+    over to the nearest target cell.
+
+    Parameters
+    ----------
+    var : ILAMB.Variable.Variable
+        the spatial variable being interpolated
+    lat,lon : numpy.ndarray
+        1D arrays of the target cell centroids
+    lat_bnds,lon_bnds : numpy.ndarray, optional
+        the target cell bounds
+    rows,cols : numpy.ndarray, optional
+        the nearest neighbor indices, computed if not given
+
+    Returns
+    -------
+    areas : numpy.ndarray
+        a 2D array of cell areas in [m2]
+    """
+    def _build():
+        r = NearestIndices(var.lat,lat) if rows is None else rows
+        c = NearestIndices(var.lon,lon) if cols is None else cols
+        np.seterr(under='ignore',over='ignore')
+        frac = var.area / CellAreas(var.lat,var.lon,var.lat_bnds,var.lon_bnds).clip(1e-12)
+        np.seterr(under='raise',over='raise')
+        frac = frac.clip(0,1)
+        return frac[np.ix_(r,c)] * CellAreas(lat,lon,lat_bnds,lon_bnds)
+    return _regridCached(("areas",
+                          _gridHash(var.lat,var.lon,var.lat_bnds,var.lon_bnds,var.area),
+                          _gridHash(lat,lon,lat_bnds,lon_bnds)),_build).copy()
 
 def CellAreas(lat,lon,lat_bnds=None,lon_bnds=None):
     """Given arrays of latitude and longitude, return cell areas in square meters.
@@ -318,6 +585,11 @@ def CellAreas(lat,lon,lat_bnds=None,lon_bnds=None):
     areas : numpy.ndarray
         a 2D array of cell areas in [m2]
     """
+    if lat_bnds is None or lon_bnds is None: lat_bnds = lon_bnds = None
+    return _regridCached(("cellareas",_gridHash(lat,lon,lat_bnds,lon_bnds)),
+                         lambda: _cellAreas(lat,lon,lat_bnds,lon_bnds)).copy()
+
+def _cellAreas(lat,lon,lat_bnds=None,lon_bnds=None):
     from .constants import earth_rad
 
     if (lat_bnds is not None and lon_bnds is not None):
@@ -407,8 +679,8 @@ def NearestNeighborInterpolation(lat1,lon1,data1,lat2,lon2):
     data2 : numpy.ndarray
         an array of interpolated data of shape = (lat2.size,lon2.size,...)
     """
-    rows  = np.apply_along_axis(np.argmin,1,np.abs(lat2[:,np.newaxis]-lat1))
-    cols  = np.apply_along_axis(np.argmin,1,np.abs(lon2[:,np.newaxis]-lon1))
+    rows  = NearestIndices(lat1,lat2)
+    cols  = NearestIndices(lon1,lon2)
     data2 = data1[np.ix_(rows,cols)]
     return data2
 
@@ -528,14 +800,10 @@ def ComputeIndexingArrays(lat2d,lon2d,lat,lon):
         A 1D array of longitudes of cell centroids
 
     """
-    # Prepare the interpolator
-    points   = np.asarray([lat2d.flatten(),lon2d.flatten()]).T
-    values   = np.asarray([(np.arange(lat2d.shape[0])[:,np.newaxis]*np.ones  (lat2d.shape[1])).flatten(),
-                           (np.ones  (lat2d.shape[0])[:,np.newaxis]*np.arange(lat2d.shape[1])).flatten()]).T
-    fcn      = NearestNDInterpolator(points,values)
-    LAT,LON  = np.meshgrid(lat,lon,indexing='ij')
-    gmap     = fcn(LAT.flatten(),LON.flatten()).astype(int)
-    return gmap[:,0].reshape(LAT.shape),gmap[:,1].reshape(LAT.shape)
+    LAT,LON   = np.meshgrid(lat,lon,indexing='ij')
+    gmap,r    = NearestSites(lat2d,lon2d,LAT,LON)
+    ilat,ilon = np.unravel_index(gmap,lat2d.shape)
+    return ilat.reshape(LAT.shape),ilon.reshape(LAT.shape)
 
 def ExtendAnnualCycle(time,cycle_data,cycle_time):
     ind = np.abs((time[:,np.newaxis] % 365)-(cycle_time % 365)).argmin(axis=1)
@@ -923,6 +1191,11 @@ def ComposeSpatialGrids(var1,var2):
     """
     if not var1.spatial: il.NotSpatialVariable()
     if not var2.spatial: il.NotSpatialVariable()
+    lat,lon = _regridCached(("compose",_gridHash(var1.lat,var1.lon),_gridHash(var2.lat,var2.lon)),
+                            lambda: _composeSpatialGrids(var1,var2))
+    return lat.copy(),lon.copy()
+
+def _composeSpatialGrids(var1,var2):
     def _make_bnds(x):
         bnds       = np.zeros(x.size+1)
         bnds[1:-1] = 0.5*(x[1:]+x[:-1])
@@ -955,6 +1228,11 @@ def ScoreSeasonalCycle(phase_shift):
                     area  = phase_shift.area)
 
 def _composeGrids(v1,v2):
+    grids = _regridCached(("composebnds",_gridHash(v1.lat_bnds,v1.lon_bnds),_gridHash(v2.lat_bnds,v2.lon_bnds)),
+                          lambda: _composeGridsBnds(v1,v2))
+    return tuple(g.copy() for g in grids)
+
+def _composeGridsBnds(v1,v2):
     lat_bnds = np.unique(np.hstack([v1.lat_bnds.flatten(),v2.lat_bnds.flatten()]))
     lon_bnds = np.unique(np.hstack([v1.lon_bnds.flatten(),v2.lon_bnds.flatten()]))
     lat_bnds = lat_bnds[(lat_bnds>=- 90)*(lat_bnds<=+ 90)]
@@ -1145,60 +1423,50 @@ def AnalysisMeanStateSites(ref,com,**keywords):
         shift_map.data /= 30.; shift_map.unit = "months"
 
     # Scalars
-    ref_period_mean = {}; ref_spaceint = {}; ref_mean_cycle = {}; ref_dtcycle = {}
-    com_period_mean = {}; com_spaceint = {}; com_mean_cycle = {}; com_dtcycle = {}
-    bias_val  = {}; bias_score = {}; rmse_val = {}; rmse_score = {}
-    space_std = {}; space_cor  = {}; sd_score = {}; shift = {}; shift_score = {}; iav_score = {}
-    ref_union_mean = {}; ref_comp_mean = {}
-    com_union_mean = {}; com_comp_mean = {}
+    ref_mean_cycle = {}; ref_dtcycle = {}; com_mean_cycle = {}; com_dtcycle = {}
+    rmse_val  = {}; rmse_score = {}; shift = {}; shift_score = {}; iav_score = {}
+    space_std = {}; space_cor  = {}; sd_score = {}
+    if spatial:
+        def _stats(var,**keywords):
+            keywords["mean"] = keywords.get("mean",True)
+            return var.integrateInSpace(regions=regions,**keywords)
+        ref_period_mean = _stats(ref_timeint,mean=space_mean)
+        ref_union_mean  = _stats(REF_and_com,mean=space_mean)
+        com_union_mean  = _stats(ref_and_COM,mean=space_mean)
+        ref_comp_mean   = _stats(REF_not_com,mean=space_mean)
+        com_comp_mean   = _stats(COM_not_ref,mean=space_mean)
+        ref_spaceint    = _stats(REF)
+        com_period_mean = _stats(com_timeint,mean=space_mean)
+        com_spaceint    = _stats(COM)
+    else:
+        def _stats(var,**keywords):
+            return var.siteStats(regions=regions,**keywords)
+        ref_period_mean = _stats(ref_timeint)
+        ref_spaceint    = _stats(ref)
+        com_period_mean = _stats(com_timeint)
+        com_spaceint    = _stats(com)
+        ref_union_mean = {}; ref_comp_mean = {}
+        com_union_mean = {}; com_comp_mean = {}
+    bias_val   = _stats(bias)
+    bias_score = _stats(bias_score_map,weight=normalizer)
+    if not skip_cycle:
+        ref_mean_cycle = _stats(ref_cycle)
+        com_mean_cycle = _stats(com_cycle)
+        shift          = _stats(shift_map,intabs=True)
+        shift_score    = _stats(shift_score_map,weight=normalizer)
+    if not skip_rmse:
+        rmse_val   = _stats(rmse)
+        rmse_score = _stats(rmse_score_map,weight=normalizer)
+    if not skip_iav:
+        iav_score  = _stats(iav_score_map,weight=normalizer)
     for region in regions:
+        if not skip_cycle:
+            ref_dtcycle[region] = deepcopy(ref_mean_cycle[region])
+            ref_dtcycle[region].data -= ref_mean_cycle[region].data.mean()
+            com_dtcycle[region] = deepcopy(com_mean_cycle[region])
+            com_dtcycle[region].data -= com_mean_cycle[region].data.mean()
         if spatial:
-            ref_period_mean[region] = ref_timeint    .integrateInSpace(region=region,mean=space_mean)
-            ref_union_mean [region] = REF_and_com    .integrateInSpace(region=region,mean=space_mean)
-            com_union_mean [region] = ref_and_COM    .integrateInSpace(region=region,mean=space_mean)
-            ref_comp_mean  [region] = REF_not_com    .integrateInSpace(region=region,mean=space_mean)
-            com_comp_mean  [region] = COM_not_ref    .integrateInSpace(region=region,mean=space_mean)
-            ref_spaceint   [region] = REF            .integrateInSpace(region=region,mean=True)
-            com_period_mean[region] = com_timeint    .integrateInSpace(region=region,mean=space_mean)
-            com_spaceint   [region] = COM            .integrateInSpace(region=region,mean=True)
-            bias_val       [region] = bias           .integrateInSpace(region=region,mean=True)
-            bias_score     [region] = bias_score_map .integrateInSpace(region=region,mean=True,weight=normalizer)
-            if not skip_cycle:
-                ref_mean_cycle[region] = ref_cycle   .integrateInSpace(region=region,mean=True)
-                ref_dtcycle   [region] = deepcopy(ref_mean_cycle[region])
-                ref_dtcycle   [region].data -= ref_mean_cycle[region].data.mean()
-                com_mean_cycle[region] = com_cycle  .integrateInSpace(region=region,mean=True)
-                com_dtcycle   [region] = deepcopy(com_mean_cycle[region])
-                com_dtcycle   [region].data -= com_mean_cycle[region].data.mean()
-                shift         [region] = shift_map      .integrateInSpace(region=region,mean=True,intabs=True)
-                shift_score   [region] = shift_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
-            if not skip_rmse:
-                rmse_val   [region] = rmse           .integrateInSpace(region=region,mean=True)
-                rmse_score [region] = rmse_score_map .integrateInSpace(region=region,mean=True,weight=normalizer)
-            if not skip_iav:
-                iav_score  [region] = iav_score_map .integrateInSpace(region=region,mean=True,weight=normalizer)
             space_std[region],space_cor[region],sd_score[region] = REF_timeint.spatialDistribution(COM_timeint,region=region)
-        else:
-            ref_period_mean[region] = ref_timeint    .siteStats(region=region)
-            ref_spaceint   [region] = ref            .siteStats(region=region)
-            com_period_mean[region] = com_timeint    .siteStats(region=region)
-            com_spaceint   [region] = com            .siteStats(region=region)
-            bias_val       [region] = bias           .siteStats(region=region)
-            bias_score     [region] = bias_score_map .siteStats(region=region,weight=normalizer)
-            if not skip_cycle:
-                ref_mean_cycle [region] = ref_cycle  .siteStats(region=region)
-                ref_dtcycle    [region] = deepcopy(ref_mean_cycle[region])
-                ref_dtcycle    [region].data -= ref_mean_cycle[region].data.mean()
-                com_mean_cycle [region] = com_cycle  .siteStats(region=region)
-                com_dtcycle    [region] = deepcopy(com_mean_cycle[region])
-                com_dtcycle    [region].data -= com_mean_cycle[region].data.mean()
-                shift          [region] = shift_map  .siteStats(region=region,intabs=True)
-                shift_score    [region] = shift_score_map.siteStats(region=region,weight=normalizer)
-            if not skip_rmse:
-                rmse_val   [region] = rmse           .siteStats(region=region)
-                rmse_score [region] = rmse_score_map .siteStats(region=region,weight=normalizer)
-            if not skip_iav:
-                iav_score  [region] = iav_score_map .siteStats(region=region,weight=normalizer)
 
         ref_period_mean[region].name = "Period Mean (original grids) %s" % (region)
         ref_spaceint   [region].name = "spaceint_of_%s_over_%s"        % (ref.name,region)
@@ -1313,6 +1581,205 @@ def AnalysisMeanStateSites(ref,com,**keywords):
     return
 
 
+def _timeChunks(nt,shape,mem_slab):
+    """Splits nt times into chunks whose data fits in mem_slab [Mb]."""
+    n = int(max(1,min(nt,np.floor(mem_slab*1e6/(8.*max(1,np.prod(shape)))))))
+    return [(i0,min(i0+n,nt)) for i0 in range(0,nt,n)]
+
+class TimeMoments(object):
+    """Streaming accumulator of the temporal moments of a field.
+
+    The mean state analysis needs the period mean, the mean annual
+    cycle, the standard deviation and the interannual variability of
+    a field at each spatial cell. Instead of computing each of these
+    from the full space-time array (each pass allocating full-size
+    temporaries), we accumulate the sums from which they are derived
+    over chunks of time. The period mean and annual cycle sums are
+    accumulated in a first pass, the centered sums of squares in a
+    second pass which requires the mean and cycle. Accumulators over
+    disjoint portions of time may be merged.
+
+    The derived quantities match those of Variable.integrateInTime,
+    Variable.annualCycle and Variable.rms as used in
+    AnalysisMeanStateSpace, including which cells are masked.
+
+    Parameters
+    ----------
+    time : numpy.ndarray
+        the times of the full field
+    time_bnds : numpy.ndarray
+        the time bounds of the full field
+    shape : tuple
+        the shape of the field at one time
+    cycle : bool, optional
+        enable to accumulate the mean annual cycle
+    """
+    def __init__(self,time,time_bnds,shape,cycle=False):
+        from .Variable import _createBnds
+        self.time   = time
+        self.dt     = time_bnds[:,1]-time_bnds[:,0]
+        self.dtr    = np.diff(_createBnds(time),axis=1)[:,0] # Variable.rms uses bounds created from the times
+        self.shape  = tuple(shape)
+        self.sum    = np.zeros(self.shape)
+        self.period = np.zeros(self.shape)
+        self.allmsk = np.ones (self.shape,dtype=bool)
+        self.sqsum  = np.zeros(self.shape)
+        self.rsum   = np.zeros(self.shape)
+        self.rperiod= np.zeros(self.shape)
+        self.cycle  = cycle
+        if cycle:
+            self.begin  = np.argmin(time[:11]%365)
+            self.end    = self.begin+int(time[self.begin:].size/12.)*12
+            self.csum   = np.zeros((12,)+self.shape)
+            self.ccount = np.zeros((12,)+self.shape,dtype=int)
+            self.month  = ExtendAnnualCycle(time,np.arange(12),mid_months)
+
+    def _weight(self,w,x):
+        for i in range(x.ndim-1): w = np.expand_dims(w,axis=-1)
+        return w
+
+    def accumulate(self,i0,x):
+        """First pass: add the data x of times [i0,i0+len(x)) to the period mean and cycle sums."""
+        i1 = i0 + x.shape[0]
+        m  = np.ma.getmaskarray(x)
+        xf = np.ma.filled(x,0)
+        w  = self._weight(self.dt[i0:i1],x)
+        with np.errstate(over='ignore',under='ignore'):
+            self.sum    += (xf*w).sum(axis=0)
+            self.period += (w*(m==0)).sum(axis=0)
+        self.allmsk *= m.all(axis=0)
+        if not self.cycle: return
+        j0 = max(i0,self.begin); j1 = min(i1,self.end)
+        if j1 <= j0: return
+        month = (np.arange(j0,j1)-self.begin) % 12
+        np.add.at(self.csum  ,month,xf[(j0-i0):(j1-i0)])
+        np.add.at(self.ccount,month,m [(j0-i0):(j1-i0)]==0)
+
+    def accumulateCentered(self,i0,x,mean,cycle=None):
+        """Second pass: add the squares of x less its mean (and less its cycle) for times [i0,i0+len(x))."""
+        i1 = i0 + x.shape[0]
+        m  = np.ma.getmaskarray(x)
+        xf = np.ma.filled(x,0)
+        w  = self._weight(self.dtr[i0:i1],x)*(m==0)
+        with np.errstate(over='ignore',under='ignore'):
+            self.sqsum   += (w*(xf-mean)**2).sum(axis=0)
+            self.rperiod += w.sum(axis=0)
+            if cycle is not None: self.rsum += (w*(xf-cycle[self.month[i0:i1]])**2).sum(axis=0)
+
+    def merge(self,other):
+        """Merge the sums of an accumulator over a disjoint portion of time."""
+        for key in ["sum","period","sqsum","rsum","rperiod"]:
+            self.__dict__[key] += other.__dict__[key]
+        self.allmsk *= other.allmsk
+        if self.cycle:
+            self.csum   += other.csum
+            self.ccount += other.ccount
+        return self
+
+    def mean(self):
+        """The mean over the non-masked time, masked where all times are masked."""
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.masked_array(self.sum,mask=self.allmsk) / np.ma.masked_equal(self.period,0)
+
+    def annualCycle(self):
+        """The mean annual cycle, masked where a month has no data."""
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.masked_array(self.csum/self.ccount.clip(1),mask=(self.ccount==0))
+
+    def std(self):
+        """The root mean square of the data less its mean."""
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.sqrt(np.ma.masked_array(self.sqsum,mask=self.allmsk) / np.ma.masked_equal(self.rperiod,0))
+
+    def iav(self):
+        """The root mean square of the data less its mean annual cycle."""
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.sqrt(np.ma.masked_array(self.rsum,mask=self.allmsk) / np.ma.masked_equal(self.rperiod,0))
+
+class DifferenceMoments(object):
+    """Streaming accumulator of the RMSE and centralized RMSE of two fields.
+
+    Matches Variable.rmse as used in AnalysisMeanStateSpace, the
+    difference is taken where neither field is masked and integrated
+    using the time bounds of the reference.
+
+    Parameters
+    ----------
+    time_bnds : numpy.ndarray
+        the time bounds of the reference field
+    shape : tuple
+        the shape of the fields at one time
+    """
+    def __init__(self,time_bnds,shape):
+        self.dt     = time_bnds[:,1]-time_bnds[:,0]
+        self.shape  = tuple(shape)
+        self.sq     = np.zeros(self.shape)
+        self.csq    = np.zeros(self.shape)
+        self.period = np.zeros(self.shape)
+        self.allmsk = np.ones (self.shape,dtype=bool)
+
+    def accumulate(self,i0,r,c,rmean,cmean):
+        """Add the squared differences of r and c (and of their centralized values) for times [i0,i0+len(r))."""
+        i1 = i0 + r.shape[0]
+        m  = np.ma.getmaskarray(r) + np.ma.getmaskarray(c)
+        d  = np.ma.filled(c,0)-np.ma.filled(r,0)
+        w  = self.dt[i0:i1]
+        for i in range(r.ndim-1): w = np.expand_dims(w,axis=-1)
+        w  = w*(m==0)
+        with np.errstate(over='ignore',under='ignore'):
+            self.sq     += (w*d**2).sum(axis=0)
+            self.csq    += (w*(d-(cmean-rmean))**2).sum(axis=0)
+            self.period += w.sum(axis=0)
+        self.allmsk *= m.all(axis=0)
+
+    def merge(self,other):
+        """Merge the sums of an accumulator over a disjoint portion of time."""
+        self.sq     += other.sq
+        self.csq    += other.csq
+        self.period += other.period
+        self.allmsk *= other.allmsk
+        return self
+
+    def rmse(self):
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.sqrt(np.ma.masked_array(self.sq,mask=self.allmsk) / np.ma.masked_equal(self.period,0))
+
+    def crmse(self):
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.sqrt(np.ma.masked_array(self.csq,mask=self.allmsk) / np.ma.masked_equal(self.period,0))
+
+# The reference side of the mean state analysis (the interpolated
+# reference and its temporal moments) is the same for every model of a
+# confrontation which shares the composite grid, so we keep the last
+# few computed.
+_benchmark_cache      = OrderedDict()
+_benchmark_cache_size = 1
+
+def _benchmarkCached(key,build):
+    """Returns the cached reference analysis for key, calling build() to create it if needed.
+
+    Parameters
+    ----------
+    key : tuple
+        a hashable key, None to disable caching
+    build : function
+        a function of no arguments which returns the reference analysis
+
+    Returns
+    -------
+    analysis : tuple
+        the reference analysis, which callers must not modify
+    """
+    if key is None: return build()
+    if key in _benchmark_cache:
+        _benchmark_cache.move_to_end(key)
+        return _benchmark_cache[key]
+    # release the analyses we evict before building, they may be large
+    while len(_benchmark_cache) >= max(1,_benchmark_cache_size): _benchmark_cache.popitem(last=False)
+    analysis = build()
+    _benchmark_cache[key] = analysis
+    return analysis
+
 def AnalysisMeanStateSpace(ref,com,**keywords):
     """Perform a mean state analysis.
 
@@ -1349,9 +1816,26 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
         the unit to use when displaying output in tables on the HTML page
     plots_unit : str, optional
         the unit to use when displaying output on plots on the HTML page
+    mem_slab : float, optional
+        the memory [Mb] of the chunks of time over which the temporal
+        moments of the variables are accumulated
+    benchmark_key : tuple, optional
+        a hashable key which identifies the source of the reference
+        variable, for example the benchmark file and study limits. If
+        given, the analysis of the reference alone (the interpolated
+        reference, its period mean, annual cycle and variability) is
+        kept and reused by later calls with the same key, reference
+        time span and composite grid, as when confronting many models
+        with the same benchmark.
+    slabs : ILAMB.staging.Slabs, optional
+        the variables staged in slabs of consecutive times, in which
+        case ref and com are those of its first slab. Rather than
+        holding the variables in memory, the slabs are staged twice,
+        once for each pass over time of the analysis. The analysis of
+        the reference is then not kept for reuse.
 
     """
-    from .Variable import Variable
+    from .Variable import Variable,_integrateRegions
     regions           = keywords.get("regions"          ,["global"])
     dataset           = keywords.get("dataset"          ,None)
     benchmark_dataset = keywords.get("benchmark_dataset",None)
@@ -1364,6 +1848,9 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
     skip_cycle        = keywords.get("skip_cycle"       ,False)
     ref_timeint       = keywords.get("ref_timeint"      ,None)
     com_timeint       = keywords.get("com_timeint"      ,None)
+    mem_slab          = keywords.get("mem_slab"         ,100.)
+    benchmark_key     = keywords.get("benchmark_key"    ,None)
+    slabs             = keywords.get("slabs"            ,None)
     ILAMBregions      = Regions()
     spatial           = ref.spatial
 
@@ -1375,11 +1862,15 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
     if type(skip_cycle) == type(""):
         skip_cycle = (skip_cycle.lower() == "true")
 
-    # Check if we need to skip parts of the analysis
+    # Check if we need to skip parts of the analysis, the number of
+    # times of slabs is known once they are staged
+    def _skip(nt,skip_cycle,skip_rmse,skip_iav):
+        if nt < 12       : skip_cycle = True
+        if nt == 1       : skip_rmse  = True
+        if skip_rmse     : skip_iav   = True
+        return skip_cycle,skip_rmse,skip_iav
     if not ref.monthly   : skip_cycle = True
-    if ref.time.size < 12: skip_cycle = True
-    if ref.time.size == 1: skip_rmse  = True
-    if skip_rmse         : skip_iav   = True
+    if slabs is None: skip_cycle,skip_rmse,skip_iav = _skip(ref.time.size,skip_cycle,skip_rmse,skip_iav)
     name = ref.name
 
     # Interpolate both reference and comparison to a grid composed of
@@ -1387,25 +1878,115 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
     ref.convert(plot_unit)
     com.convert(plot_unit)
     lat,lon,lat_bnds,lon_bnds = _composeGrids(ref,com)
-    REF   = ref.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
-    COM   = com.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
+    def _interpolate(V):
+        return V.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
+
+    # Rather than make many passes over the space-time arrays, we
+    # accumulate the temporal moments we need in two passes over
+    # chunks of time. The first pass accumulates the period means and
+    # annual cycles.
+    def _moments(V):
+        return TimeMoments(V.time,V.time_bnds,V.data.shape[1:],cycle=not skip_cycle)
+    def _chunks(V):
+        return _timeChunks(V.time.size,V.data.shape[1:],mem_slab)
+    def _timeint(V,moments):
+        return Variable(data = moments.mean(), unit = V.unit,
+                        name = V.name + "_integrated_over_time_and_divided_by_time_period",
+                        lat  = V.lat, lat_bnds = V.lat_bnds, lon = V.lon, lon_bnds = V.lon_bnds,
+                        depth = V.depth, depth_bnds = V.depth_bnds, area = V.area, ndata = V.ndata)
+    def _rms(V,data):
+        return Variable(data = data, unit = V.unit, name = "rms_of_%s" % V.name,
+                        lat  = V.lat, lon = V.lon, area = V.area, ndata = V.ndata)
+
+    if slabs is None:
+
+        # The reference is analyzed on its own, both passes at once, so
+        # that the analysis may be reused for other models. The moments
+        # are local to each cell, so the intersection with the comparison
+        # is only applied to the results.
+        def _benchmark(ref_timeint):
+            REF = _interpolate(ref)
+            ref_moments = _moments(REF)
+            for i0,i1 in _chunks(REF): ref_moments.accumulate(i0,REF.data[i0:i1])
+            if ref_timeint is None:
+                ref_timeint = ref.integrateInTime(mean=True).convert(plot_unit)
+                REF_timeint = _timeint(REF,ref_moments).convert(plot_unit)
+            else:
+                ref_timeint = deepcopy(ref_timeint).convert(plot_unit)
+                REF_timeint = _interpolate(ref_timeint)
+            rcycle = ref_moments.annualCycle().filled(0) if not (skip_cycle or skip_iav) else None
+            for i0,i1 in _chunks(REF): ref_moments.accumulateCentered(i0,REF.data[i0:i1],REF_timeint.data.data,rcycle)
+            return REF,ref_moments,ref_timeint,REF_timeint
+        key = None
+        if benchmark_key is not None:
+            key = (benchmark_key,ref.unit,skip_cycle,skip_iav,mem_slab,
+                   _gridHash(ref.time_bnds,ref.lat_bnds,ref.lon_bnds,lat_bnds,lon_bnds),
+                   None if ref_timeint is None else _gridHash(ref_timeint.data,ref_timeint.lat_bnds,ref_timeint.lon_bnds))
+        REF,ref_moments,ref_timeint,REF_timeint = _benchmarkCached(key,lambda: _benchmark(ref_timeint))
+        ref_timeint = deepcopy(ref_timeint)
+        REF_timeint = deepcopy(REF_timeint)
+        COM = _interpolate(com)
+        com_moments = _moments(COM)
+        for i0,i1 in _chunks(COM): com_moments.accumulate(i0,COM.data[i0:i1])
+
+        # Find the mean values over the time period
+        if com_timeint is None:
+            com_timeint = com.integrateInTime(mean=True).convert(plot_unit)
+            COM_timeint = _timeint(COM,com_moments).convert(plot_unit)
+        else:
+            com_timeint.convert(plot_unit)
+            COM_timeint = _interpolate(com_timeint)
+        time_bnds = REF.time_bnds
+
+    else:
+
+        # The first pass over the slabs accumulates the moments of each
+        # slab (and the means on the original grids), which are merged
+        # into moments over the whole time once its extent is known.
+        def _accumulated(V,cycle):
+            moments = TimeMoments(V.time,V.time_bnds,V.data.shape[1:],cycle=cycle)
+            for i0,i1 in _chunks(V): moments.accumulate(i0,V.data[i0:i1])
+            return moments
+        def _merged(total,part):
+            return part if total is None else total.merge(part)
+        REF = COM = None
+        ref_slabs = com_slabs = ref_means = com_means = None
+        time = []; time_bnds = []
+        for r,c in slabs:
+            r.convert(plot_unit)
+            c.convert(plot_unit)
+            R,C = _interpolate(r),_interpolate(c)
+            if REF is None: REF,COM = R,C
+            ref_slabs = _merged(ref_slabs,_accumulated(R,not skip_cycle))
+            com_slabs = _merged(com_slabs,_accumulated(C,not skip_cycle))
+            if ref_timeint is None: ref_means = _merged(ref_means,_accumulated(r,False))
+            if com_timeint is None: com_means = _merged(com_means,_accumulated(c,False))
+            time     .append(R.time)
+            time_bnds.append(R.time_bnds)
+        time      = np.hstack(time)
+        time_bnds = np.vstack(time_bnds)
+        skip_cycle,skip_rmse,skip_iav = _skip(time.size,skip_cycle,skip_rmse,skip_iav)
+        ref_moments = TimeMoments(time,time_bnds,REF.data.shape[1:],cycle=not skip_cycle).merge(ref_slabs)
+        com_moments = TimeMoments(time,time_bnds,COM.data.shape[1:],cycle=not skip_cycle).merge(com_slabs)
+        del ref_slabs,com_slabs
+
+        # Find the mean values over the time period
+        if ref_timeint is None:
+            ref_timeint = _timeint(ref,ref_means).convert(plot_unit)
+            REF_timeint = _timeint(REF,ref_moments).convert(plot_unit)
+        else:
+            ref_timeint = deepcopy(ref_timeint).convert(plot_unit)
+            REF_timeint = _interpolate(ref_timeint)
+        if com_timeint is None:
+            com_timeint = _timeint(com,com_means).convert(plot_unit)
+            COM_timeint = _timeint(COM,com_moments).convert(plot_unit)
+        else:
+            com_timeint.convert(plot_unit)
+            COM_timeint = _interpolate(com_timeint)
+    nt    = time_bnds.shape[0]
     unit  = REF.unit
     area  = REF.area
     ndata = REF.ndata
-            
-    # Find the mean values over the time period
-    if ref_timeint is None:
-        ref_timeint = ref.integrateInTime(mean=True).convert(plot_unit)
-        REF_timeint = REF.integrateInTime(mean=True).convert(plot_unit)
-    else:
-        ref_timeint.convert(plot_unit)
-        REF_timeint = ref_timeint.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
-    if com_timeint is None:
-        com_timeint = com.integrateInTime(mean=True).convert(plot_unit)
-        COM_timeint = COM.integrateInTime(mean=True).convert(plot_unit)
-    else:
-        com_timeint.convert(plot_unit)
-        COM_timeint = com_timeint.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
     normalizer  = REF_timeint.data if mass_weighting else None
 
     # Report period mean values over all possible representations of
@@ -1417,64 +1998,126 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
 
         ref_timeint.name = "timeint_of_%s" % name
         ref_timeint.toNetCDF4(benchmark_dataset,group="MeanState")
-        for region in regions:
 
-            # reference period mean on original grid
-            ref_period_mean = ref_timeint.integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            ref_period_mean.name = "Period Mean (original grids) %s" % region
-            ref_period_mean.toNetCDF4(benchmark_dataset,group="MeanState")
+        # reference period mean on original grid
+        ref_period_mean = ref_timeint.integrateInSpace(regions=regions,mean=space_mean)
+        for region in regions:
+            ref_period_mean[region].convert(table_unit)
+            ref_period_mean[region].name = "Period Mean (original grids) %s" % region
+            ref_period_mean[region].toNetCDF4(benchmark_dataset,group="MeanState")
 
     if dataset is not None:
 
         com_timeint.name = "timeint_of_%s" % name
         com_timeint.toNetCDF4(dataset,group="MeanState")
-        for region in regions:
 
-            # reference period mean on intersection of land
-            ref_union_mean = Variable(name = "REF_and_com", unit = REF_timeint.unit,
-                                      data = np.ma.masked_array(REF_timeint.data,mask=(ref_and_com==False)),
-                                      lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
-                                      area = REF_timeint.area).integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            ref_union_mean.name = "Benchmark Period Mean (intersection) %s" % region
-            ref_union_mean.toNetCDF4(dataset,group="MeanState")
-
-            # reference period mean on complement of land
-            ref_comp_mean = Variable(name = "REF_not_com", unit = REF_timeint.unit,
-                                     data = np.ma.masked_array(REF_timeint.data,mask=(ref_not_com==False)),
-                                     lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
-                                     area = REF_timeint.area).integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            ref_comp_mean.name = "Benchmark Period Mean (complement) %s" % region
-            ref_comp_mean.toNetCDF4(dataset,group="MeanState")
-
-            # comparison period mean on original grid
-            com_period_mean = com_timeint.integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            com_period_mean.name = "Period Mean (original grids) %s" % region
-            com_period_mean.toNetCDF4(dataset,group="MeanState")
-
-            # comparison period mean on intersection of land
-            com_union_mean = Variable(name = "ref_and_COM", unit = COM_timeint.unit,
-                                      data = np.ma.masked_array(COM_timeint.data,mask=(ref_and_com==False)),
-                                      lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
-                                      area = COM_timeint.area).integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            com_union_mean.name = "Model Period Mean (intersection) %s" % region
-            com_union_mean.toNetCDF4(dataset,group="MeanState")
-
-            # comparison period mean on complement of land
-            com_comp_mean = Variable(name = "COM_not_ref", unit = COM_timeint.unit,
-                                     data = np.ma.masked_array(COM_timeint.data,mask=(com_not_ref==False)),
-                                     lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
-                                     area = COM_timeint.area).integrateInSpace(region=region,mean=space_mean).convert(table_unit)
-            com_comp_mean.name = "Model Period Mean (complement) %s" % region
-            com_comp_mean.toNetCDF4(dataset,group="MeanState")
+        # reference period mean on intersection of land
+        ref_union_mean = Variable(name = "REF_and_com", unit = REF_timeint.unit,
+                                  data = np.ma.masked_array(REF_timeint.data,mask=(ref_and_com==False)),
+                                  lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
+                                  area = REF_timeint.area).integrateInSpace(regions=regions,mean=space_mean)
+
+        # reference period mean on complement of land
+        ref_comp_mean = Variable(name = "REF_not_com", unit = REF_timeint.unit,
+                                 data = np.ma.masked_array(REF_timeint.data,mask=(ref_not_com==False)),
+                                 lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
+                                 area = REF_timeint.area).integrateInSpace(regions=regions,mean=space_mean)
+
+        # comparison period mean on original grid
+        com_period_mean = com_timeint.integrateInSpace(regions=regions,mean=space_mean)
+
+        # comparison period mean on intersection of land
+        com_union_mean = Variable(name = "ref_and_COM", unit = COM_timeint.unit,
+                                  data = np.ma.masked_array(COM_timeint.data,mask=(ref_and_com==False)),
+                                  lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
+                                  area = COM_timeint.area).integrateInSpace(regions=regions,mean=space_mean)
+
+        # comparison period mean on complement of land
+        com_comp_mean = Variable(name = "COM_not_ref", unit = COM_timeint.unit,
+                                 data = np.ma.masked_array(COM_timeint.data,mask=(com_not_ref==False)),
+                                 lat  = lat, lat_bnds = lat_bnds, lon  = lon, lon_bnds = lon_bnds,
+                                 area = COM_timeint.area).integrateInSpace(regions=regions,mean=space_mean)
+
+        for region in regions:
+            for val,label in [(ref_union_mean ,"Benchmark Period Mean (intersection)"),
+                              (ref_comp_mean  ,"Benchmark Period Mean (complement)"),
+                              (com_period_mean,"Period Mean (original grids)"),
+                              (com_union_mean ,"Model Period Mean (intersection)"),
+                              (com_comp_mean  ,"Model Period Mean (complement)")]:
+                val[region].convert(table_unit)
+                val[region].name = "%s %s" % (label,region)
+                val[region].toNetCDF4(dataset,group="MeanState")
 
     # Now that we are done reporting on the intersection / complement,
-    # set all masks to the intersection
-    REF.data.mask += np.ones(REF.time.size,dtype=bool)[:,np.newaxis,np.newaxis] * (ref_and_com==False)
-    COM.data.mask += np.ones(COM.time.size,dtype=bool)[:,np.newaxis,np.newaxis] * (ref_and_com==False)
+    # set all masks to the intersection (the reference may be shared,
+    # it is masked when integrated in space below)
+    if slabs is None: COM.data.mask += np.ones(COM.time.size,dtype=bool)[:,np.newaxis,np.newaxis] * (ref_and_com==False)
     REF_timeint.data.mask = (ref_and_com==False)
     COM_timeint.data.mask = (ref_and_com==False)
     if mass_weighting: normalizer.mask = (ref_and_com==False)
 
+    # The second pass accumulates the squares of the comparison less
+    # its mean and annual cycle, and of the differences. As every
+    # moment is local to a cell, the intersection mask is then simply
+    # added to the results.
+    def _cycle(V,moments):
+        data = moments.annualCycle()
+        data.mask += (ref_and_com==False)
+        return Variable(data = data, unit = V.unit, name = "annual_cycle_mean_of_%s" % V.name,
+                        time = mid_months, time_bnds = np.asarray([bnd_months[:-1],bnd_months[1:]]).T,
+                        lat  = V.lat, lat_bnds = V.lat_bnds, lon = V.lon, lon_bnds = V.lon_bnds,
+                        area = V.area, depth = V.depth, depth_bnds = V.depth_bnds, ndata = V.ndata)
+    def _masked(data):
+        data.mask += (ref_and_com==False)
+        return data
+    if not skip_cycle:
+        ref_cycle = _cycle(REF,ref_moments)
+        com_cycle = _cycle(COM,com_moments)
+    differences = None if skip_rmse else DifferenceMoments(time_bnds,REF.data.shape[1:])
+    rmean,cmean = REF_timeint.data.data,COM_timeint.data.data
+    ccycle      = com_cycle.data.filled(0) if not (skip_cycle or skip_iav) else None
+    if slabs is None:
+        if differences is not None:
+            for i0,i1 in _chunks(REF): differences.accumulate(i0,REF.data[i0:i1],COM.data[i0:i1],rmean,cmean)
+        if not (skip_cycle or skip_iav):
+            for i0,i1 in _chunks(COM): com_moments.accumulateCentered(i0,COM.data[i0:i1],cmean,ccycle)
+    else:
+
+        # The second pass over the slabs also integrates the slabs in
+        # space, on the intersection and with the measure masked where
+        # all times are masked, as Variable.integrateInSpace would on
+        # the whole time
+        def _spaceints(V,allmsk):
+            mask = allmsk + (ref_and_com==False)
+            data = np.ma.masked_array(V.data,mask=np.ma.getmaskarray(V.data)+(ref_and_com==False))
+            while mask.ndim > 2: mask = np.all(mask,axis=0)
+            measure = np.ma.masked_array(V.area,mask=mask,copy=True)
+            return _integrateRegions(data,measure,ILAMBregions.getWeights(regions,V),mean=True)
+        rcycle = ref_moments.annualCycle().filled(0) if not (skip_cycle or skip_iav) else None
+        ref_spaceints = []; com_spaceints = []
+        i = 0
+        for r,c in slabs:
+            r.convert(plot_unit)
+            c.convert(plot_unit)
+            R,C = _interpolate(r),_interpolate(c)
+            for i0,i1 in _chunks(R):
+                ref_moments.accumulateCentered(i+i0,R.data[i0:i1],rmean,rcycle)
+                if differences is not None:
+                    differences.accumulate(i+i0,R.data[i0:i1],C.data[i0:i1],rmean,cmean)
+                if not (skip_cycle or skip_iav):
+                    com_moments.accumulateCentered(i+i0,C.data[i0:i1],cmean,ccycle)
+            if nt > 1 and benchmark_dataset is not None: ref_spaceints.append(_spaceints(R,ref_moments.allmsk))
+            if nt > 1 and dataset           is not None: com_spaceints.append(_spaceints(C,com_moments.allmsk))
+            i += R.time.size
+        def _spaceint(V,spaceints):
+            spaceints = np.ma.concatenate(spaceints,axis=1)
+            return dict([(region,Variable(data = spaceints[k], unit = V.unit, name = V.name,
+                                          time = time, time_bnds = time_bnds,
+                                          depth = V.depth, depth_bnds = V.depth_bnds))
+                         for k,region in enumerate(regions)])
+        if len(ref_spaceints) > 0: ref_spaceints = _spaceint(REF,ref_spaceints)
+        if len(com_spaceints) > 0: com_spaceints = _spaceint(COM,com_spaceints)
+
     # Spatial Distribution: scalars and scores
     if dataset is not None:
         for region in regions:
@@ -1486,10 +2129,8 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
 
     # Cycle: maps, scalars, and scores
     if not skip_cycle:
-        ref_cycle         = REF.annualCycle()
         ref_maxt_map      = ref_cycle.timeOfExtrema(etype="max")
         ref_maxt_map.name = "phase_map_of_%s" % name
-        com_cycle         = COM.annualCycle()
         com_maxt_map      = com_cycle.timeOfExtrema(etype="max")
         com_maxt_map.name = "phase_map_of_%s" % name
         shift_map         = ref_maxt_map.phaseShift(com_maxt_map)
@@ -1499,8 +2140,9 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
         shift_map.data   /= 30.; shift_map.unit = "months"
         if benchmark_dataset is not None:
             ref_maxt_map.toNetCDF4(benchmark_dataset,group="MeanState")
+            ref_mean_cycles = ref_cycle.integrateInSpace(regions=regions,mean=True)
             for region in regions:
-                ref_mean_cycle      = ref_cycle.integrateInSpace(region=region,mean=True)
+                ref_mean_cycle      = ref_mean_cycles[region]
                 ref_mean_cycle.name = "cycle_of_%s_over_%s" % (name,region)
                 ref_mean_cycle.toNetCDF4(benchmark_dataset,group="MeanState")
                 ref_dtcycle       = deepcopy(ref_mean_cycle)
@@ -1511,16 +2153,19 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
             com_maxt_map.toNetCDF4(dataset,group="MeanState")
             shift_map      .toNetCDF4(dataset,group="MeanState")
             shift_score_map.toNetCDF4(dataset,group="MeanState")
+            com_mean_cycles = com_cycle.integrateInSpace(regions=regions,mean=True)
+            shifts          = shift_map.integrateInSpace(regions=regions,mean=True,intabs=True)
+            shift_scores    = shift_score_map.integrateInSpace(regions=regions,mean=True,weight=normalizer)
             for region in regions:
-                com_mean_cycle      = com_cycle.integrateInSpace(region=region,mean=True)
+                com_mean_cycle      = com_mean_cycles[region]
                 com_mean_cycle.name = "cycle_of_%s_over_%s" % (name,region)
                 com_mean_cycle.toNetCDF4(dataset,group="MeanState")
                 com_dtcycle       = deepcopy(com_mean_cycle)
                 com_dtcycle.data -= com_mean_cycle.data.mean()
                 com_dtcycle.name  = "dtcycle_of_%s_over_%s" % (name,region)
                 com_dtcycle.toNetCDF4(dataset,group="MeanState")
-                shift       = shift_map.integrateInSpace(region=region,mean=True,intabs=True)
-                shift_score = shift_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
+                shift       = shifts[region]
+                shift_score = shift_scores[region]
                 shift      .name = "Phase Shift %s" % region
                 shift      .toNetCDF4(dataset,group="MeanState")
                 shift_score.name = "Seasonal Cycle Score %s" % region
@@ -1530,16 +2175,8 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
 
         # IAV: maps, scalars, scores
         if not skip_iav:
-            REF_iav = Variable(data = np.ma.masked_array(REF.data-ExtendAnnualCycle(REF.time,ref_cycle.data,ref_cycle.time),mask=REF.data.mask),
-                               unit = unit,
-                               time = REF.time, time_bnds = REF.time_bnds,
-                               lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds,
-                               area = REF.area, ndata = REF.ndata).rms()
-            COM_iav = Variable(data = np.ma.masked_array(COM.data-ExtendAnnualCycle(COM.time,com_cycle.data,com_cycle.time),mask=COM.data.mask),
-                               unit = unit,
-                               time = COM.time, time_bnds = COM.time_bnds,
-                               lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds,
-                               area = COM.area, ndata = COM.ndata).rms()
+            REF_iav = _rms(REF,_masked(ref_moments.iav()))
+            COM_iav = _rms(COM,_masked(com_moments.iav()))
             iav_score_map = Score(Variable(name = "diff %s" % name, unit = unit,
                                            data = (COM_iav.data-REF_iav.data),
                                            lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds,
@@ -1553,64 +2190,65 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
                 COM_iav.toNetCDF4(dataset,group="MeanState")
                 iav_score_map.name = "iavscore_map_of_%s"  % name
                 iav_score_map.toNetCDF4(dataset,group="MeanState")
+                iav_scores = iav_score_map.integrateInSpace(regions=regions,mean=True,weight=normalizer)
                 for region in regions:
-                    iav_score = iav_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
+                    iav_score = iav_scores[region]
                     iav_score.name = "Interannual Variability Score %s" % region
                     iav_score.toNetCDF4(dataset,group="MeanState")
             del ref_cycle,com_cycle,REF_iav,COM_iav,iav_score_map
 
     # Bias: maps, scalars, and scores
     bias = REF_timeint.bias(COM_timeint).convert(plot_unit)
-    cREF = Variable(name = "centralized %s" % name, unit = REF.unit,
-                    data = np.ma.masked_array(REF.data-REF_timeint.data[np.newaxis,...],mask=REF.data.mask),
-                    time = REF.time, time_bnds = REF.time_bnds, ndata = REF.ndata,
-                    lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds, area = REF.area).convert(plot_unit)
-    REF_std = cREF.rms()
-    if skip_rmse: del cREF
-    bias_score_map = Score(bias,REF_std if REF.time.size > 1 else REF_timeint)
+    REF_std = _rms(REF,_masked(ref_moments.std()))
+    REF_std.name = "rms_of_centralized %s" % name
+    bias_score_map = Score(bias,REF_std if nt > 1 else REF_timeint)
     bias_score_map.data.mask = (ref_and_com==False) # for some reason I need to explicitly force the mask
     if dataset is not None:
         bias.name = "bias_map_of_%s" % name
         bias.toNetCDF4(dataset,group="MeanState")
         bias_score_map.name = "biasscore_map_of_%s" % name
         bias_score_map.toNetCDF4(dataset,group="MeanState")
+        bias_vals   = bias.integrateInSpace(regions=regions,mean=True)
+        bias_scores = bias_score_map.integrateInSpace(regions=regions,mean=True,weight=normalizer)
         for region in regions:
-            bias_val = bias.integrateInSpace(region=region,mean=True).convert(plot_unit)
+            bias_val = bias_vals[region].convert(plot_unit)
             bias_val.name = "Bias %s" % region
             bias_val.toNetCDF4(dataset,group="MeanState")
-            bias_score = bias_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
+            bias_score = bias_scores[region]
             bias_score.name = "Bias Score %s" % region
             bias_score.toNetCDF4(dataset,group="MeanState")
     del bias,bias_score_map
 
     # Spatial mean: plots
-    if REF.time.size > 1:
+    if nt > 1:
         if benchmark_dataset is not None:
+            if slabs is None:
+                REF_masked      = copy(REF)
+                REF_masked.data = np.ma.masked_array(REF.data.data,
+                                                     mask=np.ma.getmaskarray(REF.data)+(ref_and_com==False)[np.newaxis,...])
+                ref_spaceints   = REF_masked.integrateInSpace(regions=regions,mean=True)
+                del REF_masked
             for region in regions:
-                ref_spaceint = REF.integrateInSpace(region=region,mean=True)
+                ref_spaceint = ref_spaceints[region]
                 ref_spaceint.name = "spaceint_of_%s_over_%s" % (name,region)
                 ref_spaceint.toNetCDF4(benchmark_dataset,group="MeanState")
         if dataset is not None:
+            if slabs is None: com_spaceints = COM.integrateInSpace(regions=regions,mean=True)
             for region in regions:
-                com_spaceint = COM.integrateInSpace(region=region,mean=True)
+                com_spaceint = com_spaceints[region]
                 com_spaceint.name = "spaceint_of_%s_over_%s" % (name,region)
                 com_spaceint.toNetCDF4(dataset,group="MeanState")
 
     # RMSE: maps, scalars, and scores
     if not skip_rmse:
-        rmse = REF.rmse(COM).convert(plot_unit)
+        rmse = _rms(REF,_masked(differences.rmse()))
+        rmse.name = "rmse_of_%s" % REF.name
         del REF
-        cCOM = Variable(name = "centralized %s" % name, unit = unit,
-                        data = np.ma.masked_array(COM.data-COM_timeint.data[np.newaxis,...],mask=COM.data.mask),
-                        time = COM.time, time_bnds = COM.time_bnds,
-                        lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds,
-                        area = COM.area, ndata = COM.ndata).convert(plot_unit)
-        
+
         try:
             import psutil
-            comm = MPI.COMM_WORLD
-            rank = comm.Get_rank()
-            pname = MPI.Get_processor_name()
+            rank = GetRank()
+            pname = GetProcessorName()
             process = psutil.Process(os.getpid())
             used = process.memory_info().rss*1e-9
             msg = "[%d][%s] Process peak memory %.2f [Gb]" % (rank,pname,used)
@@ -1619,19 +2257,21 @@ def AnalysisMeanStateSpace(ref,com,**keywords):
             pass
         
         del COM
-        crmse = cREF.rmse(cCOM).convert(plot_unit)
-        del cREF,cCOM
+        crmse = _rms(REF_std,_masked(differences.crmse()))
+        crmse.name = "rmse_of_centralized %s" % name
         rmse_score_map = Score(crmse,REF_std)
         if dataset is not None:
             rmse.name = "rmse_map_of_%s" % name
             rmse.toNetCDF4(dataset,group="MeanState")
             rmse_score_map.name = "rmsescore_map_of_%s" % name
             rmse_score_map.toNetCDF4(dataset,group="MeanState")
+            rmse_vals   = rmse.integrateInSpace(regions=regions,mean=True)
+            rmse_scores = rmse_score_map.integrateInSpace(regions=regions,mean=True,weight=normalizer)
             for region in regions:
-                rmse_val = rmse.integrateInSpace(region=region,mean=True).convert(plot_unit)
+                rmse_val = rmse_vals[region].convert(plot_unit)
                 rmse_val.name = "RMSE %s" % region
                 rmse_val.toNetCDF4(dataset,group="MeanState")
-                rmse_score = rmse_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
+                rmse_score = rmse_scores[region]
                 rmse_score.name = "RMSE Score %s" % region
                 rmse_score.toNetCDF4(dataset,group="MeanState")
         del rmse,crmse,rmse_score_map
@@ -1763,17 +2403,15 @@ def MakeComparable(ref,com,**keywords):
         deps = 1.0
 
         # prune the reference
-        r    = np.sqrt((ref.lat[:,np.newaxis]-com.lat)**2+(ref.lon[:,np.newaxis]-com.lon)**2)
-        rind = r.argmin(axis=0)
-        rind = rind[np.where(r[rind,range(com.ndata)]<deps)]
+        rind,r = NearestSites(ref.lat,ref.lon,com.lat,com.lon)
+        rind = rind[np.where(r<deps)]
         ref.lat = ref.lat[rind]; ref.lon = ref.lon[rind]; ref.data = ref.data[...,rind]
         msg  = "%s Pruned %d sites from the reference and " % (logstring,ref.ndata-ref.lat.size)
         ref.ndata = ref.lat.size
 
         # prune the comparison
-        r    = np.sqrt((com.lat[:,np.newaxis]-ref.lat)**2+(com.lon[:,np.newaxis]-ref.lon)**2)
-        rind = r.argmin(axis=0)
-        rind = rind[np.where(r[rind,range(ref.ndata)]<deps)]
+        rind,r = NearestSites(com.lat,com.lon,ref.lat,ref.lon)
+        rind = rind[np.where(r<deps)]
         com.lat = com.lat[rind]; com.lon = com.lon[rind]; com.data = com.data[...,rind]
         msg += "%d sites from the comparison." % (com.ndata-com.lat.size)
         com.ndata = com.lat.size
@@ -1904,6 +2542,28 @@ def MakeComparable(ref,com,**keywords):
     return ref,com
 
 
+def _checkMonotonicity(t0,tf,filenames):
+    """Raises a MonotonicityError if the pieces of a variable, ordered
+    by initial time, overlap or are out of order.
+    """
+    nV = len(t0)
+    if nV < 2: return
+    if (((t0[1:]-t0[:-1]).min() < 0) or
+        ((tf[1:]-tf[:-1]).min() < 0) or
+        ((t0[1:]-tf[:-1]).min() < 0)):
+        msg = "[MonotonicityError]"
+        for i in range(nV):
+            err = ""
+            if i > 0     :
+                err += "" if t0[i]   > tf[i-1] else "*"
+                err += "" if t0[i]   > t0[i-1] else "*"
+            if i < (nV-1):
+                err += "" if tf[i+1] > t0[i  ] else "*"
+                err += "" if tf[i+1] > tf[i  ] else "*"
+            msg  += "\n  %2d: t = [%.3f, %.3f] %2s %s" % (i,t0[i],tf[i],err,filenames[i])
+        logger.debug(msg)
+        raise MonotonicityError()
+
 def CombineVariables(V):
     """Combines a list of variables into a single variable.
 
@@ -1941,23 +2601,7 @@ def CombineVariables(V):
         tf[i] = v.time[-1]
         nt[i] = v.time.size
         ind.append(nt[:(i+1)].sum())
-
-    # Checks on monotonicity
-    if (((t0[1:]-t0[:-1]).min() < 0) or
-        ((tf[1:]-tf[:-1]).min() < 0) or
-        ((t0[1:]-tf[:-1]).min() < 0)):
-        msg = "[MonotonicityError]"
-        for i in range(nV):
-            err = ""
-            if i > 0     :
-                err += "" if t0[i]   > tf[i-1] else "*"
-                err += "" if t0[i]   > t0[i-1] else "*"
-            if i < (nV-1):
-                err += "" if tf[i+1] > t0[i  ] else "*"
-                err += "" if tf[i+1] > tf[i  ] else "*"
-            msg  += "\n  %2d: t = [%.3f, %.3f] %2s %s" % (i,t0[i],tf[i],err,V[i].filename)
-        logger.debug(msg)
-        raise MonotonicityError()
+    _checkMonotonicity(t0,tf,[v.filename for v in V])
 
     # Assemble the data
     shp       = (nt.sum(),)+V[0].data.shape[1:]
@@ -1992,6 +2636,110 @@ def CombineVariables(V):
                     area       = v.area,
                     ndata      = v.ndata)
 
+def CombineVariablesFromFiles(read,args,counts,workers=2):
+    """Reads pieces of a variable in parallel and combines them into a single variable.
+
+    This routine has the same result as reading each piece and then
+    calling CombineVariables, but the combined arrays are allocated
+    once and each piece is copied into its slice as soon as it is
+    read. Only the pieces currently being read are held in memory
+    alongside the combined variable.
+
+    Parameters
+    ----------
+    read : function
+        a module level (picklable) function which returns an ILAMB.Variable.Variable
+        when called with one of the entries of *args*
+    args : list of tuple
+        the arguments with which to call *read* for each piece
+    counts : list of int
+        the number of times each piece is expected to contribute
+    workers : int, optional
+        the number of processes in the pool
+
+    Returns
+    -------
+    v : ILAMB.Variable.Variable
+        the merged variable
+
+    Raises
+    ------
+    IngestError
+        if the pool of processes broke or a piece does not have the
+        expected times or shape, in which case the pieces may still
+        be read one after the other. Errors raised while reading a
+        piece are passed on as they are.
+
+    Notes
+    -----
+    The pool forks the calling process, which is not safe once MPI
+    has been initialized with most MPI libraries, so this should not
+    be used from processes launched by mpirun.
+    """
+    from concurrent.futures import ProcessPoolExecutor,as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    from .Variable import Variable
+    assert len(args) == len(counts)
+    ind = np.hstack([0,np.cumsum(counts)]).astype(int)
+
+    v0        = None
+    time      = np.zeros(ind[-1])
+    time_bnds = np.zeros((ind[-1],2))
+    data      = None
+    mask      = None
+    t0        = np.zeros(len(args))
+    tf        = np.zeros(len(args))
+    filenames = [None]*len(args)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read,*arg):i for i,arg in enumerate(args)}
+        for future in as_completed(futures):
+            i = futures.pop(future)
+            try:
+                v = future.result()
+            except BrokenProcessPool as ex:
+                raise IngestError() from ex
+            del future
+            if v is None or not v.temporal or v.time.size != counts[i]:
+                logger.debug("Piece %d of the variable does not have the expected %d times" % (i,counts[i]))
+                raise IngestError()
+            if data is None:
+                shp  = (ind[-1],)+v.data.shape[1:]
+                data = np.zeros(shp)
+                mask = np.zeros(shp,dtype=bool)
+            if v.data.shape[1:] != data.shape[1:]:
+                logger.debug("Piece %d of the variable has shape %s, expected %s" % (i,str(v.data.shape[1:]),str(data.shape[1:])))
+                raise IngestError()
+            time     [ind[i]:ind[i+1]]     = v.time
+            time_bnds[ind[i]:ind[i+1],...] = v.time_bnds
+            data     [ind[i]:ind[i+1],...] = v.data
+            mask     [ind[i]:ind[i+1],...] = v.data.mask
+            t0[i],tf[i],filenames[i] = v.time[0],v.time[-1],v.filename
+
+            # keep only the first piece's coordinates, not its data
+            if v0 is None:
+                v0 = v
+                v0.data = None
+            del v
+    _checkMonotonicity(t0,tf,filenames)
+
+    # see CombineVariables
+    if np.any((time_bnds[:,1]-time_bnds[:,0])<1e-12): time_bnds = None
+
+    v = v0
+    return Variable(data       = np.ma.masked_array(data,mask=mask),
+                    unit       = v.unit,
+                    name       = v.name,
+                    time       = time,
+                    time_bnds  = time_bnds,
+                    depth      = v.depth,
+                    depth_bnds = v.depth_bnds,
+                    lat        = v.lat,
+                    lon        = v.lon,
+                    lat_bnds   = v.lat_bnds,
+                    lon_bnds   = v.lon_bnds,
+                    area       = v.area,
+                    ndata      = v.ndata)
+
 def ConvertBoundsTypes(x):
     y = None
     if x.ndim == 2:
@@ -2033,28 +2781,92 @@ def LandLinInterMissingValues(mdata):
     smooth  = (mdata.mask==True)*smooth + (mdata.mask==False)*mdata.data
     return smooth
 
+def ResultsComplete(filename):
+    """Checks if a results file exists and was completed.
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the netCDF4 results file
+
+    Returns
+    -------
+    complete : bool
+        True if the file has the 'complete' attribute set
+    """
+    if not os.path.isfile(filename): return False
+    try:
+        with Dataset(filename) as dset:
+            return bool("complete" in dset.ncattrs() and dset.complete)
+    except Exception:
+        return False
+
+class AtomicDataset():
+    """A netCDF4 dataset opened for writing which replaces the file only once written.
+
+    The dataset is written to a temporary file next to the given one,
+    which is moved onto it when closed without an exception and
+    removed otherwise. Readers of the file therefore see either the
+    previous file or the complete new one, and several processes may
+    write the same results at once. If replace is False, the file is
+    only written if it is absent or incomplete when closed, so that
+    these writers never overwrite the results of another.
+    """
+    def __init__(self,filename,replace=True):
+
+        self.filename = filename
+        self.replace  = replace
+        self.tmp      = "%s.%s.%d.tmp" % (filename,GetProcessorName(),os.getpid())
+        self.dset     = None
+
+    def __enter__(self):
+
+        self.dset = Dataset(self.tmp,mode="w")
+        return self.dset
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.dset.close()
+        if exc_type is not None:
+            os.remove(self.tmp)
+        elif self.replace or (os.path.isfile(self.filename) and not ResultsComplete(self.filename)):
+            os.replace(self.tmp,self.filename)
+        else:
+            # linking fails if the file was written in the meantime
+            try:
+                os.link(self.tmp,self.filename)
+            except FileExistsError:
+                pass
+            os.remove(self.tmp)
+
 class FileContextManager():
 
-    def __init__(self,master,mod_results,obs_results):
+    def __init__(self,master,mod_results,obs_results,replace=True):
 
         self.master       = master
+        self.replace      = replace
         self.mod_results  = mod_results
         self.obs_results  = obs_results
         self.mod_dset     = None
         self.obs_dset     = None
+        self.obs_atomic   = None
 
     def __enter__(self):
 
-        # Open the file on entering, both if you are the master
-        self.mod_dset                 = Dataset(self.mod_results,mode="w")
-        if self.master: self.obs_dset = Dataset(self.obs_results,mode="w")
+        # Open the file on entering, both if you are the master. The
+        # benchmark results are written atomically as any pair may
+        # write them.
+        self.mod_dset = Dataset(self.mod_results,mode="w")
+        if self.master:
+            self.obs_atomic = AtomicDataset(self.obs_results,replace=self.replace)
+            self.obs_dset   = self.obs_atomic.__enter__()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
 
         # Always close the file(s) on exit
         self.mod_dset.close()
-        if self.master: self.obs_dset.close()
+        if self.master: self.obs_atomic.__exit__(exc_type,exc_value,traceback)
 
         # If an exception occurred, also remove the files
         if exc_type is not None:
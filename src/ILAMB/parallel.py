@@ -0,0 +1,165 @@
+"""Backends which distribute the work of an ILAMB study among processes.
+
+ILAMB may run in parallel through MPI (launched with mpirun) or on a
+single node through a pool of processes. The backends share a small
+interface (rank, size, barrier, gather, bcast, reduce, abort and map)
+so that the driver need not know which is in use. The mpi4py package
+is optional, without it only the process pool backend is available.
+
+"""
+from concurrent.futures import ProcessPoolExecutor,as_completed
+import numpy as np
+import platform,sys
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+def GetRank():
+    """Returns the MPI rank of this process, 0 if mpi4py is not available."""
+    if MPI is None: return 0
+    return MPI.COMM_WORLD.rank
+
+def GetProcessorName():
+    """Returns the name of the processor (node) of this process."""
+    if MPI is None: return platform.node()
+    return MPI.Get_processor_name()
+
+class MPIBackend(object):
+    """Distributes work among the processes of an MPI communicator.
+
+    Work is handed out dynamically, each process taking the next item
+    of the work list by atomically incrementing a counter held by the
+    root process, so no process sits idle while another works through
+    a long list of expensive items.
+
+    Parameters
+    ----------
+    comm : mpi4py.MPI.Comm, optional
+        the communicator, MPI.COMM_WORLD by default
+    """
+    def __init__(self,comm=None):
+        if MPI is None: raise ImportError("The MPI backend requires mpi4py")
+        self.comm = MPI.COMM_WORLD if comm is None else comm
+        self.rank = self.comm.Get_rank()
+        self.size = self.comm.Get_size()
+
+    def barrier(self):
+        self.comm.Barrier()
+
+    def gather(self,obj,root=0):
+        return self.comm.gather(obj,root=root)
+
+    def bcast(self,obj,root=0):
+        return self.comm.bcast(obj,root=root)
+
+    def reduce(self,array,root=0):
+        """Returns the sum of the arrays of all processes on the root, None elsewhere."""
+        out = np.zeros(array.shape,dtype=array.dtype) if self.rank == root else None
+        self.comm.Reduce(array,out,root=root)
+        return out
+
+    def abort(self,code=0):
+        self.comm.Abort(code)
+
+    def map(self,func,W,*args):
+        """Calls func(*w,*args) for the items w of W handed to this process.
+
+        Every process must pass the same work list and iterate over
+        all of the results.
+
+        Yields
+        ------
+        w,result : the work item and the result of the function
+        """
+        if self.size == 1:
+            for w in W: yield w,func(*(tuple(w)+args))
+            return
+        itemsize = MPI.INT.Get_size()
+        win = MPI.Win.Allocate(itemsize if self.rank == 0 else 0,itemsize,comm=self.comm)
+        if self.rank == 0: np.frombuffer(win.tomemory(),dtype='i')[0] = 0
+        self.comm.Barrier()
+        one   = np.ones (1,dtype='i')
+        index = np.zeros(1,dtype='i')
+        while True:
+            win.Lock(0)
+            win.Fetch_and_op(one,index,0)
+            win.Unlock(0)
+            if index[0] >= len(W): break
+            w = W[index[0]]
+            yield w,func(*(tuple(w)+args))
+        win.Free()
+
+class ProcessBackend(object):
+    """Distributes work among a pool of processes on a single node.
+
+    The calling process is the only rank, it submits the work items to
+    the pool and collects their results as they complete. As the work
+    is done in other processes, the functions and their arguments must
+    be picklable and any changes the functions make to their arguments
+    are not seen by the caller, only the returned results.
+
+    Parameters
+    ----------
+    workers : int, optional
+        the number of processes in the pool, all cores by default. If
+        1, the work is done in this process.
+    """
+    def __init__(self,workers=None):
+        self.rank    = 0
+        self.size    = 1
+        self.workers = workers
+
+    def barrier(self):
+        pass
+
+    def gather(self,obj,root=0):
+        return [obj]
+
+    def bcast(self,obj,root=0):
+        return obj
+
+    def reduce(self,array,root=0):
+        return array.copy()
+
+    def abort(self,code=0):
+        sys.exit(code)
+
+    def map(self,func,W,*args):
+        """Calls func(*w,*args) for all items w of W, in the pool.
+
+        Yields
+        ------
+        w,result : the work item and the result of the function, in
+            the order in which they complete
+        """
+        if self.workers == 1:
+            for w in W: yield w,func(*(tuple(w)+args))
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = dict([(executor.submit(func,*(tuple(w)+args)),w) for w in W])
+            for future in as_completed(futures):
+                yield futures.pop(future),future.result()
+
+def GetBackend(name="mpi",workers=None):
+    """Returns the backend by name.
+
+    Parameters
+    ----------
+    name : str, optional
+        one of 'mpi' or 'processes'. If 'mpi' is requested but mpi4py
+        is not available, a process pool is used instead.
+    workers : int, optional
+        the number of processes of the process pool
+
+    Returns
+    -------
+    backend : MPIBackend or ProcessBackend
+        the backend
+    """
+    if name == "mpi":
+        if MPI is not None: return MPIBackend()
+        name = "processes"
+    if name == "processes": return ProcessBackend(workers)
+    raise ValueError("Unknown parallel backend: %s" % name)
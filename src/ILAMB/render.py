@@ -0,0 +1,249 @@
+"""Rendering of the maps of the analysis results.
+
+Creating a cartopy figure (projection, axes, land and ocean features)
+is the dominant cost of plotting a map, yet the same backgrounds recur
+for every model and plotted quantity on a given grid and region. The
+MapRenderer keeps the figures it creates and, when asked for a map on
+a grid and extents it has seen, only replaces the image data. The
+PNG encoding of the rendered figures may be handed to a pool of
+threads (the encoder releases the GIL) and figures whose inputs have not changed since they were
+last written may be skipped by recording their signatures in a
+FigureManifest.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import matplotlib.colors as colors
+import matplotlib.image as mpimg
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+from pylab import get_cmap
+from .Regions import Regions
+from . import ilamblib as il
+import numpy as np
+import matplotlib.pyplot as plt
+import hashlib,json,os
+
+def DataHash(var):
+    """Returns a hash of the data and grid of a variable.
+
+    Parameters
+    ----------
+    var : ILAMB.Variable.Variable
+        the variable
+
+    Returns
+    -------
+    hash : str
+        the hexadecimal digest of the data, mask and grid of the variable
+    """
+    return il._gridHash(var.data,var.lat,var.lon,var.lat_bnds,var.lon_bnds)+var.unit
+
+def FigureSignature(*inputs):
+    """Returns a signature of the inputs which determine a figure.
+
+    Parameters
+    ----------
+    inputs : JSON serializable objects
+        for example, the hash of the plotted data, the region and the
+        plot limits
+
+    Returns
+    -------
+    signature : str
+        the hexadecimal digest of the inputs
+    """
+    return hashlib.sha1(json.dumps(inputs,sort_keys=True,default=str).encode()).hexdigest()
+
+def RegionSignature(label):
+    """Returns a signature of the definition of a region."""
+    name,lat,lon,mask = Regions._regions[label]
+    return [label,il._gridHash(lat,lon,mask)]
+
+def _writePNG(filename,rgba,dpi):
+    mpimg.imsave(filename,rgba,dpi=dpi)
+
+class FigureManifest(object):
+    """Records the signatures of the figures written to a directory.
+
+    Parameters
+    ----------
+    filename : str
+        the full path of the JSON file in which the signatures are kept
+    """
+    def __init__(self,filename):
+        self.filename   = filename
+        self.signatures = {}
+        self.modified   = False
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    self.signatures = json.load(f)
+            except ValueError:
+                self.signatures = {}
+
+    def current(self,figname,signature):
+        """Checks if the figure exists and was written with the given signature.
+
+        Parameters
+        ----------
+        figname : str
+            the full path of the figure
+        signature : str
+            the signature of the inputs of the figure
+
+        Returns
+        -------
+        current : bool
+            True if the figure need not be rendered again
+        """
+        if not os.path.isfile(figname): return False
+        return self.signatures.get(os.path.basename(figname),None) == signature
+
+    def update(self,figname,signature):
+        """Records the signature with which the figure was written."""
+        self.signatures[os.path.basename(figname)] = signature
+        self.modified = True
+
+    def save(self):
+        """Writes the signatures, if any were updated."""
+        if not self.modified: return
+        tmp = "%s.%d" % (self.filename,os.getpid())
+        with open(tmp,'w') as f:
+            json.dump(self.signatures,f,indent=0,sort_keys=True)
+        os.replace(tmp,self.filename)
+        self.modified = False
+
+class MapRenderer(object):
+    """Renders maps of spatial variables, reusing figures between maps.
+
+    A figure is kept for each combination of projection, extents and
+    grid encountered, up to a maximum number of figures after which
+    the least recently used are closed. The figures are identical to
+    those which ILAMB.Variable.plot produces.
+
+    Parameters
+    ----------
+    workers : int, optional
+        the number of threads used to encode the PNG files. If 1, the
+        files are encoded as they are rendered.
+    size : int, optional
+        the maximum number of figures to keep
+    """
+    def __init__(self,workers=1,size=32):
+        self.workers  = workers
+        self.size     = size
+        self.canvases = OrderedDict()
+        self.pool     = None
+        self.pending  = []
+
+    def _canvas(self,var,proj,extents,aspect_ratio,cmap,vmin,vmax):
+        key = (type(proj).__name__,tuple(sorted(proj.proj4_params.items())),
+               tuple(np.round(extents,8)),
+               il._gridHash(var.lat,var.lon,var.lat_bnds,var.lon_bnds),var.ndata is None)
+        if key in self.canvases:
+            self.canvases.move_to_end(key)
+            return self.canvases[key]
+        w = 7.5; h = w*aspect_ratio
+        fig,ax = plt.subplots(figsize=(w,h),subplot_kw={'projection':proj})
+        before = list(ax.collections)
+        if var.ndata is None:
+            lat = np.hstack([var.lat_bnds[:,0],var.lat_bnds[-1,-1]])
+            lon = np.hstack([var.lon_bnds[:,0],var.lon_bnds[-1,-1]])
+            ax.pcolormesh(lon,lat,var.data,cmap=cmap,vmin=vmin,vmax=vmax,transform=ccrs.PlateCarree())
+        else:
+            ax.scatter(var.lon,var.lat,s=35,color='k',linewidths=0,transform=ccrs.PlateCarree())
+        artists = [c for c in ax.collections if c not in before]
+        ax.add_feature(cfeature.NaturalEarthFeature('physical','land','110m',
+                                                    edgecolor='face',
+                                                    facecolor='0.875'),zorder=-1)
+        ax.add_feature(cfeature.NaturalEarthFeature('physical','ocean','110m',
+                                                    edgecolor='face',
+                                                    facecolor='0.750'),zorder=-1)
+        ax.set_extent(extents,ccrs.PlateCarree())
+        self.canvases[key] = (fig,artists)
+        while len(self.canvases) > self.size:
+            plt.close(self.canvases.popitem(last=False)[1][0])
+        return self.canvases[key]
+
+    def render(self,var,filename,region="global",vmin=None,vmax=None,cmap="jet"):
+        """Renders the map of a spatial variable to a PNG file.
+
+        Parameters
+        ----------
+        var : ILAMB.Variable.Variable
+            the spatial (or site) variable to plot
+        filename : str
+            the full path of the PNG file
+        region : str, optional
+            the region on which to display the variable
+        vmin : float, optional
+            the minimum plotted value
+        vmax : float, optional
+            the maximum plotted value
+        cmap : str, optional
+            the name of the colormap
+        """
+        if vmin is None: vmin = var.data.min()
+        if vmax is None: vmax = var.data.max()
+        rem_mask  = np.copy(var.data.mask)
+        var.data.mask += Regions().getMask(region,var)
+        try:
+            proj,extents,aspect_ratio = var.mapProjection()
+            fig,artists = self._canvas(var,proj,extents,aspect_ratio,cmap,vmin,vmax)
+            if var.ndata is None:
+                for artist in artists:
+                    artist.set_cmap(cmap)
+                    artist.set_clim(vmin,vmax)
+                artists[0].set_array(var.data)
+            else:
+                artists[0].set_facecolor(get_cmap(cmap)(colors.Normalize(vmin,vmax)(var.data)))
+            fig.canvas.draw()
+            rgba = np.array(fig.canvas.buffer_rgba())
+        finally:
+            var.data.mask = rem_mask
+        self._encode(filename,rgba,fig.dpi)
+
+    def _encode(self,filename,rgba,dpi):
+        if self.workers == 1:
+            _writePNG(filename,rgba,dpi)
+            return
+        if self.pool is None: self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.pending.append(self.pool.submit(_writePNG,filename,rgba,dpi))
+
+    def flush(self):
+        """Waits for all PNG files to be written, raising any errors encountered."""
+        pending = self.pending
+        self.pending = []
+        for future in pending: future.result()
+
+    def close(self):
+        """Writes the pending PNG files and releases the figures and threads."""
+        try:
+            self.flush()
+        finally:
+            for fig,artists in self.canvases.values(): plt.close(fig)
+            self.canvases.clear()
+            if self.pool is not None: self.pool.shutdown()
+            self.pool = None
+
+_renderer = None
+
+def GetMapRenderer(workers=1):
+    """Returns the map renderer of this process, so that figures are reused between calls.
+
+    Parameters
+    ----------
+    workers : int, optional
+        the number of threads used to encode the PNG files
+
+    Returns
+    -------
+    renderer : MapRenderer
+        the renderer
+    """
+    global _renderer
+    if _renderer is None or _renderer.workers != workers:
+        if _renderer is not None: _renderer.close()
+        _renderer = MapRenderer(workers=workers)
+    return _renderer
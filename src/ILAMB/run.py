@@ -1,14 +1,20 @@
 from .ModelResult import ModelResult
-import os
-import pickle
-from mpi4py import MPI
+import os,time,json
+from .parallel import GetRank,GetBackend,MPIBackend
 import logging
 from . import ilamblib as il
+from .ilamblib import ResultsComplete
 from traceback import format_exc
 
-logger = logging.getLogger("%i" % MPI.COMM_WORLD.rank)
+logger = logging.getLogger("%i" % GetRank())
 
-def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model_year=[],log=True,models_path="./",comm=MPI.COMM_WORLD):
+def _backend(comm):
+    """Returns the parallel backend for a MPI communicator or backend (default if None)."""
+    if comm is None: return GetBackend()
+    if hasattr(comm,"barrier"): return comm
+    return MPIBackend(comm)
+
+def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model_year=[],log=True,models_path="./",comm=None):
     """Initializes a list of models
 
     Initializes a list of models where each model is the subdirectory
@@ -32,6 +38,7 @@ def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model
        a list of the model results, sorted alphabetically by name
 
     """
+    comm = _backend(comm)
     rank = comm.rank
     # initialize the models    
     M = []
@@ -41,16 +48,12 @@ def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model
     for subdir, dirs, files in os.walk(model_root):
         for mname in dirs:
             if len(models) > 0 and mname not in models: continue
-            pkl_file = os.path.join(models_path,"%s.pkl" % mname)
-            if os.path.isfile(pkl_file):
-                with open(pkl_file,'rb') as infile:
-                    m = pickle.load(infile)
-            else:
-                try:
-                    m = ModelResult(os.path.join(subdir,mname), modelname = mname, filter=filter, regex=regex, model_year = model_year)
-                except Exception as ex:
-                    if log: logger.debug("[%s]" % mname,format_exc())
-                    continue
+            try:
+                m = ModelResult(os.path.join(subdir,mname), modelname = mname, filter=filter, regex=regex, model_year = model_year,
+                                index_file = os.path.join(models_path,"%s_index.json" % mname))
+            except Exception as ex:
+                if log: logger.debug("[%s]" % mname,format_exc())
+                continue
             M.append(m)
             max_model_name_len = max(max_model_name_len,len(mname))
         break
@@ -62,14 +65,6 @@ def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model
         clr     = clrs.pop(0)
         m.color = clr
 
-    # save model objects as pickle files
-    comm.Barrier()
-    if rank == 0:
-        for m in M:
-            pkl_file = os.path.join(models_path,"%s.pkl" % m.name)
-            with open(pkl_file,'wb') as out:
-                pickle.dump(m,out,pickle.HIGHEST_PROTOCOL)
-        
     # optionally output models which were found
     if rank == 0 and verbose:
         for m in M:
@@ -77,12 +72,12 @@ def InitializeModels(model_root,models=[],verbose=False,filter="",regex="",model
 
     if len(M) == 0:
         if verbose and rank == 0: print("No model results found")
-        comm.Barrier()
-        comm.Abort(0)
+        comm.barrier()
+        comm.abort(0)
 
     return M
 
-def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",models_path="./",comm=MPI.COMM_WORLD):
+def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",models_path="./",comm=None):
     """Initializes a list of models
 
     Initializes a list of models where each model is the subdirectory
@@ -104,6 +99,7 @@ def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",model
        a list of the model results, sorted alphabetically by name
 
     """
+    comm = _backend(comm)
     rank = comm.rank
     # initialize the models
     M = []
@@ -126,16 +122,12 @@ def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",model
                 model_year = [float(line[2].strip()),float(line[3].strip())]
             max_model_name_len = max(max_model_name_len,len(mname))
             if (len(models) > 0 and mname not in models) or (mname is None): continue
-            pkl_file = os.path.join(models_path,"%s.pkl" % mname)
-            if os.path.isfile(pkl_file):
-                with open(pkl_file,'rb') as infile:
-                    m = pickle.load(infile)
-            else:
-                try:
-                    m = ModelResult(mdir, modelname = mname, filter=filter, regex=regex, model_year = model_year)
-                except Exception as ex:
-                    if log: logger.debug("[%s]" % mname,format_exc())
-                    continue
+            try:
+                m = ModelResult(mdir, modelname = mname, filter=filter, regex=regex, model_year = model_year,
+                                index_file = os.path.join(models_path,"%s_index.json" % mname))
+            except Exception as ex:
+                if log: logger.debug("[%s]" % mname,format_exc())
+                continue
             M.append(m)
 
     # assign unique colors
@@ -144,14 +136,6 @@ def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",model
         clr     = clrs.pop(0)
         m.color = clr
 
-    # save model objects as pickle files
-    comm.Barrier()
-    if rank == 0:
-        for m in M:
-            pkl_file = os.path.join(models_path,"%s.pkl" % m.name)
-            with open(pkl_file,'wb') as out:
-                pickle.dump(m,out,pickle.HIGHEST_PROTOCOL)
-                
     # optionally output models which were found
     if rank == 0 and verbose:
         for m in M:
@@ -159,7 +143,142 @@ def ParseModelSetup(model_setup,models=[],verbose=False,filter="",regex="",model
 
     if len(M) == 0:
         if verbose and rank == 0: print("No model results found")
-        comm.Barrier()
-        comm.Abort(0)
+        comm.barrier()
+        comm.abort(0)
 
     return M
+
+def _dependencyName(m,c):
+    return os.path.join(c.output_path,"%s_%s_deps.json" % (c.name,m.name))
+
+def PairCurrent(m,c):
+    """Checks if the results of a model-confrontation pair may be reused.
+
+    The results are current if the results file was completed and the
+    dependencies recorded when it was written (see SaveDependencies)
+    match the present dependencies of the pair (see
+    ILAMB.Confrontation.Confrontation.dependencies).
+
+    Parameters
+    ----------
+    m : ILAMB.ModelResult.ModelResult
+        the model
+    c : ILAMB.Confrontation.Confrontation
+        the confrontation
+
+    Returns
+    -------
+    current : bool
+        True if the pair need not be confronted again
+    """
+    if not ResultsComplete(os.path.join(c.output_path,"%s_%s.nc" % (c.name,m.name))): return False
+    try:
+        with open(_dependencyName(m,c)) as f:
+            deps = json.load(f)
+    except Exception:
+        return False
+    if deps == c.dependencies(m): return True
+    logger.info("[%s][%s] Dependencies have changed, the results will be recomputed" % (c.longname,m.name))
+    return False
+
+def SaveDependencies(m,c):
+    """Records the dependencies of the results of a model-confrontation pair.
+
+    Parameters
+    ----------
+    m : ILAMB.ModelResult.ModelResult
+        the model
+    c : ILAMB.Confrontation.Confrontation
+        the confrontation
+    """
+    fname = _dependencyName(m,c)
+    tmp   = "%s.%d" % (fname,os.getpid())
+    with open(tmp,'w') as f:
+        json.dump(c.dependencies(m),f,indent=0,sort_keys=True)
+    os.replace(tmp,fname)
+
+def ConfrontPair(m,c,master,clean=False):
+    """Performs the confrontation analysis of a model-confrontation pair.
+
+    This is the unit of work handed to a parallel backend (see
+    ILAMB.parallel), so exceptions are caught and returned rather than
+    raised.
+
+    Parameters
+    ----------
+    m : ILAMB.ModelResult.ModelResult
+        the model to analyze
+    c : ILAMB.Confrontation.Confrontation
+        the confrontation
+    master : bool
+        enable if this pair also writes the benchmark results. Other
+        pairs write them only if they are absent or incomplete (see
+        ILAMB.ilamblib.AtomicDataset), so that they are written as
+        long as any pair succeeds, but those of the master prevail.
+    clean : bool, optional
+        enable to perform the confrontation again, overwriting previous results
+
+    Returns
+    -------
+    status : str
+        one of 'cached', 'completed' or 'failed'
+    dt : float
+        the time in seconds of the analysis
+    error : str
+        the name of the exception raised, None if successful
+    trace : str
+        the traceback of the exception raised, None if successful
+    """
+    if clean is False and PairCurrent(m,c): return "cached",0.,None,None
+    c.benchmark_replace = master
+    c.master = master or not ResultsComplete(os.path.join(c.output_path,"%s_Benchmark.nc" % c.name))
+    t0 = time.time()
+    try:
+        c.confront(m)
+        SaveDependencies(m,c)
+    except Exception as ex:
+        return "failed",time.time()-t0,ex.__class__.__name__,format_exc()
+    return "completed",time.time()-t0,None,None
+
+def PostPair(m,c,master):
+    """Performs the post-processing of a model-confrontation pair.
+
+    Renders the plots of the model and computes its overall
+    score. This is the unit of work handed to a parallel backend (see
+    ILAMB.parallel), so exceptions are caught and returned rather than
+    raised. As the work may be done in another process, the page
+    layout of the confrontation, which gathers the figures rendered,
+    is returned if successful. The layout of the master pair also
+    holds the benchmark figures.
+
+    Parameters
+    ----------
+    m : ILAMB.ModelResult.ModelResult
+        the model to analyze
+    c : ILAMB.Confrontation.Confrontation
+        the confrontation, whose plot limits have been determined
+    master : bool
+        enable if this pair also renders the benchmark plots
+
+    Returns
+    -------
+    status : str
+        one of 'completed' or 'failed'
+    dt : float
+        the time in seconds of the post-processing
+    error : str
+        the name of the exception raised, None if successful
+    trace : str
+        the traceback of the exception raised, None if successful
+    layout : ILAMB.Post.HtmlLayout
+        the layout of the confrontation if successful, None otherwise
+    """
+    c.master = master
+    t0 = time.time()
+    try:
+        c.modelPlots(m)
+        c.sitePlots(m)
+        c.computeOverallScore(m)
+    except Exception as ex:
+        return "failed",time.time()-t0,ex.__class__.__name__,format_exc(),None
+    return "completed",time.time()-t0,None,None,c.layout
@@ -0,0 +1,125 @@
+"""Sharing of the observational datasets among the processes of a node.
+
+Each process of a study reads the observational dataset of every
+model-confrontation pair it is handed, so that on a node with many
+processes the same dataset is read and held in memory many times. A
+SharedVariable is instead read by the first process of the node which
+needs it and written to memory mapped files in a node-local
+directory (/dev/shm on Linux, which is what
+multiprocessing.shared_memory uses). The other processes map the same
+files, so that the data is held once per node. The data of a
+SharedVariable is read-only, Variable.convert copies it before
+converting units.
+
+"""
+from multiprocessing.util import Finalize
+from .Variable import Variable
+import numpy as np
+import hashlib,pickle,fcntl,shutil,tempfile,os
+
+# The datasets this process has written, the oldest are removed once
+# more than _shared_size are held and the rest when the process
+# exits. Processes which mapped them keep their data until they
+# release it.
+_created     = []
+_created_pid = None
+_shared_size = 4
+
+def _sharedDir():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm",os.W_OK): return "/dev/shm"
+    return tempfile.gettempdir()
+
+def _sharedKey(filename,variable_name,alternate_vars,t0,tf):
+    stat = os.stat(filename)
+    key  = repr((os.path.abspath(filename),stat.st_mtime_ns,stat.st_size,
+                 variable_name,list(alternate_vars),
+                 None if t0 is None else float(t0),
+                 None if tf is None else float(tf)))
+    return "ilamb-%d-%s" % (os.getuid(),hashlib.sha1(key.encode()).hexdigest())
+
+def _remove(prefix):
+    for suffix in [".pkl",".data.npy",".mask.npy",".bnds.npy",".lock"]:
+        try:
+            os.remove(prefix + suffix)
+        except OSError:
+            pass
+
+def _removeCreated():
+    while len(_created) > 0: _remove(_created.pop())
+
+def _track(prefix):
+    """Records a dataset this process has written, removing the oldest if needed."""
+    global _created_pid
+    if _created_pid != os.getpid():
+        # forked processes inherit neither the datasets nor the finalizers
+        del _created[:]
+        Finalize(None,_removeCreated,exitpriority=10)
+        _created_pid = os.getpid()
+    _created.append(prefix)
+    while len(_created) > _shared_size: _remove(_created.pop(0))
+
+def _write(prefix,var):
+    """Writes the arrays and then the remaining attributes of the variable."""
+    arrays = {".data.npy":np.ma.getdata(var.data),
+              ".mask.npy":None if np.ma.getmask(var.data) is np.ma.nomask else np.ma.getmaskarray(var.data),
+              ".bnds.npy":var.data_bnds}
+    for suffix,a in arrays.items():
+        if a is None: continue
+        tmp = "%s.%d%s" % (prefix,os.getpid(),suffix)
+        np.save(tmp,np.ascontiguousarray(a))
+        os.replace(tmp,prefix + suffix)
+    attrs = dict([(key,val) for key,val in var.__dict__.items() if key not in ["data","data_bnds"]])
+    attrs["shared"] = [suffix for suffix,a in arrays.items() if a is not None]
+    tmp = "%s.%d.pkl" % (prefix,os.getpid())
+    with open(tmp,"wb") as f: pickle.dump(attrs,f)
+    os.replace(tmp,prefix + ".pkl")
+
+def _map(prefix):
+    """Returns a variable whose arrays map the files of the prefix, None if they do not exist."""
+    try:
+        with open(prefix + ".pkl","rb") as f: attrs = pickle.load(f)
+        arrays = dict([(suffix,np.load(prefix + suffix,mmap_mode="r")) for suffix in attrs.pop("shared")])
+    except (OSError,EOFError,pickle.UnpicklingError):
+        return None
+    var = Variable.__new__(Variable)
+    var.__dict__.update(attrs)
+    mask = arrays.get(".mask.npy",np.ma.nomask)
+    var.data      = np.ma.masked_array(arrays[".data.npy"],mask=mask,copy=False)
+    var.data_bnds = arrays.get(".bnds.npy",None)
+    return var
+
+def SharedVariable(**keywords):
+    """Returns a variable read from a netCDF4 file whose data is shared by the processes of this node.
+
+    The keywords are those used to construct a Variable from a file
+    (filename, variable_name, alternate_vars, t0, tf). If the dataset
+    is already held by this node, the data is mapped rather than
+    read. Otherwise it is read and shared, unless the node-local
+    directory lacks the space in which case a private Variable is
+    returned.
+
+    Returns
+    -------
+    var : ILAMB.Variable.Variable
+        the variable, whose data and data_bnds are read-only
+    """
+    filename       = keywords.get("filename"      ,None)
+    variable_name  = keywords.get("variable_name" ,None)
+    alternate_vars = keywords.get("alternate_vars",[])
+    t0             = keywords.get("t0"            ,None)
+    tf             = keywords.get("tf"            ,None)
+    prefix = os.path.join(_sharedDir(),_sharedKey(filename,variable_name,alternate_vars,t0,tf))
+
+    # One process of the node reads the dataset while the others wait
+    with open(prefix + ".lock","w") as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        var = _map(prefix)
+        if var is not None: return var
+        var    = Variable(**keywords)
+        nbytes = var.data.nbytes*(1 + (np.ma.getmask(var.data) is not np.ma.nomask)/8.)
+        if var.data_bnds is not None: nbytes += var.data_bnds.nbytes
+        if shutil.disk_usage(_sharedDir()).free < 2*nbytes: return var
+        _write(prefix,var)
+        _track(prefix)
+    shared = _map(prefix)
+    return var if shared is None else shared
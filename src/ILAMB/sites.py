@@ -0,0 +1,149 @@
+"""Characterization of the series of many sites at once.
+
+Site confrontations (CO2 flask and tower networks for example) used
+to characterize each site in turn, fitting a trend, a spline or a
+spectrum per site in a Python loop. The functions here operate on the
+arrays of all the sites at once, the sites being along the last axis
+of the data.
+
+"""
+from scipy.interpolate import CubicSpline
+import numpy as np
+
+def QuadraticTrend(t,data):
+    """Returns the least squares quadratic trend of each site.
+
+    The trend of each site is fit to its unmasked values and then
+    evaluated at all times. All sites are fit by solving a batch of
+    3x3 normal equations, in a time variable scaled to [-1,1] to keep
+    them well conditioned. Sites with fewer than 3 values receive the
+    minimum norm fit.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        the times, of size data.shape[0]
+    data : numpy.ma.MaskedArray
+        the data of shape (time,...,sites)
+
+    Returns
+    -------
+    trend : numpy.ndarray
+        the trend evaluated at all times, of the shape of data
+    """
+    t = np.asarray(t,dtype=float)
+    s = (t-0.5*(t.max()+t.min()))/max(0.5*(t.max()-t.min()),1e-12)
+    A = np.asarray([s**2,s,np.ones(s.size)]).T
+    w = (np.ma.getmaskarray(data)==False).reshape((t.size,-1))
+    x = np.ma.getdata(data).reshape((t.size,-1))*w
+    G = np.einsum("ti,tj,ts->sij",A,A,w)
+    r = np.einsum("ti,ts->si",A,x)
+    p = np.einsum("sij,sj->si",np.linalg.pinv(G),r)
+    return np.dot(A,p.T).reshape(data.shape)
+
+def PhaseWellDefined(t,data,period=365.):
+    """Returns whether the phase of each site is well defined.
+
+    The phase of a site is considered well defined if:
+
+    * there is at least 2 years of contiguous data in the time series
+    * if the frequency corresponding to the peak in the power spectrum
+      of its longest contiguous segment is within the sampling
+      frequency of 1/period.
+
+    The segments of sites which share a length are transformed
+    together.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        the times, of size data.shape[0]
+    data : numpy.ma.MaskedArray
+        the data of shape (time,sites)
+    period : float, optional
+        the period of the cycle
+
+    Returns
+    -------
+    defined : numpy.ndarray
+        a boolean array of size sites
+    """
+    # the first longest run of unmasked values in each site
+    mask = np.ma.getmaskarray(data)
+    ind  = np.arange(t.size)[:,np.newaxis]
+    run  = ind-np.maximum.accumulate(np.where(mask,ind,-1),axis=0)
+    e    = run.argmax(axis=0)+1
+    n    = run.max(axis=0)
+    b    = e-n
+
+    defined = np.zeros(n.size,dtype=bool)
+    for size in np.unique(n[n>=24]):
+        sites = np.where(n==size)[0]
+        seg   = b[sites]+np.arange(size)[:,np.newaxis]
+        V     = np.ma.getdata(data)[seg,sites]
+        P     = np.abs(np.fft.rfft(V,axis=0))**2
+        if size % 2 == 0: P = P[:-1] # fft places the Nyquist frequency among the negative ones
+        dt    = (t[seg[-1]]-t[seg[0]])/(size-1)
+        dF    = 1./(size*dt)
+        f     = P.argmax(axis=0)*dF
+        f0    = 1./period
+        defined[sites] = (f > (f0-0.9*dF))*(f < (f0+0.9*dF))
+    return defined
+
+def CycleCharacteristics(t,cycles,period=365.):
+    """Compute the mean amplitude, cycle, and time of maximum and minimum of each site.
+
+    The mean cycle of all sites is interpolated by a single periodic
+    cubic spline, whose extrema are found among the roots of its
+    derivative, a quadratic on each interval.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        the times in the period of the steps of the cycle
+    cycles : numpy.ma.MaskedArray
+        the data reshaped into cycles, of shape (cycles,steps,sites)
+    period : float, optional
+        the period of the cycle
+
+    Returns
+    -------
+    amp : numpy.ndarray
+        the mean amplitude of the cycles of each site
+    tmax,tmin : numpy.ndarray
+        the time in the period of the maximum and minimum of the mean cycle of each site
+    fine : numpy.ndarray
+        the spline of the mean cycle sampled daily, of shape (period+1,sites)
+    """
+    with np.errstate(under='ignore'):
+        amp = (cycles.max(axis=1)-cycles.min(axis=1)).mean(axis=0)
+        cyc = np.ma.getdata(cycles.mean(axis=0))
+        fun = CubicSpline(np.hstack([t  ,t[0]+period]),
+                          np.vstack([cyc,cyc[:1]    ]),
+                          bc_type="periodic",axis=0)
+
+        # roots of the derivative a*x**2+b*x+c on each interval [0,h],
+        # the first and last polynomials are extrapolated as in
+        # PPoly.solve
+        h = np.diff(fun.x)[:,np.newaxis]
+        l = np.zeros(h.shape); l[0] = -np.inf
+        h[-1] = np.inf
+        a = 3*fun.c[0]; b = 2*fun.c[1]; c = fun.c[2]
+        with np.errstate(invalid='ignore',divide='ignore'):
+            disc = np.sqrt(b*b-4*a*c)
+            q    = -0.5*(b+np.where(b<0,-1,1)*disc)
+            r1   = np.where(a!=0,q/a,-c/b)
+            r2   = np.where(a!=0,c/q,np.nan)
+        x  = np.asarray([np.fmin(r1,r2),np.fmax(r1,r2)])
+        x  = np.where((x>=l)*(x<=h),x,np.nan)
+        v  = ((fun.c[0]*x+fun.c[1])*x+fun.c[2])*x+fun.c[3]
+        x  = x+fun.x[:-1,np.newaxis]
+        ok = (x>=0)*(x<=period)
+
+        # the extrema among the roots, in the order of the intervals
+        x,v,ok = [np.swapaxes(a,0,1).reshape((-1,)+cyc.shape[1:]) for a in [x,v,ok]]
+        i    = np.arange(x.shape[1])
+        tmax = x[np.where(ok,v,-np.inf).argmax(axis=0),i]
+        tmin = x[np.where(ok,v,+np.inf).argmin(axis=0),i]
+        fine = fun(np.linspace(0,period,int(period)+1))
+    return amp,tmax,tmin,fine
@@ -0,0 +1,94 @@
+"""Nearest neighbor lookups on grid axes and sets of sites.
+
+Matching a set of locations to a grid or to another set of sites by
+forming the (n_query, n_grid) matrix of distances allocates memory
+quadratic in the sizes, which is prohibitive for fine grids or large
+site networks. On the monotonic axes of a rectilinear grid, the
+nearest index is instead found by bisection. Scattered locations
+(sites or the cells of curvilinear grids) are placed in a KD-tree
+which is kept in the cache of regridding operators (see
+ILAMB.ilamblib._regridCached), so that the tree of a given set of
+sites is built once and reused by every query against it.
+
+"""
+from scipy.spatial import cKDTree
+import numpy as np
+
+def NearestAxisIndex(source,target):
+    """Returns the index of the source coordinate nearest each target coordinate.
+
+    On monotonic sources the neighbors of each target are located by
+    bisection, otherwise we fall back on the dense distance
+    matrix. Ties go to the lower index as with argmin.
+
+    Parameters
+    ----------
+    source : numpy.ndarray
+        a 1D array of coordinates
+    target : numpy.ndarray
+        an array of coordinates
+
+    Returns
+    -------
+    index : numpy.ndarray
+        an integer array of the shape of target
+    """
+    source = np.asarray(source)
+    target = np.asarray(target)
+    if source.size < 2: return np.zeros(target.shape,dtype=int)
+    d = np.diff(source)
+    if not (d >= 0).all():
+        if not (d <= 0).all(): return (np.abs(target[...,np.newaxis]-source)).argmin(axis=-1)
+        source = -source
+        target = -target
+    hi = np.searchsorted(source,target,side="left").clip(1,source.size-1)
+    lo = np.searchsorted(source,source[hi-1],side="left")
+    return np.where(np.abs(target-source[lo]) <= np.abs(target-source[hi]),lo,hi)
+
+def _points(lat,lon,haversine):
+    """Returns the coordinates in which the tree measures distance."""
+    lat = np.asarray(np.ma.getdata(lat),dtype=float).flatten()
+    lon = np.asarray(np.ma.getdata(lon),dtype=float).flatten()
+    if not haversine: return np.asarray([lat,lon]).T
+    lat = np.deg2rad(lat)
+    lon = np.deg2rad(lon)
+    return np.asarray([np.cos(lat)*np.cos(lon),np.cos(lat)*np.sin(lon),np.sin(lat)]).T
+
+def _siteTree(lat,lon,haversine):
+    """Returns the (cached) tree of the unique sites and the index of their first occurrence."""
+    from . import ilamblib as il
+    def _build():
+        points,first = np.unique(_points(lat,lon,haversine),axis=0,return_index=True)
+        return cKDTree(points),first
+    return il._regridCached(("sitetree",il._gridHash(lat,lon),haversine),_build)
+
+def NearestSites(site_lat,site_lon,lat,lon,haversine=False):
+    """For each location, returns the nearest site and the distance to it.
+
+    By default the distance is measured in the latitude-longitude
+    plane, as sqrt(dlat**2+dlon**2), which is how sites have
+    traditionally been matched in ILAMB. If haversine is set, the
+    great circle distance is used instead. Where several sites share
+    a location, the first is returned.
+
+    Parameters
+    ----------
+    site_lat,site_lon : numpy.ndarray
+        arrays of the same size with the locations of the sites in
+        degrees
+    lat,lon : numpy.ndarray
+        arrays of the same size with the locations to match in degrees
+    haversine : bool, optional
+        enable to measure the great circle distance
+
+    Returns
+    -------
+    index : numpy.ndarray
+        the index of the nearest site to each location
+    distance : numpy.ndarray
+        the distance to that site in degrees (of arc if haversine)
+    """
+    tree,first = _siteTree(site_lat,site_lon,haversine)
+    distance,index = tree.query(_points(lat,lon,haversine))
+    if haversine: distance = np.rad2deg(2*np.arcsin((0.5*distance).clip(0,1)))
+    return first[index],distance
@@ -0,0 +1,315 @@
+"""Staging of the data of model-confrontation pairs in slabs of time.
+
+A confrontation normally reads all the data of a pair into memory
+before analyzing it, which for long or high resolution datasets can
+exceed the memory of a node. The routines here estimate the memory a
+pair needs from the metadata of its files and, where it exceeds the
+budget of the pair (ilamb-run --mem_per_pair), stage the data in
+slabs of consecutive times instead. The analyses reduce each slab
+into accumulators which are merged across slabs (Climatology here,
+TimeMoments and DifferenceMoments in ILAMB.ilamblib), so that only a
+slab of the data is in memory at once.
+
+"""
+from .constants import mid_months,bnd_months
+from .Variable import Variable
+from netCDF4 import Dataset
+from sympy import sympify
+from . import ilamblib as il
+import numpy as np
+import os
+
+def PeekReference(filename,variable_name,alternate_vars=[],t0=None,tf=None):
+    """Returns the extent of a reference dataset without reading its data.
+
+    Parameters
+    ----------
+    filename : str
+        the netCDF4 file of the reference
+    variable_name : str
+        the name of the variable in the file
+    alternate_vars : list of str, optional
+        alternate names of the variable
+    t0,tf : float, optional
+        the times outside of which the reference is not used
+
+    Returns
+    -------
+    t0,tf : float
+        the beginning and end of the reference times, or of the
+        climatology bounds if a climatology
+    nt : int
+        the number of times
+    mem : float
+        the estimated memory of the data [Mb]
+    unit : str
+        the unit of the variable
+    climatology : bool
+        true if the dataset is a climatology
+    """
+    with Dataset(filename) as dset:
+        names = [name for name in [variable_name] + list(alternate_vars) if name in dset.variables]
+        if len(names) == 0:
+            raise RuntimeError("Unable to find [%s] in the file: %s" % (",".join([variable_name]+list(alternate_vars)),filename))
+        var = dset.variables[names[0]]
+        t,tb,cb,b,e,cal = il.GetTime(var,t0=t0,tf=tf)
+        if t is None: raise il.NotTemporalVariable()
+        mem  = var.size/var.shape[0]*t.size*8e-6
+        unit = var.units
+    if cb is not None:
+        cb = (cb-1850)*365.
+        return cb[0],cb[1],t.size,mem,unit,True
+    return tb[0,0],tb[-1,1],t.size,mem,unit,False
+
+# The data of a file in memory may be much larger than the file, as
+# it may be compressed and is promoted to double precision
+FILE_EXPANSION = 16.
+
+def _modelVariable(m,variable,alternate_vars,derived):
+    """Returns the first of the possible names of a variable found in the model."""
+    possible = [variable,] + list(alternate_vars)
+    if derived is not None: possible += [str(s) for s in sympify(derived).free_symbols]
+    vname = [v for v in possible if v in m.variables.keys()]
+    if len(vname) == 0: raise il.VarNotInModel()
+    return vname[0]
+
+def FileSize(source,m,variable,alternate_vars,derived):
+    """Returns the size of the files of a pair without opening them.
+
+    As it is cheap, the size may be used to skip peeking at the pairs
+    whose data is far under budget, that is, where the size times
+    FILE_EXPANSION fits.
+
+    Parameters
+    ----------
+    source : str
+        the full path of the observational dataset
+    m : ILAMB.ModelResult.ModelResult
+        the model result context
+    variable : str
+        the name of the variable
+    alternate_vars : list of str
+        alternate names of the variable
+    derived : str
+        an expression from which the variable may be derived, or None
+
+    Returns
+    -------
+    size : float
+        the total size of the observational dataset and of the model
+        files of the variable [Mb]
+    """
+    vname = _modelVariable(m,variable,alternate_vars,derived)
+    return sum([os.path.getsize(fname) for fname in [source,] + list(m.variables[vname])])*1e-6
+
+def PeekModel(m,variable,alternate_vars,derived,t0,tf):
+    """Returns the extent of a model variable in [t0,tf] without reading its data.
+
+    Any of the variables which could be part of the derived
+    expression is used to look at the times of the model.
+
+    Parameters
+    ----------
+    m : ILAMB.ModelResult.ModelResult
+        the model result context
+    variable : str
+        the name of the variable
+    alternate_vars : list of str
+        alternate names of the variable
+    derived : str
+        an expression from which the variable may be derived, or None
+    t0,tf : float
+        the times in which to look
+
+    Returns
+    -------
+    t0,tf : float
+        the beginning and end of the model times in [t0,tf]
+    nt : int
+        the number of times
+    mem : float
+        the estimated memory of the data [Mb]
+    info : str
+        a description of the files for the log
+    """
+    vname   = _modelVariable(m,variable,alternate_vars,derived)
+    info    = ""
+    mod_nt  =  0
+    mod_mem =  0.
+    mod_t0  =  2147483647
+    mod_tf  = -2147483648
+    for fname in m.variables[vname]:
+        with Dataset(fname) as dset:
+            var = dset.variables[vname]
+            mod_t,mod_tb,mod_cb,mod_b,mod_e,cal = il.GetTime(var,t0=t0-m.shift,tf=tf-m.shift)
+            if mod_t is None:
+                info += "\n      %s does not overlap the reference" % (fname)
+                continue
+            mod_t  += m.shift
+            mod_tb += m.shift
+            ind = np.where((mod_tb[:,0] >= t0)*(mod_tb[:,1] <= tf))[0]
+            if ind.size == 0:
+                info += "\n      %s does not overlap the reference" % (fname)
+                continue
+            mod_t  = mod_t [ind]
+            mod_tb = mod_tb[ind]
+            mod_t0 = min(mod_t0,mod_tb[ 0,0])
+            mod_tf = max(mod_tf,mod_tb[-1,1])
+            nt = mod_t.size
+            mod_nt += nt
+            mem = (var.size/var.shape[0]*nt)*8e-6
+            mod_mem += mem
+            info += "\n      %s spans years %.1f to %.1f, est memory in time bounds %d [Mb]" % (fname,mod_t.min()/365.+1850,mod_t.max()/365.+1850,mem)
+    info += "\n      total est memory = %d [Mb]" % mod_mem
+    if mod_t0 > mod_tf: raise il.VarNotInModel()
+    return mod_t0,mod_tf,mod_nt,mod_mem,info
+
+def SlabTimes(t0,tf,ns,align="month"):
+    """Returns the times which divide [t0,tf] into about ns slabs of equal length.
+
+    Parameters
+    ----------
+    t0,tf : float
+        the beginning and end of the times to divide
+    ns : int
+        the number of slabs
+    align : str, optional
+        either 'month' or 'year', the boundary to which the times
+        between slabs are moved. Aligned to years, every slab but the
+        first and last holds whole years.
+
+    Returns
+    -------
+    bounds : numpy.ndarray
+        the ns+1 (or fewer, if slabs collapse) increasing times
+    """
+    slab_t = (tf-t0)*np.linspace(0,1,ns+1)+t0
+    if align == "year":
+        slab_t[1:-1] = np.round(slab_t[1:-1]/365)*365
+        slab_t = np.unique(slab_t[(slab_t >= t0)*(slab_t <= tf)])
+    else:
+        slab_t = np.floor(slab_t / 365)*365 + bnd_months[(np.abs(bnd_months[:,np.newaxis] - (slab_t % 365))).argmin(axis=0)]
+    return slab_t
+
+def TimeWindow(var,t0,tf):
+    """Returns the times of the variable in [t0,tf).
+
+    Variables read for the interval [t0,tf] include the times whose
+    bounds overlap it, and so adjacent intervals share times. Keeping
+    the times themselves in [t0,tf) instead assigns each time to a
+    single slab.
+
+    Parameters
+    ----------
+    var : ILAMB.Variable.Variable
+        the temporal variable
+    t0,tf : float
+        the beginning and end of the window
+
+    Returns
+    -------
+    window : ILAMB.Variable.Variable
+        the variable restricted to the window
+    """
+    i0,i1 = np.searchsorted(var.time,[t0,tf])
+    if i0 == 0 and i1 == var.time.size: return var
+    return TimeSlice(var,i0,i1)
+
+def TimeSlice(var,i0,i1):
+    """Returns the times [i0,i1) of the variable.
+
+    Parameters
+    ----------
+    var : ILAMB.Variable.Variable
+        the temporal variable
+    i0,i1 : int
+        the indices of the first time and one past the last time
+
+    Returns
+    -------
+    slice : ILAMB.Variable.Variable
+        the variable restricted to these times
+    """
+    return Variable(data       = var.data[i0:i1],
+                    unit       = var.unit,
+                    name       = var.name,
+                    time       = var.time[i0:i1],
+                    time_bnds  = var.time_bnds[i0:i1],
+                    lat        = var.lat,
+                    lat_bnds   = var.lat_bnds,
+                    lon        = var.lon,
+                    lon_bnds   = var.lon_bnds,
+                    depth      = var.depth,
+                    depth_bnds = var.depth_bnds,
+                    area       = var.area,
+                    ndata      = var.ndata)
+
+class Slabs(object):
+    """The reference and comparison variables of a pair staged in slabs of time.
+
+    Iterating yields the (ref,com) pairs of each slab, in order of
+    time. Each iteration stages the slabs anew, except the first slab
+    which is kept as it is needed to setup the analysis.
+
+    Parameters
+    ----------
+    stage : function
+        stage(t0,tf) returns the (ref,com) variables of the times in
+        [t0,tf), see TimeWindow
+    bounds : numpy.ndarray
+        the times which divide the slabs, see SlabTimes
+    """
+    def __init__(self,stage,bounds):
+        self.stage  = stage
+        self.bounds = np.asarray(bounds)
+        self._first = None
+
+    def __len__(self):
+        return self.bounds.size-1
+
+    def first(self):
+        """Returns the (ref,com) variables of the first slab."""
+        if self._first is None: self._first = self.stage(self.bounds[0],self.bounds[1])
+        return self._first
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.first() if i == 0 else self.stage(self.bounds[i],self.bounds[i+1])
+
+class Climatology(object):
+    """Mergeable accumulator of a mean annual cycle.
+
+    Each time is assigned the month whose middle is nearest its time
+    of the year, the mean of the month is then taken over the
+    non-masked values.
+    """
+    def __init__(self):
+        self.total = None
+        self.count = None
+
+    def accumulate(self,time,data):
+        """Adds the data of shape (time,...) at the given times."""
+        month = (np.abs(mid_months[:,np.newaxis]-(time % 365))).argmin(axis=0)
+        if self.total is None:
+            self.total = np.zeros((12,)+data.shape[1:])
+            self.count = np.zeros((12,)+data.shape[1:],dtype=int)
+        with np.errstate(over='ignore',under='ignore'):
+            np.add.at(self.total,month,np.ma.filled(data,0))
+        np.add.at(self.count,month,np.ma.getmaskarray(data)==False)
+        return self
+
+    def merge(self,other):
+        """Merge the sums of an accumulator over a disjoint portion of time."""
+        if other.total is None: return self
+        if self.total is None:
+            self.total = np.copy(other.total)
+            self.count = np.copy(other.count)
+        else:
+            self.total += other.total
+            self.count += other.count
+        return self
+
+    def mean(self):
+        """The mean annual cycle, masked where a month has no data."""
+        with np.errstate(over='ignore',under='ignore',divide='ignore',invalid='ignore'):
+            return np.ma.masked_array(self.total/self.count.clip(1),mask=(self.count==0))
@@ -0,0 +1,69 @@
+"""Tests that the calendar arithmetic used to decode times matches cftime."""
+import ILAMB.ilamblib as il
+from netCDF4 import Dataset
+import cftime as cf
+import numpy as np
+
+CALENDARS = ["noleap","360_day","all_leap","julian","proleptic_gregorian","standard","gregorian"]
+
+def _fields(dates):
+    """The year, month, day and microseconds into the day of cftime dates."""
+    y  = np.asarray([d.year  for d in dates])
+    m  = np.asarray([d.month for d in dates])
+    d_ = np.asarray([d.day   for d in dates])
+    us = np.asarray([((d.hour*60+d.minute)*60+d.second)*1000000+d.microsecond for d in dates])
+    return y,m,d_,us
+
+def test_dayNumber():
+    # consecutive days, across the switch to the Gregorian calendar in 1582
+    days = np.arange(-4000,4000)
+    for calendar in CALENDARS:
+        cal = "standard" if calendar == "gregorian" else calendar
+        y,m,d,us = _fields(cf.num2date(days,"days since 1582-10-15",calendar=calendar))
+        n = il._dayNumber(y,m,d,cal)
+        assert (np.diff(n) == 1).all(),calendar
+        for a,b in zip(il._dayDate(n,cal),(y,m,d)): assert (a == b).all(),calendar
+
+def test_decodeTimes():
+    rs = np.random.RandomState(0)
+    for calendar in CALENDARS:
+        for units,scale in [("days since 1850-01-01"               ,1.),
+                            ("days since 1582-10-01 00:00:00"      ,1.),
+                            ("hours since 1900-01-01 06:00:00"     ,24.),
+                            ("seconds since 2000-01-01"            ,86400.),
+                            ("minutes since 1500-03-01 12:30:00"   ,1440.)]:
+            for times in [rs.uniform(-100*365,300*365,500)*scale,
+                          np.round(rs.uniform(0,300*365,500)*scale).astype(int)]:
+                dates = il.DecodeTimes(times,units,calendar)
+                assert dates is not None,(calendar,units)
+                for a,b in zip(dates,_fields(cf.num2date(times,units,calendar=calendar))):
+                    assert (a == b).all(),(calendar,units)
+
+def _timeVariable(units,times,bnds,calendar):
+    dset = Dataset("%s.nc" % units,mode="w",diskless=True)
+    dset.createDimension("time",times.size)
+    dset.createDimension("nb",2)
+    t = dset.createVariable("time","double",("time",))
+    t.units    = units
+    t.calendar = calendar
+    t.bounds   = "time_bnds"
+    t[...]     = times
+    dset.createVariable("time_bnds","double",("time","nb"))[...] = bnds
+    v = dset.createVariable("x","double",("time",))
+    v[...] = 0.
+    return dset,v
+
+def test_fallback():
+    # months and a datum in year 0 are left to cftime
+    months = np.arange(24.)
+    assert il.DecodeTimes(months,"months since 1850-01-01","360_day") is None
+    assert il.DecodeTimes(months*30,"days since 0000-01-01","360_day") is None
+    assert il._toNoleap(months,"months since 1850-01-01","360_day") is None
+
+    # which gives the same times as the integer arithmetic
+    bnds  = np.asarray([months,months+1]).T
+    fast  = _timeVariable("days since 1850-01-01",(months+0.5)*30,bnds*30,"360_day")
+    for units,scale,offset in [("months since 1850-01-01",1.,0.),("days since 0000-01-01",30.,1850*360.)]:
+        slow = _timeVariable(units,(months+0.5)*scale+offset,bnds*scale+offset,"360_day")
+        for a,b in zip(il.GetTime(fast[1]),il.GetTime(slow[1])):
+            assert np.allclose(a,b) if isinstance(a,np.ndarray) else a == b
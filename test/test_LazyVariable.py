@@ -0,0 +1,107 @@
+"""Tests that the streaming reductions of the LazyVariable match those of the Variable."""
+from ILAMB.Variable import Variable,LazyVariable
+from ILAMB.ModelResult import ModelResult
+from netCDF4 import Dataset
+import numpy as np
+import tempfile,os
+
+def _writeMonthly(filename,y0,ny,seed,nlat=9,nlon=18):
+    """Writes ny years of synthetic monthly data beginning in year y0."""
+    rs    = np.random.RandomState(seed)
+    nt    = 12*ny
+    dpm   = np.asarray([31,28,31,30,31,30,31,31,30,31,30,31],dtype=float)
+    edges = np.hstack([0,np.cumsum(np.tile(dpm,ny))]) + (y0-1850)*365.
+    tb    = np.asarray([edges[:-1],edges[1:]]).T
+    with Dataset(filename,mode="w") as dset:
+        dset.createDimension("time",None)
+        dset.createDimension("lat",nlat)
+        dset.createDimension("lon",nlon)
+        dset.createDimension("nb",2)
+        t = dset.createVariable("time","double",("time",))
+        t.units    = "days since 1850-01-01"
+        t.calendar = "noleap"
+        t.bounds   = "time_bnds"
+        t[...]     = tb.mean(axis=1)
+        dset.createVariable("time_bnds","double",("time","nb"))[...] = tb
+        lat = dset.createVariable("lat","double",("lat",))
+        lat.units = "degrees_north"
+        lat[...]  = np.linspace(-80,80,nlat)
+        lon = dset.createVariable("lon","double",("lon",))
+        lon.units = "degrees_east"
+        lon[...]  = np.linspace(-170,170,nlon)
+        v = dset.createVariable("gpp","double",("time","lat","lon"),fill_value=1e20)
+        v.units = "kg m-2 s-1"
+        data = np.ma.masked_array(rs.rand(nt,nlat,nlon)*1e-8,mask=(rs.rand(nt,nlat,nlon)<0.1))
+        data.mask[:,0,:] = True # a latitude without data
+        v[...] = data
+
+def _setup():
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root,"model"))
+    files = []
+    for i,y0 in enumerate([1980,1983,1986]):
+        files.append(os.path.join(root,"model","gpp_%d.nc" % y0))
+        _writeMonthly(files[-1],y0,3,i)
+    return root,files
+
+def _assertSame(a,b):
+    assert a.unit == b.unit
+    assert a.name == b.name
+    assert a.data.shape == b.data.shape
+    assert (np.ma.getmaskarray(a.data) == np.ma.getmaskarray(b.data)).all()
+    mask = np.ma.getmaskarray(a.data)
+    assert np.allclose(np.ma.getdata(a.data)[~mask],np.ma.getdata(b.data)[~mask],rtol=1e-12,atol=0)
+
+def test_reductions():
+    root,files = _setup()
+    lazy  = LazyVariable(filename=files,variable_name="gpp",mem_slab=0.05)
+    eager = lazy.load()
+    assert lazy.chunkSize() < lazy.time.size
+    assert eager.time.size == lazy.time.size == 108
+    t0 = eager.time_bnds[5,0]+10.
+    tf = eager.time_bnds[40,1]-3.
+    _assertSame(lazy.integrateInTime(),eager.integrateInTime())
+    _assertSame(lazy.integrateInTime(mean=True),eager.integrateInTime(mean=True))
+    _assertSame(lazy.integrateInTime(t0=t0,tf=tf,mean=True),eager.integrateInTime(t0=t0,tf=tf,mean=True))
+    _assertSame(lazy.integrateInSpace(),eager.integrateInSpace())
+    _assertSame(lazy.integrateInSpace(mean=True,intabs=True),eager.integrateInSpace(mean=True,intabs=True))
+    _assertSame(lazy.integrateInSpace(region="global",mean=True),eager.integrateInSpace(region="global",mean=True))
+    a = lazy .integrateInSpace(regions=["global"],mean=True)
+    b = eager.integrateInSpace(regions=["global"],mean=True)
+    _assertSame(a["global"],b["global"])
+    _assertSame(lazy.annualCycle(),eager.annualCycle())
+    _assertSame(lazy.rms(),eager.rms())
+
+    # the differences with another variable, lazy or not
+    other = Variable(data      = eager.data[::-1]*1.1,
+                     unit      = eager.unit,
+                     name      = eager.name,
+                     time      = eager.time,
+                     time_bnds = eager.time_bnds,
+                     lat       = eager.lat,
+                     lon       = eager.lon)
+    _assertSame(lazy.bias(other),eager.bias(other))
+    _assertSame(lazy.rmse(other),eager.rmse(other))
+    _assertSame(lazy.bias(lazy),eager.bias(eager))
+
+def test_window():
+    root,files = _setup()
+    t0 = (1982-1850)*365.+40.
+    tf = (1987-1850)*365.+100.
+    lazy  = LazyVariable(filename=files[::-1],variable_name="gpp",t0=t0,tf=tf,mem_slab=0.05)
+    eager = [Variable(filename=f,variable_name="gpp",t0=t0,tf=tf) for f in files]
+    assert np.allclose(lazy.time,np.hstack([v.time for v in eager]))
+    data  = lazy.load().data
+    assert (data == np.ma.concatenate([v.data for v in eager])).all()
+
+def test_model():
+    root,files = _setup()
+    m  = ModelResult(os.path.join(root,"model"),modelname="model")
+    t0 = (1981-1850)*365.
+    tf = (1988-1850)*365.
+    lazy  = m.extractTimeSeries("gpp",initial_time=t0,final_time=tf,mem_slab=0.05)
+    eager = m.extractTimeSeries("gpp",initial_time=t0,final_time=tf)
+    assert isinstance(lazy,LazyVariable)
+    assert isinstance(eager,Variable)
+    assert np.allclose(lazy.time,eager.time)
+    _assertSame(lazy.integrateInTime(mean=True),eager.integrateInTime(mean=True))
@@ -0,0 +1,131 @@
+"""Tests that the streaming mean state analysis matches the multi-pass computations on the full arrays."""
+from ILAMB.Variable import Variable
+import ILAMB.ilamblib as il
+from netCDF4 import Dataset
+import numpy as np
+
+REGIONS = ["global","bona","euro","aust","tena"]
+
+def _monthly(ny,nlat,nlon,seed):
+    """Returns ny years of synthetic monthly data on a global grid with random masks."""
+    rs    = np.random.RandomState(seed)
+    nt    = 12*ny
+    dpm   = np.asarray([31,28,31,30,31,30,31,31,30,31,30,31],dtype=float)
+    edges = np.hstack([0,np.cumsum(np.tile(dpm,ny))]) + 140*365.
+    tb    = np.asarray([edges[:-1],edges[1:]]).T
+    lat_bnds = np.linspace(-90,90,nlat+1)
+    lon_bnds = np.linspace(-180,180,nlon+1)
+    lat_bnds = np.asarray([lat_bnds[:-1],lat_bnds[1:]]).T
+    lon_bnds = np.asarray([lon_bnds[:-1],lon_bnds[1:]]).T
+    cycle = np.sin(2*np.pi*(tb.mean(axis=1)%365)/365.+rs.rand(nlat,nlon)[...,np.newaxis]).transpose(2,0,1)
+    data  = (2+cycle+0.5*rs.rand(nt,nlat,nlon))*1e-8
+    mask  = rs.rand(nt,nlat,nlon) < 0.1
+    mask[:,nlat//3,:nlon//4] = True # cells without data
+    return Variable(name = "gpp", unit = "kg m-2 s-1", data = np.ma.masked_array(data,mask=mask),
+                    time = tb.mean(axis=1), time_bnds = tb,
+                    lat  = lat_bnds.mean(axis=1), lat_bnds = lat_bnds,
+                    lon  = lon_bnds.mean(axis=1), lon_bnds = lon_bnds)
+
+def _multiPass(ref,com,mass_weighting=False):
+    """The maps and scalars of the mean state analysis computed as it was before streaming."""
+    lat,lon,lat_bnds,lon_bnds = il._composeGrids(ref,com)
+    REF = ref.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
+    COM = com.interpolate(lat=lat,lon=lon,lat_bnds=lat_bnds,lon_bnds=lon_bnds)
+    REF_timeint = REF.integrateInTime(mean=True)
+    COM_timeint = COM.integrateInTime(mean=True)
+    ref_and_com = (REF_timeint.data.mask == False) * (COM_timeint.data.mask == False)
+    REF.data.mask += ref_and_com[np.newaxis,...] == False
+    COM.data.mask += ref_and_com[np.newaxis,...] == False
+    REF_timeint.data.mask = (ref_and_com==False)
+    COM_timeint.data.mask = (ref_and_com==False)
+    normalizer = REF_timeint.data if mass_weighting else None
+    def _like(V,data):
+        return Variable(name = V.name, unit = V.unit, data = np.ma.masked_array(data,mask=V.data.mask),
+                        time = V.time, time_bnds = V.time_bnds,
+                        lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds, area = V.area)
+    out = {}
+    ref_cycle = REF.annualCycle()
+    com_cycle = COM.annualCycle()
+    out["phase_map_of_gpp"] = com_cycle.timeOfExtrema(etype="max")
+    shift_map = ref_cycle.timeOfExtrema(etype="max").phaseShift(out["phase_map_of_gpp"])
+    shift_score_map = il.ScoreSeasonalCycle(shift_map)
+    REF_iav = _like(REF,REF.data-il.ExtendAnnualCycle(REF.time,ref_cycle.data,ref_cycle.time)).rms()
+    out["iav_map_of_gpp"] = _like(COM,COM.data-il.ExtendAnnualCycle(COM.time,com_cycle.data,com_cycle.time)).rms()
+    out["iavscore_map_of_gpp"] = il.Score(Variable(name = "diff", unit = REF.unit,
+                                                   data = out["iav_map_of_gpp"].data-REF_iav.data,
+                                                   lat  = lat, lat_bnds = lat_bnds, lon = lon, lon_bnds = lon_bnds,
+                                                   area = REF.area),REF_iav)
+    out["bias_map_of_gpp"] = REF_timeint.bias(COM_timeint)
+    cREF = _like(REF,REF.data-REF_timeint.data[np.newaxis,...])
+    cCOM = _like(COM,COM.data-COM_timeint.data[np.newaxis,...])
+    REF_std = cREF.rms()
+    out["biasscore_map_of_gpp"] = il.Score(out["bias_map_of_gpp"],REF_std)
+    out["biasscore_map_of_gpp"].data.mask = (ref_and_com==False)
+    out["rmse_map_of_gpp"] = REF.rmse(COM)
+    out["rmsescore_map_of_gpp"] = il.Score(cREF.rmse(cCOM),REF_std)
+    for region in REGIONS:
+        out["Bias %s" % region] = out["bias_map_of_gpp"].integrateInSpace(region=region,mean=True)
+        out["RMSE %s" % region] = out["rmse_map_of_gpp"].integrateInSpace(region=region,mean=True)
+        out["Bias Score %s" % region] = out["biasscore_map_of_gpp"].integrateInSpace(region=region,mean=True,weight=normalizer)
+        out["RMSE Score %s" % region] = out["rmsescore_map_of_gpp"].integrateInSpace(region=region,mean=True,weight=normalizer)
+        out["Interannual Variability Score %s" % region] = out["iavscore_map_of_gpp"].integrateInSpace(region=region,mean=True,weight=normalizer)
+        out["Seasonal Cycle Score %s" % region] = shift_score_map.integrateInSpace(region=region,mean=True,weight=normalizer)
+        out["spaceint_of_gpp_over_%s" % region] = COM.integrateInSpace(region=region,mean=True)
+        out["cycle_of_gpp_over_%s" % region] = com_cycle.integrateInSpace(region=region,mean=True)
+    return out
+
+def _compare(mass_weighting):
+    ref = _monthly(4,18,36,1)
+    com = _monthly(4,24,48,2)
+    expected = _multiPass(ref,com,mass_weighting=mass_weighting)
+    ref = _monthly(4,18,36,1)
+    com = _monthly(4,24,48,2)
+    with Dataset("model.nc",mode="w",diskless=True) as dset, Dataset("benchmark.nc",mode="w",diskless=True) as bset:
+        il.AnalysisMeanStateSpace(ref,com,dataset=dset,benchmark_dataset=bset,regions=REGIONS,
+                                  mass_weighting=mass_weighting,mem_slab=0.05)
+        group   = dset.groups["MeanState"]
+        scalars = group.groups["scalars"]
+        for key,V in expected.items():
+            b = (group if key in group.variables else scalars).variables[key][...]
+            a = np.ma.masked_invalid(np.ma.asarray(V.data,dtype=float))
+            b = np.ma.masked_invalid(np.ma.asarray(b,dtype=float))
+            assert a.shape == b.shape,key
+            assert (np.ma.getmaskarray(a) == np.ma.getmaskarray(b)).all(),key
+            assert np.allclose(a.compressed(),b.compressed(),rtol=1e-9,atol=0),key
+
+def test_analysis():
+    _compare(False)
+
+def test_mass_weighting():
+    _compare(True)
+
+def test_moments():
+    V    = _monthly(3,9,18,3)
+    W    = _monthly(3,9,18,4)
+    mean = V.integrateInTime(mean=True).data
+    M    = il.TimeMoments(V.time,V.time_bnds,V.data.shape[1:],cycle=True)
+    D    = il.DifferenceMoments(V.time_bnds,V.data.shape[1:])
+    wmean = W.integrateInTime(mean=True).data
+
+    # accumulate over uneven chunks of time, in two parts to be merged
+    parts = [il.TimeMoments(V.time,V.time_bnds,V.data.shape[1:],cycle=True) for i in range(2)]
+    for i0,i1 in [(0,7),(7,20),(20,36)]:
+        parts[i0 >= 20].accumulate(i0,V.data[i0:i1])
+    M.merge(parts[0]).merge(parts[1])
+    assert np.allclose(M.mean(),mean,rtol=1e-12,atol=0)
+    assert (M.mean().mask == mean.mask).all()
+    cycle = V.annualCycle().data
+    assert (M.annualCycle().mask == cycle.mask).all()
+    assert np.allclose(M.annualCycle().compressed(),cycle.compressed(),rtol=1e-12,atol=0)
+
+    for i0,i1 in [(0,5),(5,36)]:
+        M.accumulateCentered(i0,V.data[i0:i1],mean.data,M.annualCycle().filled(0))
+        D.accumulate(i0,V.data[i0:i1],W.data[i0:i1],mean.data,wmean.data)
+    def _like(data):
+        return Variable(name = V.name, unit = V.unit, data = np.ma.masked_array(data,mask=V.data.mask),
+                        time = V.time, time_bnds = V.time_bnds, lat = V.lat, lon = V.lon)
+    std = _like(V.data-mean[np.newaxis,...]).rms().data
+    iav = _like(V.data-il.ExtendAnnualCycle(V.time,cycle,il.mid_months)).rms().data
+    for a,b in [(M.std(),std),(M.iav(),iav),(D.rmse(),V.rmse(W).data)]:
+        assert (np.ma.getmaskarray(a) == np.ma.getmaskarray(b)).all()
+        assert np.allclose(a.compressed(),b.compressed(),rtol=1e-9,atol=0)
@@ -0,0 +1,59 @@
+"""Tests that coarsening and accumulating in time match direct sums over the overlapping time steps."""
+from ILAMB.Variable import Variable
+from cf_units import Unit
+import numpy as np
+
+def _sites(seed,nt=50,ndata=4):
+    """Returns data at a few sites on irregular time steps, some masked, one site never and one always masked."""
+    rs    = np.random.RandomState(seed)
+    edges = 100. + np.hstack([0,np.cumsum(rs.rand(nt)*2+0.5)])
+    mask  = rs.rand(nt,ndata) < 0.2
+    mask[:, 0] = False
+    mask[:,-1] = True
+    return Variable(name = "x", unit = "kg m-2 s-1",
+                    data = np.ma.masked_array(rs.rand(nt,ndata),mask=mask),
+                    time = 0.5*(edges[:-1]+edges[1:]), time_bnds = np.asarray([edges[:-1],edges[1:]]).T,
+                    ndata = ndata, lat = np.zeros(ndata), lon = np.zeros(ndata))
+
+def _overlapMean(v,t0,tf):
+    """The overlap weighted mean of v over [t0,tf], None where no data overlaps."""
+    num = np.zeros(v.ndata); den = np.zeros(v.ndata)
+    for (b0,b1),x in zip(v.time_bnds,v.data):
+        dt = min(b1,tf)-max(b0,t0)
+        if dt <= 0: continue
+        num += dt*np.ma.filled(x,0); den += dt*(np.ma.getmaskarray(x)==False)
+    return [None if d == 0 else n/d for n,d in zip(num,den)]
+
+def _check(coarse,v,intervals):
+    assert coarse.data.shape == (len(intervals),v.ndata)
+    for i,(t0,tf) in enumerate(intervals):
+        for j,expected in enumerate(_overlapMean(v,t0,tf)):
+            if expected is None:
+                assert coarse.data.mask[i,j]
+            else:
+                assert not np.ma.getmaskarray(coarse.data)[i,j]
+                assert np.isclose(coarse.data[i,j],expected,rtol=1e-12,atol=0)
+
+def test_coarsen():
+    v  = _sites(0)
+    tb = v.time_bnds
+    intervals = np.asarray([[ tb[0,0]- 20.,tb[0,0]- 10.],  # before the data
+                            [ tb[0,0]-  5.,tb[3,1]-0.1 ],  # partially before the data
+                            [ tb[2,0]+0.3 ,tb[2,1]-0.2 ],  # within one step
+                            [ tb[4,1]     ,tb[9,1]     ],  # on step boundaries
+                            [ tb[10,0]+0.1,tb[30,1]-0.4],  # partial steps at both ends
+                            [ tb[-5,0]+0.2,tb[-1,1]+ 7.],  # partially after the data
+                            [ tb[-1,1]+ 1.,tb[-1,1]+ 9.]]) # after the data
+    _check(v.coarsenInTime(intervals),v,intervals)
+    _check(v.coarsenInTime(intervals,window=1.5),v,intervals+np.asarray([-1.5,1.5]))
+
+def test_accumulate():
+    v  = _sites(1)
+    dt = np.diff(v.time_bnds,axis=1)
+    a  = v.accumulateInTime()
+    assert Unit(a.unit) == Unit("kg m-2")
+    assert np.allclose(a.time,np.hstack([v.time_bnds[0,0],v.time_bnds[:,1]]))
+    expected = np.vstack([np.zeros(v.ndata),np.cumsum(np.ma.filled(v.data,0)*dt*86400.,axis=0)])
+    masked   = np.vstack([np.zeros(v.ndata,dtype=bool),np.logical_or.accumulate(np.ma.getmaskarray(v.data),axis=0)])
+    assert (np.ma.getmaskarray(a.data) == masked).all()
+    assert np.allclose(a.data.data[~masked],expected[~masked],rtol=1e-12,atol=0)